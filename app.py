@@ -1,12 +1,21 @@
 import os
-from datetime import datetime
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flasgger import Swagger
 from flask_sqlalchemy import SQLAlchemy
 from apscheduler.schedulers.background import BackgroundScheduler
-from core.extensions import db, scheduler
-from routes.posts import finalize_voting_phase
+from core.extensions import db, scheduler, worker_scheduler
+from core.schema import add_missing_columns, create_missing_indexes
+from core.migrations import migration_indexes, migrate_on_startup
+from core.search_index import init_search_backend
+from core.username_index import UsernameIndex, sync_username_index, sync_app_username_index
+from core.trending import trending, checkpoint_trending
+from core.badges import badge_queue
+from core.engagement import engagement_buffer
+from core.auth import token_cache
+from config import TRENDING_CHECKPOINT_MINUTES, TIMER_SWEEP_SECONDS, FLAG_SWEEP_SECONDS, USERNAME_INDEX_SYNC_SECONDS
+from core.jobs import init_scheduler, sweep_timers, catch_up_expired_posts
+from core.utils_flag import flag_sweep
 from models import Post
 
 if os.getenv("DATABASE_URL", "").startswith("postgresql://"):
@@ -57,15 +66,34 @@ def create_app(config=None):
     db.init_app(app)
 
     with app.app_context():
-        from models import User, Post, Comment, Vote, Flag, Like, Badge, Tag, post_tags
+        from models import User, Post, Comment, Vote, Badge, Tag, post_tags
         db.create_all()
-        expired_posts = Post.query.filter(
-            Post.voting_deadline <= datetime.utcnow(),
-            Post.started == False
-        ).all()
-        for post in expired_posts:
-            finalize_voting_phase(post.id)
-        scheduler.start()
+        add_missing_columns()
+        create_missing_indexes(skip=migration_indexes())
+        migrate_on_startup()
+        init_search_backend(app)
+        username_index = UsernameIndex(substring=app.config.get("USERNAME_SUBSTRING_INDEX", False))
+        sync_username_index(username_index)
+        app.extensions["username_index"] = username_index
+        trending.init_app(app)
+        badge_queue.init_app(app)
+        engagement_buffer.init_app(app)
+        token_cache.init_app(app)
+        init_scheduler(app)
+        # every worker checkpoints the trending scores it recorded itself
+        worker_scheduler.add_job(checkpoint_trending, 'interval', minutes=TRENDING_CHECKPOINT_MINUTES,
+                                 id='trending_checkpoint', replace_existing=True)
+        if not app.config.get("TESTING"):
+            # every worker also adds the users registered on the others to its username index
+            worker_scheduler.add_job(sync_app_username_index, 'interval', seconds=USERNAME_INDEX_SYNC_SECONDS,
+                                     id='username_index_sync', replace_existing=True)
+            scheduler.add_job(sweep_timers, 'interval', seconds=TIMER_SWEEP_SECONDS,
+                              id='timer_sweep', replace_existing=True)
+            scheduler.add_job(catch_up_expired_posts, id='catch_up_expired_posts', replace_existing=True)
+            # flag thresholds live in config.py: re-check every duel at startup too
+            scheduler.add_job(flag_sweep, 'interval', seconds=FLAG_SWEEP_SECONDS,
+                              id='flag_sweep', replace_existing=True)
+            scheduler.add_job(flag_sweep, id='flag_sweep_startup', replace_existing=True)
 
 
     from routes.auth import auth_bp
@@ -74,12 +102,16 @@ def create_app(config=None):
     from routes.search import search_bp
     from routes.search import search_bp
     from routes.tag import tag_bp
+    from routes.metrics import metrics_bp
+    from routes.moderation import moderation_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(posts_bp)
     app.register_blueprint(profile_bp)
     app.register_blueprint(search_bp)
     app.register_blueprint(tag_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(moderation_bp)
     app.config["UPLOAD_FOLDER"] = "static/avatars"
 
     @app.route("/")
@@ -8,12 +8,20 @@ MAX_INITIAL_VOTES     = 500   # maximum initial like capital
 FLAG_RATIO_THRESHOLD  = 0.60  # flag percentage threshold to trigger switch
 MIN_FLAGS_RATIO       = 0.05  # minimum flag count ratio relative to initial_votes to consider switch
 NET_SCORE_RATIO       = 0.40  # net-score threshold (40% of initial_votes)
+FLAG_SWEEP_SECONDS    = 60    # how often all active duels are checked for a switch
+AT_RISK_MARGIN        = 0.20  # thresholds loosened by this fraction for the at-risk list
 
 # ——————————————————————————————————————————————————
 # Badge thresholds
 INSIGHTFUL_THRESHOLD         = 20   # likes required for 'Insightful Speaker' badge
 SERIAL_VOTER_THRESHOLD       = 10   # votes required for 'Serial Voter' badge
 CONSISTENT_DEBATER_THRESHOLD = 10   # duels won for 'Consistent Debater' badge
+POPULAR_DEBATER_THRESHOLD    = 10   # votes received for 'Popular Debater' badge
+
+# ——————————————————————————————————————————————————
+# Badge queue (core.badges)
+BADGE_COALESCE_SECONDS       = 2    # requests for the same user within this window share one evaluation
+BADGE_OUTBOX_POLL_SECONDS    = 30   # how often leftover badge_outbox rows are picked up
 
 # ——————————————————————————————————————————————————
 # Scheduler delays (in hours)
@@ -21,6 +29,46 @@ DUEL_TIMEOUT_INITIAL_HOURS   = 2    # hours before duel timeout
 DUEL_TIMEOUT_POSTPONE_HOURS  = 6    # hours to postpone duel after first timeout
 DUEL_TIMEOUT_RETRY_HOURS     = 2    # hours before retrying duel after postpone
 
+# ——————————————————————————————————————————————————
+# Post timers (post_timers table)
+TIMER_SWEEP_SECONDS          = 5    # how often the sweeper looks for due timers
+TIMER_BATCH_SIZE             = 100  # timers claimed per sweeper round trip
+TIMER_LEASE_SECONDS          = 300  # a claimed timer is retried if not done by then
+
+# ——————————————————————————————————————————————————
+# Scheduler threads
+SCHEDULER_MAX_WORKERS        = 4    # job threads per scheduler and process
+
+# ——————————————————————————————————————————————————
+# Scheduler leader election (one worker runs the shared scheduler)
+LEADER_LEASE_SECONDS         = 30   # a silent leader is replaced after this
+LEADER_HEARTBEAT_SECONDS     = 10   # how often each worker renews or contends
+
+# ——————————————————————————————————————————————————
+# Maintenance scripts (core.maintenance)
+MAINTENANCE_BATCH_SIZE       = 1000  # rows per batch, each in its own transaction
+
+# ——————————————————————————————————————————————————
+# Write-behind likes/flags (core.engagement), off unless the app config sets
+# ENGAGEMENT_WRITE_BEHIND=True
+ENGAGEMENT_FLUSH_MS          = 200   # buffered reactions are written this often
+ENGAGEMENT_BUFFER_POSTS      = 1000  # started duels whose likers/flaggers stay in memory
+ENGAGEMENT_REVALIDATE_MS     = 1000  # cached duels are checked against the database this often
+
+# ——————————————————————————————————————————————————
+# Authentication cache (core.auth), one per worker process
+AUTH_CACHE_SIZE              = 10000  # tokens kept, least recently used evicted first
+AUTH_CACHE_TTL_SECONDS       = 60     # after /login, the old token may work this long in other workers
+
 # ——————————————————————————————————————————————————
 # Email settings
 DEBUG_EMAIL                  = True  # enable fake email printing for development/testing
+
+# ——————————————————————————————————————————————————
+# Username autocomplete (core.username_index), one index per worker process
+USERNAME_INDEX_SYNC_SECONDS  = 30    # users registered on other workers appear within this
+
+# ——————————————————————————————————————————————————
+# Trending tags
+TRENDING_CAPACITY            = 1000  # tags tracked per window (in memory and in tag_trends)
+TRENDING_CHECKPOINT_MINUTES  = 5     # how often in-memory scores are merged into the DB
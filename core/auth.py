@@ -0,0 +1,141 @@
+# core/auth.py
+# Bearer-token authentication shared by every blueprint
+#
+# login_required resolves the token to a Principal, a lightweight stand-in for
+# the user that only carries the username; routes that need the User row load
+# it by primary key. Resolved tokens are kept in token_cache, a bounded LRU
+# whose entries expire after AUTH_CACHE_TTL_SECONDS, so most authenticated
+# requests skip the users query. Unknown tokens are never cached.
+#
+# /login rotates User.token and drops the old token from this process's
+# cache. Each worker process has its own cache, so in the others the old
+# token keeps working until its entry expires: the TTL bounds that window.
+# A lookup that read the users table before /login rotated the token does not
+# cache the old token afterwards: put() is given the invalidation count taken
+# before the lookup and skips tokens invalidated since.
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import request, g
+from core.extensions import db
+from core.responses import error
+from models import User
+from config import AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS
+
+Principal = namedtuple("Principal", "username")
+
+
+class TokenCache:
+    def __init__(self, capacity=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()   # token -> (Principal, monotonic expiry), least recently used first
+        self._invalidated = OrderedDict()   # token -> invalidation count when dropped, oldest first
+        self._invalidations = 0
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.capacity = app.config.get("AUTH_CACHE_SIZE", AUTH_CACHE_SIZE)
+        self.ttl = app.config.get("AUTH_CACHE_TTL_SECONDS", AUTH_CACHE_TTL_SECONDS)
+        with self._lock:
+            self._entries.clear()
+            self._invalidated.clear()
+            self._reset_stats()
+
+    def _reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, token):
+        """The cached principal for `token`, or None (counted as a miss)."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def generation(self):
+        """The invalidation count, to pass to put() for a lookup starting now."""
+        with self._lock:
+            return self._invalidations
+
+    def put(self, token, principal, generation=None):
+        """Cache `principal`, unless `token` was invalidated after `generation`."""
+        if self.capacity <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._invalidated_since(token, generation):
+                return
+            self._entries[token] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _invalidated_since(self, token, generation):
+        # only the latest `capacity` invalidations are remembered: if more
+        # happened since `generation`, the token may have been one of them
+        if self._invalidations - generation > len(self._invalidated):
+            return True
+        return self._invalidated.get(token, -1) > generation
+
+    def invalidate(self, token):
+        if token:
+            with self._lock:
+                self._entries.pop(token, None)
+                self._invalidations += 1
+                self._invalidated[token] = self._invalidations
+                self._invalidated.move_to_end(token)
+                while len(self._invalidated) > max(self.capacity, 1):
+                    self._invalidated.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+token_cache = TokenCache()
+
+
+def authenticate(token):
+    """The Principal owning `token`, from the cache or the users table (None if unknown)."""
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+    generation = token_cache.generation()
+    username = db.session.query(User.username).filter_by(token=token).scalar()
+    if username is None:
+        return None
+    principal = Principal(username)
+    token_cache.put(token, principal, generation)
+    return principal
+
+
+def login_required(f):
+    """Require an `Authorization: Bearer <token>` header; sets g.current_user to its Principal."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        parts = request.headers.get("Authorization", "").split()
+        if len(parts) != 2 or parts[0] != "Bearer":
+            return error("authorization required", 401)
+        principal = authenticate(parts[1])
+        if principal is None:
+            return error("invalid token", 401)
+        g.current_user = principal
+        return f(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,199 @@
+# core/badges.py
+# Badge evaluation off the request path
+#
+# Write endpoints call request_badge_evaluation(users) inside their
+# transaction, which records each user in badge_outbox (one row per user,
+# holding the time of the latest request), and badge_queue.submit(users)
+# after committing. A worker thread waits BADGE_COALESCE_SECONDS after the
+# first request for a user, so a burst of votes costs one evaluation, then
+# awards every badge the user's stats qualify for and clears the outbox row.
+#
+# Nothing is lost if the process dies: outbox rows are picked up again every
+# BADGE_OUTBOX_POLL_SECONDS by whichever worker is running. With
+# BADGES_SYNC (the default under TESTING) submit() evaluates right away.
+
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from core.extensions import db
+from core.metrics import job_metrics
+from core.user_stats import get_user_stats, compute_user_stats
+from core.utils_sql import insert_ignore, upsert
+from models import Badge, BadgeOutbox
+from config import (
+    INSIGHTFUL_THRESHOLD,
+    SERIAL_VOTER_THRESHOLD,
+    CONSISTENT_DEBATER_THRESHOLD,
+    POPULAR_DEBATER_THRESHOLD,
+    BADGE_COALESCE_SECONDS,
+    BADGE_OUTBOX_POLL_SECONDS,
+)
+
+# badge name -> test on the user's UserStats row
+BADGE_RULES = {
+    "First Responder":    lambda s: s.votes_cast >= 1,
+    "Popular Debater":    lambda s: s.total_votes_received >= POPULAR_DEBATER_THRESHOLD,
+    "Insightful":         lambda s: s.max_votes_received_on_a_post >= INSIGHTFUL_THRESHOLD,
+    "Serial Voter":       lambda s: s.distinct_posts_voted >= SERIAL_VOTER_THRESHOLD,
+    "Consistent Debater": lambda s: s.duels_participated >= CONSISTENT_DEBATER_THRESHOLD,
+    "The Great Debater":  lambda s: s.wins >= 100,
+}
+
+
+def evaluate_user_badges(username):
+    """
+    Award every badge in BADGE_RULES the user qualifies for. Does not commit.
+
+    Returns:
+        list[str]: Names of the badges newly awarded.
+    """
+    stats = get_user_stats(username)
+    if stats is None:
+        return []
+    earned = [name for name, rule in BADGE_RULES.items() if rule(stats)]
+    if not earned:
+        return []
+    owned = {n for (n,) in db.session.query(Badge.name).filter(Badge.user == username, Badge.name.in_(earned))}
+    new = [name for name in earned if name not in owned]
+    insert_ignore(Badge, [{"user": username, "name": name} for name in new])
+    return new
+
+
+def recompute_badges(usernames):
+    """
+    Award the BADGE_RULES badges of many users at once, from stats computed
+    afresh from the raw tables (user_stats is not read). Badges already held
+    are kept, even if a threshold was raised. Does not commit.
+
+    Returns:
+        int: Number of badges newly awarded.
+    """
+    stats = compute_user_stats(list(usernames))
+    earned = {
+        (user, name)
+        for user, values in stats.items()
+        for name, rule in BADGE_RULES.items()
+        if rule(SimpleNamespace(**values))
+    }
+    if not earned:
+        return 0
+    owned = set(
+        db.session.query(Badge.user, Badge.name)
+        .filter(Badge.user.in_(stats), Badge.name.in_(BADGE_RULES))
+    )
+    new = earned - owned
+    insert_ignore(Badge, [{"user": user, "name": name} for user, name in sorted(new)])
+    return len(new)
+
+
+def request_badge_evaluation(usernames):
+    """Queue the users for badge evaluation in the current transaction."""
+    now = datetime.now()
+    # a request made while the user is being evaluated moves requested_at
+    # forward, so process() leaves the row queued for another evaluation
+    upsert(BadgeOutbox, [{"username": u, "requested_at": now} for u in dict.fromkeys(usernames) if u],
+           columns=["requested_at"])
+
+
+class BadgeQueue:
+    def __init__(self, coalesce_seconds=BADGE_COALESCE_SECONDS, poll_seconds=BADGE_OUTBOX_POLL_SECONDS):
+        self.coalesce_seconds = coalesce_seconds
+        self.poll_seconds = poll_seconds
+        self.app = None
+        self.sync = False
+        self._pending = {}   # username -> monotonic time of the first request
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.sync = app.config.get("BADGES_SYNC", app.config.get("TESTING", False))
+        if not self.sync and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="badge-queue", daemon=True)
+            self._thread.start()
+
+    def submit(self, usernames):
+        """Hand committed outbox entries to the worker (or evaluate them now in sync mode)."""
+        usernames = [u for u in dict.fromkeys(usernames) if u]
+        if self.sync:
+            self.process(usernames)
+            return
+        with self._cond:
+            now = time.monotonic()
+            for u in usernames:
+                self._pending.setdefault(u, now)
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def process(self, usernames):
+        """Evaluate the users' badges and clear their outbox rows, in one transaction."""
+        if not usernames:
+            return
+        started = time.perf_counter()
+        requested = dict(
+            db.session.query(BadgeOutbox.username, BadgeOutbox.requested_at)
+            .filter(BadgeOutbox.username.in_(usernames))
+        )
+        for username in usernames:
+            evaluate_user_badges(username)
+        for username, requested_at in requested.items():
+            # a request made meanwhile moved requested_at forward: the row stays queued
+            db.session.query(BadgeOutbox).filter_by(username=username, requested_at=requested_at).delete()
+        db.session.commit()
+        share = (time.perf_counter() - started) / len(usernames)
+        now = datetime.now()
+        for username in usernames:
+            lag = (now - requested[username]).total_seconds() if username in requested else None
+            job_metrics.record("badges", share, lag=lag)
+
+    def _take_due(self):
+        """Wait until some users have been pending for the coalescing window."""
+        with self._cond:
+            deadline = time.monotonic() + self.poll_seconds
+            while True:
+                now = time.monotonic()
+                due = [u for u, t in self._pending.items() if now - t >= self.coalesce_seconds]
+                if due:
+                    for u in due:
+                        del self._pending[u]
+                    return due
+                if now >= deadline:
+                    return []
+                oldest = min(self._pending.values(), default=None)
+                wait = deadline - now if oldest is None else self.coalesce_seconds - (now - oldest)
+                self._cond.wait(max(min(wait, deadline - now), 0.01))
+
+    def _poll_outbox(self):
+        """Queue outbox rows older than the coalescing window (lost or from a dead process)."""
+        with self.app.app_context():
+            cutoff = datetime.fromtimestamp(time.time() - self.coalesce_seconds)
+            rows = db.session.query(BadgeOutbox.username).filter(BadgeOutbox.requested_at <= cutoff).limit(1000)
+            users = [u for (u,) in rows]
+        with self._cond:
+            for u in users:
+                self._pending.setdefault(u, 0.0)
+
+    def _run(self):
+        while True:
+            try:
+                due = self._take_due()
+                if not due:
+                    self._poll_outbox()
+                    continue
+                with self.app.app_context():
+                    try:
+                        self.process(due)
+                    except Exception:
+                        db.session.rollback()
+                        raise
+            except Exception as exc:
+                job_metrics.record("badges", 0.0, failed=True)
+                print(f"[BADGES] evaluation failed, outbox rows kept for retry: {exc}")
+                time.sleep(1)
+
+
+badge_queue = BadgeQueue()
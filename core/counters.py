@@ -0,0 +1,68 @@
+# core/counters.py
+# Denormalized engagement counters stored on Post (likes, flags, votes)
+
+from sqlalchemy import func, select, or_
+from core.extensions import db
+from core.maintenance import ChunkedUpdate
+from models import Post, Reaction, Vote
+from config import MAINTENANCE_BATCH_SIZE
+
+COUNTER_COLUMNS = ("like_count", "flag_count", "vote_count")
+
+
+def bump_post_counters(post_id, **deltas):
+    """
+    Atomically add deltas to a post's counters inside the current transaction,
+    e.g. bump_post_counters(pid, like_count=1). The increment is done by the
+    database (SET n = n + delta), so concurrent requests never lose updates.
+    """
+    values = {}
+    for name, delta in deltas.items():
+        if name not in COUNTER_COLUMNS:
+            raise ValueError(f"Unknown counter '{name}'")
+        column = getattr(Post, name)
+        values[column] = column + delta
+    if values:
+        db.session.query(Post).filter(Post.id == post_id).update(values, synchronize_session=False)
+
+
+def _actual_counts():
+    """Correlated sub-selects that count the raw rows for each post."""
+    return {
+        "like_count": select(func.count(Reaction.id))
+                      .where(Reaction.post_id == Post.id, Reaction.kind == "like").scalar_subquery(),
+        "flag_count": select(func.count(Reaction.id))
+                      .where(Reaction.post_id == Post.id, Reaction.kind == "flag").scalar_subquery(),
+        "vote_count": select(func.count(Vote.id)).where(Vote.post_id == Post.id).scalar_subquery(),
+    }
+
+
+def reconcile_post_counters():
+    """
+    Recompute every post's counters from the reactions/votes tables.
+
+    Returns:
+        int: Number of posts whose stored counters had drifted.
+    """
+    actual = _actual_counts()
+    drifted = or_(*(getattr(Post, name) != actual[name] for name in COUNTER_COLUMNS))
+    fixed = (
+        db.session.query(Post)
+        .filter(drifted)
+        .update({getattr(Post, name): actual[name] for name in COUNTER_COLUMNS}, synchronize_session=False)
+    )
+    db.session.commit()
+    return fixed
+
+
+def reconcile_job(batch_size=MAINTENANCE_BATCH_SIZE, pause=0.0):
+    """reconcile_post_counters as a chunked, resumable ChunkedUpdate for large tables."""
+    actual = _actual_counts()
+    return ChunkedUpdate(
+        "reconcile_post_counters",
+        Post,
+        where=or_(*(getattr(Post, name) != actual[name] for name in COUNTER_COLUMNS)),
+        values={getattr(Post, name): actual[name] for name in COUNTER_COLUMNS},
+        batch_size=batch_size,
+        pause=pause,
+    )
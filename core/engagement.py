@@ -0,0 +1,341 @@
+# core/engagement.py
+# Write-behind buffer for likes and flags on started duels
+#
+# With ENGAGEMENT_WRITE_BEHIND enabled, /like and /flag on a started duel are
+# answered from memory: the post's likers and flaggers are loaded once per
+# process, a new reaction is checked against those sets, appended to a local
+# journal and acknowledged. A flusher thread writes the buffered reactions
+# and bumps the post counters every ENGAGEMENT_FLUSH_MS, in one
+# transaction per flush.
+#
+# The journal (JSON lines, one per reaction) makes it crash-safe: each flush
+# moves the journal aside and deletes it once committed, and at startup any
+# journal left behind by a dead process is replayed. Writes skip rows that
+# already exist, so a journal replayed after a commit it had in fact reached
+# adds nothing. Each process keeps its own journal, locked with flock while
+# the process lives (without fcntl, i.e. on Windows, run a single process).
+#
+# Flag-switch evaluation runs on the buffered counts; when a flag triggers a
+# switch the buffer is flushed and the switch happens on the database as usual.
+# Reactions buffered for a post that stops being a started duel before they are
+# flushed (switch, completion) are dropped, as they would have been rejected.
+# A duel switched or completed by another process is noticed by the flusher,
+# which checks every cached duel against the database each
+# ENGAGEMENT_REVALIDATE_MS and drops those whose roles changed.
+
+import os
+import glob
+import json
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select, tuple_
+from core.extensions import db
+from core.counters import bump_post_counters
+from core.utils_sql import insert_ignore
+from core.metrics import job_metrics
+from models import Post, Reaction
+from config import ENGAGEMENT_FLUSH_MS, ENGAGEMENT_BUFFER_POSTS, ENGAGEMENT_REVALIDATE_MS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+class _DuelState:
+    __slots__ = ("author", "winner", "second", "initial_votes", "likes", "flags", "likers", "flaggers")
+
+    def __init__(self, post, likers, flaggers):
+        self.author = post.author
+        self.winner = post.winner
+        self.second = post.second
+        self.initial_votes = post.initial_votes or 0
+        self.likes = post.like_count or 0
+        self.flags = post.flag_count or 0
+        self.likers = likers
+        self.flaggers = flaggers
+
+
+class EngagementBuffer:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.capacity = 0
+        self._states = OrderedDict()   # post_id -> _DuelState, least recently used first
+        self._pending = []             # (kind, post_id, user, monotonic time)
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._journal = None
+        self._journal_path = None
+        self._rotated = []             # (path, handle) of journals whose flush failed
+        self._thread = None
+
+    # ——— setup ———
+
+    def init_app(self, app):
+        """Replay journals left by dead processes, then start buffering if enabled."""
+        self.app = app
+        self.enabled = app.config.get("ENGAGEMENT_WRITE_BEHIND", False)
+        self.capacity = app.config.get("ENGAGEMENT_BUFFER_POSTS", ENGAGEMENT_BUFFER_POSTS)
+        self.interval = app.config.get("ENGAGEMENT_FLUSH_MS", ENGAGEMENT_FLUSH_MS) / 1000
+        self.revalidate_interval = app.config.get("ENGAGEMENT_REVALIDATE_MS", ENGAGEMENT_REVALIDATE_MS) / 1000
+        with self._lock:
+            self._states.clear()
+            self._pending = []
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+        self.journal_dir = app.config.get("ENGAGEMENT_JOURNAL_DIR", os.path.join(app.instance_path, "engagement"))
+        if os.path.isdir(self.journal_dir):
+            replay_orphaned_journals(self.journal_dir)
+        if not self.enabled:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._journal_path = os.path.join(self.journal_dir, f"journal-{os.getpid()}.jsonl")
+        self._open_journal()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="engagement-flush", daemon=True)
+            self._thread.start()
+
+    def _open_journal(self):
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+        if fcntl:
+            fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    # ——— request path ———
+
+    def _cached(self, post_id):
+        """The cached state of a duel, or None. Call with the lock held."""
+        state = self._states.get(post_id)
+        if state is not None:
+            self._states.move_to_end(post_id)
+        return state
+
+    @staticmethod
+    def _load(post_id):
+        """The state of a started, non-completed duel read from the database (None otherwise)."""
+        post = db.session.get(Post, post_id)
+        if not post or not post.started or post.completed or not post.winner:
+            return None
+        likers, flaggers = set(), set()
+        for kind, user in db.session.query(Reaction.kind, Reaction.user).filter(Reaction.post_id == post_id):
+            (likers if kind == "like" else flaggers).add(user)
+        return _DuelState(post, likers, flaggers)
+
+    def react(self, kind, post_id, user):
+        """
+        Buffer a like or flag on a started duel.
+
+        Returns:
+            str | None: None if the post is not a started duel (the caller
+            takes the regular path); otherwise "ok", "switch" (a flag that
+            crosses the switch thresholds), "own" (author or winner),
+            "duplicate" or "opposite" (already reacted the other way).
+        """
+        with self._lock:
+            state = self._cached(post_id)
+            if state is not None:
+                return self._add(state, kind, post_id, user)
+        # a post not cached yet is read without the lock, so the query does
+        # not hold up reactions on other posts; if another request cached it
+        # meanwhile, its state (which may hold newer reactions) wins
+        loaded = self._load(post_id)
+        if loaded is None:
+            return None
+        with self._lock:
+            state = self._cached(post_id)
+            if state is None:
+                state = self._states[post_id] = loaded
+            return self._add(state, kind, post_id, user)
+
+    def _add(self, state, kind, post_id, user):
+        """Check and buffer one reaction. Call with the lock held."""
+        from core.utils_flag import should_switch
+
+        same, other = (state.likers, state.flaggers) if kind == "like" else (state.flaggers, state.likers)
+        if user in same:
+            return "duplicate"
+        if user in (state.author, state.winner):
+            return "own"
+        if user in other:
+            return "opposite"
+        self._journal.write(json.dumps({"kind": kind, "post_id": post_id, "user": user}) + "\n")
+        self._journal.flush()
+        same.add(user)
+        self._pending.append((kind, post_id, user, time.monotonic()))
+        if kind == "like":
+            state.likes += 1
+            return "ok"
+        state.flags += 1
+        return "switch" if should_switch(state.second, state.initial_votes, state.likes, state.flags) else "ok"
+
+    def forget(self, post_id):
+        """Drop a post's cached state, e.g. after its roles changed."""
+        with self._lock:
+            self._states.pop(post_id, None)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    # ——— flushing ———
+
+    def flush(self):
+        """
+        Write the buffered reactions and clear the journal. Needs an app context.
+
+        Returns:
+            int: Reactions written.
+        """
+        if not self.enabled:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    return 0
+                # later reactions go to a fresh journal while this one is written;
+                # the old handle stays open, and locked, until it is deleted
+                flushing = f"{self._journal_path}.{time.time_ns()}.flushing"
+                os.replace(self._journal_path, flushing)
+                old_journal = self._journal
+                self._open_journal()
+            started = time.perf_counter()
+            try:
+                written = write_reactions([(kind, post_id, user) for kind, post_id, user, _ in batch])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # retried with the next flush; the rotated journal is kept (and
+                # locked) until then, and replayed at startup if we die first
+                with self._lock:
+                    self._pending[:0] = batch
+                    self._rotated.append((flushing, old_journal))
+                job_metrics.record("engagement_flush", time.perf_counter() - started, failed=True)
+                raise
+            for path, journal in self._rotated + [(flushing, old_journal)]:
+                os.remove(path)
+                journal.close()
+            self._rotated = []
+            job_metrics.record("engagement_flush", time.perf_counter() - started,
+                               lag=time.monotonic() - batch[0][3])
+            self._refresh({post_id for _, post_id, _, _ in batch})
+            return written
+
+    def revalidate(self):
+        """Check every cached duel against the database (see _refresh). Needs an app context."""
+        with self._lock:
+            post_ids = set(self._states)
+        if post_ids:
+            self._refresh(post_ids)
+
+    def _refresh(self, post_ids):
+        """Reload the posts' counters; forget posts that are no longer started duels or changed roles."""
+        rows = db.session.query(Post.id, Post.started, Post.completed, Post.winner, Post.second,
+                                Post.like_count, Post.flag_count).filter(Post.id.in_(post_ids)).all()
+        with self._lock:
+            pending = {post_id for _, post_id, _, _ in self._pending}
+            for post_id, started, completed, winner, second, likes, flags in rows:
+                state = self._states.get(post_id)
+                if state is None or post_id in pending:
+                    continue
+                if not started or completed or (winner, second) != (state.winner, state.second):
+                    del self._states[post_id]
+                else:
+                    state.likes, state.flags = likes, flags
+            while len(self._states) > self.capacity:
+                post_id = next(iter(self._states))
+                if post_id in pending:
+                    break
+                del self._states[post_id]
+
+    def _run(self):
+        checked = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as exc:
+                print(f"[ENGAGEMENT] flush failed, reactions kept in the journal: {exc}")
+            if time.monotonic() - checked < self.revalidate_interval:
+                continue
+            checked = time.monotonic()
+            try:
+                with self.app.app_context():
+                    self.revalidate()
+            except Exception as exc:
+                print(f"[ENGAGEMENT] revalidation failed: {exc}")
+
+
+def write_reactions(reactions):
+    """
+    Insert (kind, post_id, user) reactions and bump the post counters,
+    skipping users who already reacted to the post (either way) and posts
+    that are no longer started duels. Does not commit.
+
+    Returns:
+        int: Rows inserted.
+    """
+    post_ids = {post_id for _, post_id, _ in reactions}
+    live = {
+        post_id for (post_id,) in db.session.query(Post.id).filter(
+            Post.id.in_(post_ids), Post.started == True, Post.completed.isnot(True)
+        )
+    }
+    pairs = {(post_id, user) for _, post_id, user in reactions}
+    existing = set(db.session.execute(
+        select(Reaction.post_id, Reaction.user).where(tuple_(Reaction.post_id, Reaction.user).in_(pairs))
+    ).all())
+
+    rows = []
+    for kind, post_id, user in reactions:
+        if post_id not in live or (post_id, user) in existing:
+            continue
+        existing.add((post_id, user))
+        rows.append({"post_id": post_id, "user": user, "kind": kind})
+    # the counters follow the rows actually inserted: a reaction written by
+    # another process since the check above is skipped, and not counted
+    deltas = {}
+    for post_id, kind in insert_ignore(Reaction, rows, returning=("post_id", "kind")):
+        counters = deltas.setdefault(post_id, {"like_count": 0, "flag_count": 0})
+        counters[f"{kind}_count"] += 1
+    for post_id, counters in deltas.items():
+        bump_post_counters(post_id, **counters)
+    return sum(sum(c.values()) for c in deltas.values())
+
+
+def replay_orphaned_journals(journal_dir):
+    """
+    Write the reactions of every journal no live process holds, then delete
+    those journals. Needs an app context.
+
+    Returns:
+        int: Reactions written.
+    """
+    written = 0
+    for path in sorted(glob.glob(os.path.join(journal_dir, "journal-*"))):
+        with open(path, "a+", encoding="utf-8") as journal:
+            if fcntl:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue   # its process is alive
+            journal.seek(0)
+            reactions = []
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue   # torn last line of a crashed write
+                reactions.append((entry["kind"], entry["post_id"], entry["user"]))
+            if reactions:
+                written += write_reactions(reactions)
+                db.session.commit()
+        os.remove(path)
+    if written:
+        print(f"[ENGAGEMENT] replayed {written} reactions from the journal")
+    return written
+
+
+engagement_buffer = EngagementBuffer()
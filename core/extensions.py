@@ -2,4 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from apscheduler.schedulers.background import BackgroundScheduler
 
 db = SQLAlchemy()
+# cluster-wide jobs, run only by the elected leader (see core.leader)
 scheduler = BackgroundScheduler()
+# per-process jobs (leader heartbeat, trending checkpoint), run by every worker
+worker_scheduler = BackgroundScheduler()
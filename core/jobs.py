@@ -0,0 +1,284 @@
+# core/jobs.py
+# Post lifecycle timers and the scheduler that drives them
+#
+# Every pending timer is a row in post_timers: (post_id, action, next_action_at),
+# at most one per post and action. A single sweeper job claims due rows in
+# batches and runs the matching action, so the scheduler holds a constant
+# handful of jobs however many duels are pending.
+#
+# Claiming sets a lease (claimed_by / claimed_until) with one UPDATE whose
+# subquery uses FOR UPDATE SKIP LOCKED on Postgres, so concurrent sweepers
+# never pick the same rows; SQLite serializes writers and relies on the lease
+# alone. A timer whose action fails stays in place and is retried once the
+# lease runs out.
+#
+# The shared APScheduler jobs (sweeper, catch-up) live in the apscheduler_jobs
+# table (same database as the app unless SCHEDULER_JOBSTORE_URL says otherwise)
+# and run in the elected leader only. Missed runs coalesce into one and are
+# never dropped. Both schedulers run jobs through AppContextExecutor, so job
+# functions can use db.session like a request handler does.
+
+import atexit
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from apscheduler.events import EVENT_JOB_ERROR
+from apscheduler.executors.base import BaseExecutor, run_job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from sqlalchemy import select, update, or_
+from core.extensions import db, scheduler, worker_scheduler
+from core.leader import election
+from core.metrics import job_metrics
+from core.utils_sql import insert_ignore
+from models import Post, PostTimer
+from config import TIMER_BATCH_SIZE, TIMER_LEASE_SECONDS, LEADER_HEARTBEAT_SECONDS, SCHEDULER_MAX_WORKERS
+
+JOBSTORE_TABLE = "apscheduler_jobs"
+JOB_DEFAULTS = {
+    "coalesce": True,            # a backlog of missed runs collapses into one
+    "misfire_grace_time": None,  # run late jobs however late they are
+    "max_instances": 1,
+}
+
+
+
+class AppContextExecutor(BaseExecutor):
+    """
+    Thread pool executor that runs every job inside its own app context, so
+    each job gets a fresh db.session that is removed when it finishes, and
+    records the job's latency, lag and failures in job_metrics.
+
+    Built on the executor extension API of APScheduler 3 (BaseExecutor with
+    _do_submit_job, run_job and the _run_job_* reporting hooks), with a pool
+    of its own; requirements.txt keeps APScheduler below 4, which replaced it.
+    """
+
+    def __init__(self, app, max_workers=SCHEDULER_MAX_WORKERS):
+        super().__init__()
+        self.app = app
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="scheduler")
+
+    def _do_submit_job(self, job, run_times):
+        def callback(f):
+            exc = f.exception()
+            if exc:
+                self._run_job_error(job.id, exc, exc.__traceback__)
+            else:
+                self._run_job_success(job.id, f.result())
+
+        self.pool.submit(self._run_in_context, job, run_times).add_done_callback(callback)
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait)
+
+    def _run_in_context(self, job, run_times):
+        # run_times are the scheduled times; lag includes time spent queued in the pool
+        lag = (datetime.now(timezone.utc) - run_times[0]).total_seconds()
+        started = time.perf_counter()
+        events = []
+        try:
+            with self.app.app_context():
+                try:
+                    events = run_job(job, job._jobstore_alias, run_times, self._logger.name)
+                finally:
+                    db.session.remove()
+        finally:
+            failed = not events or any(e.code == EVENT_JOB_ERROR for e in events)
+            job_metrics.record(job.id, time.perf_counter() - started, lag=lag, failed=failed)
+        return events
+
+
+def init_scheduler(app):
+    """
+    Configure the job stores and executors and start both schedulers once per
+    process. The shared scheduler starts paused and only the elected leader
+    resumes it; under TESTING its jobs stay in memory and it runs right away.
+    """
+    max_workers = app.config.get("SCHEDULER_MAX_WORKERS", SCHEDULER_MAX_WORKERS)
+    if not worker_scheduler.running:
+        worker_scheduler.configure(executors={"default": AppContextExecutor(app, max_workers)},
+                                   job_defaults=JOB_DEFAULTS)
+        worker_scheduler.start()
+    if scheduler.running:
+        return
+    executors = {"default": AppContextExecutor(app, max_workers)}
+    if app.config.get("TESTING"):
+        scheduler.configure(jobstores={"default": MemoryJobStore()}, executors=executors,
+                            job_defaults=JOB_DEFAULTS)
+        scheduler.start()
+        return
+    if app.config.get("SCHEDULER_JOBSTORE_URL"):
+        store = SQLAlchemyJobStore(url=app.config["SCHEDULER_JOBSTORE_URL"], tablename=JOBSTORE_TABLE)
+    else:
+        store = SQLAlchemyJobStore(engine=db.engine, tablename=JOBSTORE_TABLE)
+    scheduler.configure(jobstores={"default": store}, executors=executors, job_defaults=JOB_DEFAULTS)
+    scheduler.start(paused=True)
+    election.app = app
+    worker_scheduler.add_job(election.heartbeat, "interval", seconds=LEADER_HEARTBEAT_SECONDS,
+                             next_run_time=datetime.now(), id="leader_heartbeat", replace_existing=True)
+    atexit.register(election.shutdown)
+
+
+def timer_actions():
+    """
+    {action name: callable(post_id)} for everything a timer may run. Actions
+    do not commit: the sweep commits each one with its timer's deletion.
+    """
+    from routes.posts import finalize_voting_phase, start_duel_officially
+    from core.utils import handle_duel_timeout
+    return {f.__name__: f for f in (finalize_voting_phase, start_duel_officially, handle_duel_timeout)}
+
+
+def batch_timer_actions():
+    """{action name: callable(post_ids)} for actions that can run many timers at once."""
+    from core.voting import finalize_voting_phases
+    return {"finalize_voting_phase": finalize_voting_phases}
+
+
+def schedule_post_job(func, post_id, run_date):
+    """
+    Run func(post_id) at run_date. There is at most one pending timer per
+    (function, post): scheduling again moves the existing one. The row is
+    written in the current transaction; the caller commits.
+    """
+    timer = PostTimer.query.filter_by(post_id=post_id, action=func.__name__).first()
+    if timer is None:
+        timer = PostTimer(post_id=post_id, action=func.__name__)
+        db.session.add(timer)
+    timer.next_action_at = run_date
+    timer.claimed_by = None
+    timer.claimed_until = None
+    return timer
+
+
+def claim_due_timers(now, batch=TIMER_BATCH_SIZE):
+    """
+    Lease up to `batch` due, unclaimed timers and commit the lease.
+
+    Returns:
+        tuple[str, list[tuple]]: The lease token and (id, post_id, action, next_action_at) rows.
+    """
+    token = uuid.uuid4().hex
+    due = (
+        select(PostTimer.id)
+        .where(
+            PostTimer.next_action_at <= now,
+            or_(PostTimer.claimed_until.is_(None), PostTimer.claimed_until < now),
+        )
+        .order_by(PostTimer.next_action_at)
+        .limit(batch)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.session.execute(
+        update(PostTimer)
+        .where(PostTimer.id.in_(due.scalar_subquery()))
+        .values(claimed_by=token, claimed_until=now + timedelta(seconds=TIMER_LEASE_SECONDS))
+        .returning(PostTimer.id, PostTimer.post_id, PostTimer.action, PostTimer.next_action_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return token, rows
+
+
+def _run_timer(token, actions, timer_id, post_id, action):
+    """Run one claimed timer in its own transaction. Returns True on success."""
+    try:
+        # actions never commit, so the deletion and the action's work commit
+        # together below, or not at all; an action that reschedules itself
+        # simply writes a new row
+        db.session.query(PostTimer).filter_by(id=timer_id, claimed_by=token).delete(synchronize_session="fetch")
+        if action in actions:
+            actions[action](post_id)
+        else:
+            print(f"[TIMER] unknown action '{action}' for post {post_id}, dropped")
+        db.session.commit()
+        return True
+    except Exception as exc:
+        db.session.rollback()
+        print(f"[TIMER] {action}({post_id}) failed, retrying after the lease: {exc}")
+        return False
+
+
+def _run_timer_batch(token, batch_action, timers):
+    """
+    Run claimed timers of one batchable action in a single transaction.
+    Returns False (with nothing applied) if the batch failed.
+    """
+    try:
+        db.session.query(PostTimer).filter(
+            PostTimer.id.in_([t[0] for t in timers]), PostTimer.claimed_by == token
+        ).delete(synchronize_session="fetch")
+        batch_action([t[1] for t in timers])
+        db.session.commit()
+        return True
+    except Exception as exc:
+        db.session.rollback()
+        print(f"[TIMER] batch of {len(timers)} failed, running them one by one: {exc}")
+        return False
+
+
+def sweep_timers(now=None, batch=TIMER_BATCH_SIZE):
+    """
+    Run every timer due at `now` (default: the current time), one batch at a
+    time. A timer is deleted in the same transaction as its action's work;
+    actions listed in batch_timer_actions() run once per batch for all their
+    posts.
+
+    Returns:
+        int: Number of timers run.
+    """
+    actions = timer_actions()
+    batch_actions = batch_timer_actions()
+    done = 0
+    while True:
+        token, rows = claim_due_timers(now or datetime.now(), batch)
+        single = []
+        grouped = {}
+        for row in rows:
+            if row[2] in batch_actions:
+                grouped.setdefault(row[2], []).append(row)
+            else:
+                single.append(row)
+
+        for action, timers in grouped.items():
+            started = time.perf_counter()
+            if _run_timer_batch(token, batch_actions[action], timers):
+                share = (time.perf_counter() - started) / len(timers)
+                for _, _, _, due_at in timers:
+                    job_metrics.record(f"timer:{action}", share, lag=(datetime.now() - due_at).total_seconds())
+                done += len(timers)
+            else:
+                single.extend(timers)
+
+        for timer_id, post_id, action, due_at in single:
+            lag = (datetime.now() - due_at).total_seconds()
+            started = time.perf_counter()
+            ok = _run_timer(token, actions, timer_id, post_id, action)
+            job_metrics.record(f"timer:{action}", time.perf_counter() - started, lag=lag, failed=not ok)
+            done += ok
+        if len(rows) < batch:
+            return done
+
+
+def catch_up_expired_posts(batch=1000):
+    """
+    Give every unfinalized post whose voting deadline has passed a due
+    finalize timer, e.g. posts created before timers were persisted.
+    Timers that already exist are left alone; the sweeper does the rest.
+    """
+    now = datetime.now()
+    expired = (
+        db.session.query(Post.id)
+        .filter(Post.started == False, Post.voting_deadline <= now)
+        .yield_per(batch)
+    )
+    rows = []
+    for (post_id,) in expired:
+        rows.append({"post_id": post_id, "action": "finalize_voting_phase", "next_action_at": now})
+        if len(rows) >= batch:
+            insert_ignore(PostTimer, rows)
+            rows = []
+    insert_ignore(PostTimer, rows)
+    db.session.commit()
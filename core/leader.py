@@ -0,0 +1,93 @@
+# core/leader.py
+# Elect one process to run the shared scheduler, using a lease row in the DB
+#
+# Every worker starts the shared scheduler paused and renews (or tries to take)
+# the 'scheduler' lease every LEADER_HEARTBEAT_SECONDS from its own
+# worker_scheduler. The holder resumes the shared scheduler; everybody else
+# keeps it paused. If the leader dies its lease expires after
+# LEADER_LEASE_SECONDS and the next heartbeat elsewhere takes over. A clean
+# shutdown releases the lease at once.
+#
+# Taking the lease is a single conditional UPDATE, so two workers can never
+# both hold it. A leader that cannot reach the DB pauses itself before its
+# lease can run out.
+
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from core.extensions import db, scheduler
+from core.utils_sql import insert_ignore
+from models import SchedulerLease
+from config import LEADER_LEASE_SECONDS
+
+
+class LeaderElection:
+    def __init__(self, name="scheduler", lease_seconds=LEADER_LEASE_SECONDS):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.app = None
+
+    def try_acquire(self, now=None):
+        """Take or renew the lease. Returns True if this process holds it."""
+        now = now or datetime.now()
+        insert_ignore(SchedulerLease, [{"name": self.name, "holder": None, "expires_at": now}])
+        result = db.session.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == self.name,
+                or_(
+                    SchedulerLease.holder == self.holder,
+                    SchedulerLease.holder.is_(None),
+                    SchedulerLease.expires_at < now,
+                ),
+            )
+            .values(holder=self.holder, expires_at=now + timedelta(seconds=self.lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def release(self):
+        """Give the lease up if this process holds it."""
+        db.session.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+            .values(holder=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        self._set_leader(False)
+
+    def heartbeat(self):
+        """Renew or contend for the lease and pause/resume the scheduler to match."""
+        try:
+            leader = self.try_acquire()
+        except Exception as exc:
+            db.session.rollback()
+            print(f"[LEADER] lease check failed, pausing the scheduler: {exc}")
+            leader = False
+        self._set_leader(leader)
+
+    def shutdown(self):
+        if self.app is None:
+            return
+        with self.app.app_context():
+            self.release()
+
+    def _set_leader(self, leader):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            print(f"[LEADER] {self.holder} now runs the scheduler")
+            scheduler.resume()
+        else:
+            print(f"[LEADER] {self.holder} stepped down")
+            scheduler.pause()
+
+
+election = LeaderElection()
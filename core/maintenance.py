@@ -0,0 +1,114 @@
+# core/maintenance.py
+# Chunked, resumable bulk UPDATEs for maintenance scripts
+#
+# A ChunkedUpdate walks the table in primary-key order, one keyset page of
+# `batch_size` keys at a time, and applies `values` to the rows of each page
+# that match `where`, in its own short transaction, so no lock is held for
+# longer than one batch. Pages are cut on the key alone: `where` is only
+# evaluated inside a page, so a costly filter (e.g. correlated counts) costs
+# at most batch_size evaluations per batch however few rows it matches.
+# After each batch the last key is saved in maintenance_checkpoints in the
+# same transaction: a run that is interrupted resumes after the last
+# committed batch. A dry run reads the same pages and counts the rows
+# without writing anything.
+
+import time
+from datetime import datetime
+from sqlalchemy import select, update, func
+from core.extensions import db
+from models import MaintenanceCheckpoint
+from config import MAINTENANCE_BATCH_SIZE
+
+
+class ChunkedUpdate:
+    """
+    Args:
+        name: Checkpoint name; one checkpoint per name.
+        model: Mapped class to update.
+        where: Filter selecting the rows to change, applied by the UPDATE of
+            each key range.
+        values: {column: value or SQL expression} to SET.
+        batch_size: Keys scanned per batch/transaction.
+        pause: Seconds to sleep between batches, to leave room for live traffic.
+    """
+
+    def __init__(self, name, model, where, values, batch_size=MAINTENANCE_BATCH_SIZE, pause=0.0):
+        self.name = name
+        self.model = model
+        self.key = model.__mapper__.primary_key[0]
+        self.where = where
+        self.values = values
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def _checkpoint(self, restart):
+        checkpoint = db.session.get(MaintenanceCheckpoint, self.name)
+        if checkpoint is None:
+            checkpoint = MaintenanceCheckpoint(name=self.name)
+            db.session.add(checkpoint)
+        if restart or checkpoint.finished_at is not None or checkpoint.started_at is None:
+            checkpoint.last_key = None
+            checkpoint.rows_done = 0
+            checkpoint.started_at = datetime.now()
+            checkpoint.finished_at = None
+        return checkpoint
+
+    def _next_keys(self, after):
+        query = select(self.key)
+        if after is not None:
+            query = query.where(self.key > after)
+        return db.session.execute(query.order_by(self.key).limit(self.batch_size)).scalars().all()
+
+    def _in_page(self, keys):
+        return (self.key >= keys[0], self.key <= keys[-1], self.where)
+
+    def run(self, dry_run=False, restart=False, report=print):
+        """
+        Apply the update batch by batch, resuming from the saved checkpoint
+        unless restart=True. `report` gets one progress line per batch.
+
+        Returns:
+            int: Rows updated by this run (rows that would be, with dry_run).
+        """
+        if dry_run:
+            checkpoint = db.session.get(MaintenanceCheckpoint, self.name)
+            after = checkpoint.last_key if checkpoint and not restart and checkpoint.finished_at is None else None
+        else:
+            checkpoint = self._checkpoint(restart)
+            after = checkpoint.last_key
+            db.session.commit()
+            if after is not None:
+                report(f"[{self.name}] resuming after {after!r} ({checkpoint.rows_done} rows already done)")
+
+        done = 0
+        started = time.perf_counter()
+        while True:
+            keys = self._next_keys(after)
+            if not keys:
+                break
+            if dry_run:
+                changed = db.session.execute(select(func.count()).where(*self._in_page(keys))).scalar()
+            else:
+                changed = db.session.execute(
+                    update(self.model)
+                    .where(*self._in_page(keys))
+                    .values(self.values)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                checkpoint.last_key = keys[-1]
+                checkpoint.rows_done += changed
+            db.session.commit()
+            after = keys[-1]
+            done += changed
+            elapsed = time.perf_counter() - started
+            report(f"[{self.name}] {'would update' if dry_run else 'updated'} {done} rows "
+                   f"(last key {after!r}, {done / elapsed if elapsed else 0:,.0f} rows/s)")
+            if len(keys) < self.batch_size:
+                break
+            if self.pause:
+                time.sleep(self.pause)
+
+        if not dry_run:
+            checkpoint.finished_at = datetime.now()
+            db.session.commit()
+        return done
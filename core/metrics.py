@@ -0,0 +1,62 @@
+# core/metrics.py
+# In-process counters for background work, served by GET /metrics
+#
+# Figures are per worker process and reset on restart.
+
+import threading
+from datetime import datetime
+
+
+class JobMetrics:
+    """Latency, lag (start time minus scheduled time) and failures per job name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, latency, lag=None, failed=False):
+        """Add one run of `name`. latency and lag are in seconds."""
+        with self._lock:
+            s = self._stats.setdefault(name, {
+                "runs": 0, "failures": 0,
+                "latency_total": 0.0, "latency_max": 0.0, "latency_last": 0.0,
+                "lag_runs": 0, "lag_total": 0.0, "lag_max": 0.0, "lag_last": None,
+                "last_run_at": None,
+            })
+            s["runs"] += 1
+            s["failures"] += int(failed)
+            s["latency_total"] += latency
+            s["latency_max"] = max(s["latency_max"], latency)
+            s["latency_last"] = latency
+            if lag is not None:
+                s["lag_runs"] += 1
+                s["lag_total"] += lag
+                s["lag_max"] = max(s["lag_max"], lag)
+                s["lag_last"] = lag
+            s["last_run_at"] = datetime.now().isoformat()
+
+    def snapshot(self):
+        """{name: stats} with times in milliseconds."""
+        ms = lambda seconds: round(seconds * 1000, 1)
+        with self._lock:
+            return {
+                name: {
+                    "runs": s["runs"],
+                    "failures": s["failures"],
+                    "latency_avg_ms": ms(s["latency_total"] / s["runs"]),
+                    "latency_max_ms": ms(s["latency_max"]),
+                    "latency_last_ms": ms(s["latency_last"]),
+                    "lag_avg_ms": ms(s["lag_total"] / s["lag_runs"]) if s["lag_runs"] else None,
+                    "lag_max_ms": ms(s["lag_max"]) if s["lag_runs"] else None,
+                    "lag_last_ms": ms(s["lag_last"]) if s["lag_runs"] else None,
+                    "last_run_at": s["last_run_at"],
+                }
+                for name, s in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+job_metrics = JobMetrics()
@@ -0,0 +1,246 @@
+# core/migrations.py
+# Versioned schema changes that must not lock a live database
+#
+# create_all() and core.schema take care of new tables, columns and the
+# indexes of small tables at startup. Indexes on the big tables (users, posts,
+# comments, votes, reactions, ...), the clean-up a new unique index needs and
+# the full-text index are instead the job of numbered migrations, recorded in
+# schema_migrations once applied. On Postgres every step runs outside a
+# transaction with CREATE/DROP INDEX CONCURRENTLY, so reads and writes go on
+# while it builds; run them with `python -m scripts.migrate`. On SQLite, where
+# index builds are short and the database has a single writer anyway, pending
+# migrations are applied at startup.
+#
+# Every step is idempotent: an interrupted migration is simply run again (on
+# Postgres an index left INVALID by an interrupted CONCURRENTLY build is
+# dropped and rebuilt).
+
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import inspect, select, text
+from sqlalchemy.schema import CreateIndex
+from core.extensions import db
+from core.schema import remove_duplicates
+from core.search_index import build_search_index
+from core.utils_sql import insert_ignore
+from models import SchemaMigration, Comment, Vote
+
+
+class Migration:
+    """
+    create: names of indexes declared in models.py that the migration builds.
+    drop:   (table, name, columns) of indexes it removes; the columns let
+            revert_migration() put them back.
+    dedupe: (unique index, where, references, note) for the indexes of
+            `create` that an older database may violate: the repeated rows
+            are removed first (see core.schema.remove_duplicates), and
+            `note`, if any, is reported when some were.
+    steps:  callables run with the autocommit connection before the indexes
+            are built, for what is not an index declared in models.py; they
+            must be idempotent.
+    """
+
+    def __init__(self, version, name, create=(), drop=(), dedupe=(), steps=()):
+        self.version = version
+        self.name = name
+        self.create = tuple(create)
+        self.drop = tuple(drop)
+        self.dedupe = tuple(dedupe)
+        self.steps = tuple(steps)
+
+
+MIGRATIONS = [
+    Migration(1, "hot_path_indexes",
+              create=("ix_votes_voter", "ix_votes_candidate_post_id", "ix_comments_post_id_commenter",
+                      "ix_posts_winner", "ix_posts_second"),
+              # (post_id, commenter) serves every lookup it did
+              drop=(("comments", "ix_comments_post_id", ("post_id",)),)),
+    Migration(2, "unique_keys",
+              create=("uq_badges_user_name", "uq_comments_post_commenter", "uq_votes_post_voter",
+                      "uq_reactions_post_user"),
+              dedupe=(("uq_badges_user_name", None, (), None),
+                      ("uq_comments_post_commenter", Comment.is_duel == False, (Vote.comment_id,), None),
+                      ("uq_votes_post_voter", None, (), "run python -m scripts.reconcile_counters"))),
+    Migration(3, "listing_indexes",
+              create=("ix_posts_created_at_id", "ix_posts_started_voting_deadline", "ix_votes_post_id_candidate",
+                      "ix_post_tags_tag_name_post_id", "ix_users_created_at", "ix_post_timers_next_action_at")),
+    Migration(4, "full_text_search", steps=(build_search_index,)),
+]
+
+# the migration that builds the unique keys /comment, /vote, /like and /flag rely on
+UNIQUE_KEYS = 2
+UNIQUE_KEYS_RECHECK_SECONDS = 60
+
+
+def migration_indexes():
+    """Names of the declared indexes that are built by a migration, not at startup."""
+    return {name for m in MIGRATIONS for name in m.create}
+
+
+def _declared_index(name):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise LookupError(f"index {name} is not declared in models.py")
+
+
+def _is_postgres():
+    return db.engine.dialect.name == "postgresql"
+
+
+def _present_indexes(conn, tables):
+    """Valid indexes on `tables` (Postgres INVALID leftovers do not count)."""
+    inspector = inspect(conn)
+    present = {i["name"] for t in tables if inspector.has_table(t) for i in inspector.get_indexes(t)}
+    return present - _invalid_indexes(conn)
+
+
+def _invalid_indexes(conn):
+    if not _is_postgres():
+        return set()
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+    ))
+    return {name for (name,) in rows}
+
+
+def _drop_index(conn, name):
+    concurrently = "CONCURRENTLY " if _is_postgres() else ""
+    conn.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+
+
+def _create_index(conn, index):
+    options = index.dialect_options["postgresql"]
+    concurrently = options["concurrently"]
+    options["concurrently"] = _is_postgres()
+    try:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+    finally:
+        options["concurrently"] = concurrently
+
+
+def _autocommit():
+    # CONCURRENTLY refuses to run inside a transaction block
+    return db.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def is_satisfied(migration, conn):
+    """True if the schema already looks as the migration leaves it (e.g. built by create_all)."""
+    if migration.steps:
+        return False   # no way to tell, and they are idempotent anyway
+    created = {name: _declared_index(name).table.name for name in migration.create}
+    present = _present_indexes(conn, set(created.values()) | {t for t, _, _ in migration.drop})
+    return set(created) <= present and not any(name in present for _, name, _ in migration.drop)
+
+
+def applied_versions():
+    with db.engine.connect() as conn:
+        if not inspect(conn).has_table(SchemaMigration.__tablename__):
+            return set()
+        return set(conn.execute(select(SchemaMigration.version)).scalars())
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def apply_migration(migration, report=print):
+    """Run the migration one statement at a time, then record it."""
+    with _autocommit() as conn:
+        # INVALID leftovers go first: remove_duplicates() skips a table whose
+        # unique index exists, even if only as the remains of a failed build
+        for name in sorted(_invalid_indexes(conn) & set(migration.create)):
+            report(f"  {name}: INVALID leftover of an interrupted build, dropping it")
+            _drop_index(conn, name)
+        for name, where, references, note in migration.dedupe:
+            index = _declared_index(name)
+            columns = [c.name for c in index.columns]
+            removed = remove_duplicates(index.table, columns, name, where=where, references=references)
+            if removed:
+                report(f"  {index.table.name}: {removed} duplicate rows removed" + (f", {note}" if note else ""))
+        for step in migration.steps:
+            started = datetime.now()
+            step(conn)
+            report(f"  {step.__name__}: {(datetime.now() - started).total_seconds():.1f}s")
+        for name in migration.create:
+            index = _declared_index(name)
+            started = datetime.now()
+            _create_index(conn, index)
+            report(f"  {name} on {index.table.name}: {(datetime.now() - started).total_seconds():.1f}s")
+        for _, name, _ in migration.drop:
+            _drop_index(conn, name)
+            report(f"  {name} dropped")
+    _record(migration)
+
+
+def revert_migration(migration, report=print):
+    """
+    Undo apply_migration's index changes (used by scripts.bench_indexes to
+    measure the schema before them); removed duplicates and steps stay.
+    """
+    with _autocommit() as conn:
+        concurrently = "CONCURRENTLY " if _is_postgres() else ""
+        for table, name, columns in migration.drop:
+            conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+            report(f"  {name} restored")
+        for name in migration.create:
+            _drop_index(conn, name)
+            report(f"  {name} dropped")
+    db.session.query(SchemaMigration).filter_by(version=migration.version).delete()
+    db.session.commit()
+
+
+def _record(migration):
+    # two workers starting together may both record it
+    insert_ignore(SchemaMigration, [
+        {"version": migration.version, "name": migration.name, "applied_at": datetime.now()}
+    ])
+    db.session.commit()
+
+
+def unique_keys_enforced():
+    """
+    True once migration UNIQUE_KEYS is applied, so a duplicate comment, vote
+    or reaction is rejected by its unique index. Until then (a Postgres
+    database waiting for scripts.migrate) the routes look for an existing row
+    before inserting. Cached in the app: for good once True, otherwise
+    re-read from schema_migrations every UNIQUE_KEYS_RECHECK_SECONDS.
+    """
+    state = current_app.extensions.setdefault("unique_keys", {"enforced": False, "checked_at": None})
+    if state["enforced"]:
+        return True
+    now = time.monotonic()
+    if state["checked_at"] is None or now - state["checked_at"] >= UNIQUE_KEYS_RECHECK_SECONDS:
+        state["enforced"] = UNIQUE_KEYS in applied_versions()
+        state["checked_at"] = now
+    return state["enforced"]
+
+
+def migrate_on_startup():
+    """
+    Record pending migrations the schema already satisfies (a database just
+    made by create_all), apply the others on SQLite, and only report them on
+    Postgres, where they are left to scripts.migrate.
+
+    Returns:
+        list[Migration]: Migrations still pending.
+    """
+    pending = []
+    for migration in pending_migrations():
+        with _autocommit() as conn:
+            satisfied = is_satisfied(migration, conn)
+        if satisfied:
+            _record(migration)
+            continue
+        if _is_postgres():
+            pending.append(migration)
+            continue
+        print(f"[SCHEMA] applying migration {migration.version} ({migration.name})")
+        apply_migration(migration)
+    if pending:
+        names = ", ".join(f"{m.version} ({m.name})" for m in pending)
+        print(f"[SCHEMA] pending migrations {names}: run python -m scripts.migrate")
+    return pending
@@ -0,0 +1,56 @@
+# core/pagination.py
+# Opaque cursors for keyset pagination
+
+import base64
+import json
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE     = 100
+
+
+def encode_cursor(*values):
+    """
+    Encode the sort key of the last row of a page as an opaque URL-safe string.
+    Datetimes are serialized as ISO strings.
+    """
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed or does not carry `size` values.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def decode_time_cursor(cursor):
+    """Decode a (created_at, id) cursor."""
+    created_at, key = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), key
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Parse a 'limit' query parameter, clamped to [1, maximum].
+
+    Raises:
+        ValueError: If the value is not an integer.
+    """
+    if value is None:
+        return default
+    return max(1, min(int(value), maximum))
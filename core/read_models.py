@@ -0,0 +1,160 @@
+# core/read_models.py
+# Read-side loaders that build whole API payloads from a fixed number of queries
+
+from datetime import datetime
+from sqlalchemy import func
+from core.extensions import db
+from core.utils_flag import compute_flag_status
+from models import User, Post, Comment, Vote, Reaction
+
+
+def vote_tally(post_id):
+    """
+    Return {candidate: votes} for a post using a single GROUP BY query.
+    """
+    rows = (
+        db.session.query(Vote.candidate, func.count(Vote.id))
+        .filter(Vote.post_id == post_id)
+        .group_by(Vote.candidate)
+        .all()
+    )
+    return {candidate: count for candidate, count in rows}
+
+
+def load_post_status(post_id):
+    """
+    Build the GET /status payload for a post.
+
+    The number of queries is constant (post + author, comments + avatars,
+    vote tally, likers/flaggers) regardless of how many comments, votes,
+    likes or flags the post has.
+
+    Returns:
+        dict | None: Status payload, or None if the post does not exist.
+    """
+    row = (
+        db.session.query(Post, User.avatar_url)
+        .outerjoin(User, User.username == Post.author)
+        .filter(Post.id == post_id)
+        .first()
+    )
+    if not row:
+        return None
+    post, author_avatar = row
+
+    comments = (
+        db.session.query(Comment.commenter, Comment.text, User.avatar_url)
+        .outerjoin(User, User.username == Comment.commenter)
+        .filter(Comment.post_id == post_id)
+        .order_by(Comment.id)
+        .all()
+    )
+
+    ranking = vote_tally(post_id)
+
+    reactions = db.select(Reaction.kind, Reaction.user).where(Reaction.post_id == post_id).order_by(Reaction.id)
+    like_users, flag_users = [], []
+    for kind, username in db.session.execute(reactions):
+        (like_users if kind == "like" else flag_users).append(username)
+
+    countdown = 0
+    if post.voting_deadline:
+        remaining = (post.voting_deadline - datetime.now()).total_seconds()
+        countdown = max(int(remaining), 0)
+
+    return {
+        "id": post.id,
+        "author": post.author,
+        "author_avatar": author_avatar or "",
+        "body": post.body,
+        "winner": post.winner,
+        "second": post.second,
+        "started": post.started,
+        "postponed": post.postponed,
+        "media": post.media_urls,
+        "voting_deadline": post.voting_deadline.isoformat() if post.voting_deadline else None,
+        "voting_ends_in": countdown,
+        "likes": post.like_count,
+        "flags": post.flag_count,
+        "like_users": like_users,
+        "flag_users": flag_users,
+        "ranking": ranking,
+        "comments": [
+            {
+                "commenter": commenter,
+                "commenter_avatar": avatar or "",
+                "text": text,
+                "votes": ranking.get(commenter, 0)
+            }
+            for commenter, text, avatar in comments
+        ],
+        "flag_analysis": compute_flag_status(post),
+        "duel_completed_by_author": post.duel_completed_by_author,
+        "duel_completed_by_winner": post.duel_completed_by_winner,
+        "completed": post.completed,
+        "created_at": post.created_at.isoformat()
+    }
+
+
+def load_post_comments(post_id, voters_limit=None, comment_id=None, voters_after=None):
+    """
+    Build the GET /comments payload for a post: one query for the comments,
+    one GROUP BY for the tallies and one batched query for the voter lists.
+
+    Voters are ordered by username. When voters_limit is given each comment
+    carries at most that many voters plus a 'voters_next' cursor (the last
+    username returned). Later pages are read one comment at a time: pass
+    that comment's id as comment_id and its cursor as voters_after, and only
+    that comment is returned.
+
+    Raises:
+        ValueError: If voters_after is given without comment_id.
+    """
+    if voters_after and comment_id is None:
+        raise ValueError("voters_after needs a comment_id")
+    comments = (
+        db.session.query(Comment.id, Comment.commenter, Comment.text)
+        .filter(Comment.post_id == post_id, Comment.is_duel == False)
+        .order_by(Comment.id)
+    )
+    if comment_id is not None:
+        comments = comments.filter(Comment.id == comment_id)
+    comments = comments.all()
+    tally = vote_tally(post_id)
+
+    ranked = db.select(
+        Vote.comment_id,
+        Vote.voter,
+        func.row_number().over(partition_by=Vote.comment_id, order_by=Vote.voter).label("rn")
+    ).where(Vote.post_id == post_id, Vote.comment_id.isnot(None))
+    if comment_id is not None:
+        ranked = ranked.where(Vote.comment_id == comment_id)
+    if voters_after:
+        ranked = ranked.where(Vote.voter > voters_after)
+    ranked = ranked.subquery()
+
+    query = db.select(ranked.c.comment_id, ranked.c.voter).order_by(ranked.c.comment_id, ranked.c.rn)
+    if voters_limit is not None:
+        # one extra row per comment tells us whether another page exists
+        query = query.where(ranked.c.rn <= voters_limit + 1)
+
+    voters = {}
+    for comment_id, voter in db.session.execute(query):
+        voters.setdefault(comment_id, []).append(voter)
+
+    data = []
+    for comment_id, commenter, text in comments:
+        names = voters.get(comment_id, [])
+        next_cursor = None
+        if voters_limit is not None and len(names) > voters_limit:
+            names = names[:voters_limit]
+            next_cursor = names[-1] if names else None
+        data.append({
+            "id": comment_id,
+            "commenter": commenter,
+            "text": text,
+            "votes": tally.get(commenter, 0),
+            "voters": names,
+            "voters_next": next_cursor
+        })
+    return data
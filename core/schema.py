@@ -0,0 +1,87 @@
+# core/schema.py
+# Bring an existing database up to date with the models declared in models.py
+
+from sqlalchemy import inspect, text, select, func, delete, update
+from sqlalchemy.sql.util import ClauseAdapter
+from sqlalchemy.schema import CreateColumn
+from core.extensions import db
+
+
+def add_missing_columns():
+    """
+    db.create_all() creates missing tables but never alters existing ones.
+    Add any column declared on a model that the live table lacks.
+    New NOT NULL columns must declare a server_default.
+
+    Returns:
+        list[str]: "table.column" for every column added.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes(skip=()):
+    """
+    Create any index declared on a model that an existing table lacks,
+    except those named in `skip` (left to core.migrations).
+
+    Returns:
+        list[str]: Names of the indexes created.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in present and index.name not in skip:
+                index.create(bind=db.engine, checkfirst=True)
+                created.append(index.name)
+    return created
+
+
+def remove_duplicates(table, columns, index_name, where=None, references=()):
+    """
+    Delete rows that repeat `columns` (keeping the lowest id, among the rows
+    matching `where` if given) so that the unique index `index_name` can be
+    built on a database that predates it. Foreign keys in `references` that
+    point at a deleted row are moved to the kept one first.
+    Does nothing once the index exists.
+
+    Returns:
+        int: Rows deleted.
+    """
+    table = getattr(table, "__table__", table)
+    inspector = inspect(db.engine)
+    if table.name not in inspector.get_table_names():
+        return 0
+    if any(i["name"] == index_name for i in inspector.get_indexes(table.name)):
+        return 0
+    conditions = [where] if where is not None else []
+    keep = select(func.min(table.c.id)).where(*conditions).group_by(*(table.c[c] for c in columns))
+    doomed = select(table.c.id).where(*conditions, table.c.id.not_in(keep))
+    with db.engine.begin() as conn:
+        for column in references:
+            orig, dup = table.alias("orig"), table.alias("dup")
+            kept = select(func.min(dup.c.id)).where(
+                orig.c.id == column,
+                *(dup.c[c] == orig.c[c] for c in columns),
+                *(ClauseAdapter(dup).traverse(c) for c in conditions),
+            ).scalar_subquery()
+            conn.execute(update(column.table).where(column.in_(doomed)).values({column.key: kept}))
+        return conn.execute(delete(table).where(table.c.id.in_(doomed))).rowcount
@@ -0,0 +1,270 @@
+# core/search_index.py
+# Pluggable full-text index over post bodies.
+#
+# - SQLite:   an FTS5 table (posts_fts) kept in sync by triggers, ranked with bm25()
+# - Postgres: a GIN index on the body's tsvector, ranked with ts_rank()
+# - anything else (or SQLite built without FTS5): the old ILIKE scan
+#
+# The FTS5 table and the GIN index are built by migration 4 (core.migrations),
+# not at startup: build_search_index() is its step.
+#
+# Every backend ranks by a "score" where lower is better, so keyset cursors
+# (score, post_id) work the same way for all of them. Relevance paging stays
+# inside the newest RANK_CANDIDATES matches; sort=asc/desc reaches every match.
+
+import html
+import re
+from sqlalchemy import text, bindparam, select
+from sqlalchemy.exc import OperationalError
+from core.extensions import db
+from models import Post
+
+WORD_REGEX   = re.compile(r"\w+", re.UNICODE)
+SNIPPET_OPEN  = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+SNIPPET_WORDS = 12
+# Relevance is computed over the newest RANK_CANDIDATES matches only, so a
+# term that appears in most posts costs the same as a rare one.
+RANK_CANDIDATES = 1000
+
+
+def search_terms(q):
+    """Split a user query into the word tokens the index understands."""
+    return WORD_REGEX.findall(q or "")
+
+
+def highlight_words(terms, posts, prefix):
+    """
+    Build {post_id: snippet} around the first hit in each body, wrapping hits
+    in SNIPPET_OPEN/SNIPPET_CLOSE. With prefix=True terms match word starts
+    (like the FTS prefix query), otherwise any substring (like ILIKE).
+    The snippet is HTML: the body text is escaped, only the marks are markup.
+    """
+    alternatives = "|".join(re.escape(t) for t in terms)
+    pattern = re.compile(rf"\b(?:{alternatives})\w*" if prefix else alternatives, re.IGNORECASE)
+    out = {}
+    for post in posts:
+        words = post.body.split()
+        hit = next((i for i, w in enumerate(words) if pattern.search(w)), 0)
+        start = max(hit - SNIPPET_WORDS // 2, 0)
+        window = " ".join(words[start:start + SNIPPET_WORDS])
+        if start > 0:
+            window = "…" + window
+        if start + SNIPPET_WORDS < len(words):
+            window += "…"
+        out[post.id] = _mark(window, pattern.finditer(window))
+    return out
+
+
+def _mark(snippet, hits):
+    """HTML-escape `snippet`, wrapping the regex matches `hits` in the snippet marks."""
+    parts, pos = [], 0
+    for hit in hits:
+        parts += [html.escape(snippet[pos:hit.start()]), SNIPPET_OPEN, html.escape(hit.group(0)), SNIPPET_CLOSE]
+        pos = hit.end()
+    parts.append(html.escape(snippet[pos:]))
+    return "".join(parts)
+
+
+class LikeSearchBackend:
+    """Fallback: substring scan with ILIKE. Every match scores 0."""
+    name = "like"
+
+    def _filter(self, terms):
+        return [Post.body.ilike(f"%{t}%") for t in terms]
+
+    def search(self, terms, limit, author=None, after=None):
+        query = db.session.query(Post.id).filter(*self._filter(terms))
+        if author:
+            query = query.filter(Post.author == author)
+        if after:
+            query = query.filter(Post.id > after[1])
+        return [(post_id, 0.0) for (post_id,) in query.order_by(Post.id).limit(limit)]
+
+    def matching(self, terms):
+        return select(Post.id).where(*self._filter(terms))
+
+    def highlight(self, terms, posts):
+        return highlight_words(terms, posts, prefix=False)
+
+
+class SqliteFtsBackend:
+    """FTS5 table mirroring posts.body, maintained by triggers on posts."""
+    name = "sqlite_fts5"
+
+    DDL = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+        "post_id UNINDEXED, body, tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN "
+        "INSERT INTO posts_fts(post_id, body) VALUES (new.id, new.body); END",
+        "CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN "
+        "DELETE FROM posts_fts WHERE post_id = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF body ON posts BEGIN "
+        "DELETE FROM posts_fts WHERE post_id = old.id; "
+        "INSERT INTO posts_fts(post_id, body) VALUES (new.id, new.body); END",
+    ]
+
+    @staticmethod
+    def available(conn):
+        try:
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)"))
+            conn.execute(text("DROP TABLE temp.fts5_probe"))
+            return True
+        except OperationalError:
+            return False
+
+    @staticmethod
+    def installed():
+        with db.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'"
+            )).first() is not None
+
+    @classmethod
+    def build(cls, conn):
+        if not cls.available(conn):
+            return
+        for statement in cls.DDL:
+            conn.execute(text(statement))
+        # index posts written before the triggers existed (skipping those
+        # indexed by an interrupted run, or by the triggers since)
+        conn.execute(text(
+            "INSERT INTO posts_fts(post_id, body) SELECT id, body FROM posts "
+            "WHERE id NOT IN (SELECT post_id FROM posts_fts)"
+        ))
+
+    @staticmethod
+    def _match(terms):
+        return " ".join('"{}"*'.format(t.replace('"', '""')) for t in terms)
+
+    def search(self, terms, limit, author=None, after=None):
+        sql = "SELECT post_id, bm25(posts_fts) AS score FROM posts_fts WHERE posts_fts MATCH :match"
+        params = {"match": self._match(terms), "limit": limit, "candidates": RANK_CANDIDATES}
+        if author:
+            sql += " AND post_id IN (SELECT id FROM posts WHERE author = :author)"
+            params["author"] = author
+        # rowid follows insertion order, so this keeps the newest matches
+        sql += " ORDER BY rowid DESC LIMIT :candidates"
+        sql = f"SELECT post_id, score FROM ({sql}) ranked"
+        if after:
+            sql += " WHERE score > :score OR (score = :score AND post_id > :last_id)"
+            params.update(score=after[0], last_id=after[1])
+        sql += " ORDER BY score, post_id LIMIT :limit"
+        return [(pid, score) for pid, score in db.session.execute(text(sql), params)]
+
+    def matching(self, terms):
+        return (
+            text("SELECT post_id FROM posts_fts WHERE posts_fts MATCH :match")
+            .bindparams(match=self._match(terms))
+            .columns(post_id=Post.id.type)
+        )
+
+    def highlight(self, terms, posts):
+        # snippet() would need a MATCH restricted by post_id, which FTS5 can
+        # only do by walking every match; the page's bodies are already loaded
+        return highlight_words(terms, posts, prefix=True)
+
+
+class PostgresFtsBackend:
+    """GIN index on the tsvector of posts.body, matched by the same expression."""
+    name = "postgres_tsvector"
+
+    VECTOR = "to_tsvector('simple', coalesce(body, ''))"
+    INDEX = "ix_posts_body_tsvector"
+
+    @classmethod
+    def build(cls, conn):
+        # CONCURRENTLY runs outside a transaction, so conn is in autocommit;
+        # an interrupted build leaves an INVALID index behind, rebuilt here
+        invalid = conn.execute(text(
+            "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+        ), {"name": cls.INDEX}).scalar()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {cls.INDEX}"))
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {cls.INDEX} ON posts USING GIN ({cls.VECTOR})"
+        ))
+        # earlier versions kept a generated search_vector column, recomputed on
+        # every write; dropping it only touches the catalog, not the rows
+        if conn.execute(text(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = 'posts' AND column_name = 'search_vector'"
+        )).first():
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_search_vector"))
+            conn.execute(text("ALTER TABLE posts DROP COLUMN search_vector"))
+
+    @staticmethod
+    def _tsquery(terms):
+        return " & ".join(f"{t}:*" for t in terms)
+
+    def search(self, terms, limit, author=None, after=None):
+        # ts_rank grows with relevance: negate it so lower is better like bm25
+        sql = (
+            f"SELECT id AS post_id, -ts_rank({self.VECTOR}, q) AS score "
+            f"FROM posts, to_tsquery('simple', :tsq) q WHERE {self.VECTOR} @@ q"
+        )
+        params = {"tsq": self._tsquery(terms), "limit": limit, "candidates": RANK_CANDIDATES}
+        if author:
+            sql += " AND author = :author"
+            params["author"] = author
+        sql += " ORDER BY created_at DESC LIMIT :candidates"
+        sql = f"SELECT post_id, score FROM ({sql}) ranked"
+        if after:
+            sql += " WHERE (score, post_id) > (:score, :last_id)"
+            params.update(score=after[0], last_id=after[1])
+        sql += " ORDER BY score, post_id LIMIT :limit"
+        return [(pid, float(score)) for pid, score in db.session.execute(text(sql), params)]
+
+    def matching(self, terms):
+        match = text(f"{self.VECTOR} @@ to_tsquery('simple', :tsq)").bindparams(tsq=self._tsquery(terms))
+        return select(Post.id).where(match)
+
+    # ts_headline returns the raw body: it marks hits with these control
+    # characters (stripped from the body first), the rest is escaped here
+    _START, _STOP = "\x02", "\x03"
+
+    def highlight(self, terms, posts):
+        if not posts:
+            return {}
+        sql = text(
+            "SELECT id, ts_headline('simple', translate(body, :markers, ''), to_tsquery('simple', :tsq), :options) "
+            "FROM posts WHERE id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        options = f"StartSel={self._START}, StopSel={self._STOP}, MaxWords={SNIPPET_WORDS}, MinWords=3"
+        rows = db.session.execute(sql, {
+            "markers": self._START + self._STOP, "tsq": self._tsquery(terms),
+            "options": options, "ids": [p.id for p in posts],
+        })
+        return {
+            post_id: html.escape(headline).replace(self._START, SNIPPET_OPEN).replace(self._STOP, SNIPPET_CLOSE)
+            for post_id, headline in rows
+        }
+
+
+def get_search_backend():
+    """Pick the best backend for the bound database."""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite" and SqliteFtsBackend.installed():
+        return SqliteFtsBackend()
+    if dialect == "postgresql":
+        # until migration 4 builds the index the matches are found by a scan
+        return PostgresFtsBackend()
+    return LikeSearchBackend()
+
+
+def init_search_backend(app):
+    """Keep the backend chosen for the bound database in app.extensions['search_backend']."""
+    backend = get_search_backend()
+    app.extensions["search_backend"] = backend
+    return backend
+
+
+def build_search_index(conn):
+    """
+    Create the full-text structures of the database `conn` (an autocommit
+    connection) is bound to; idempotent. Nothing to build for the ILIKE
+    fallback, or on a SQLite built without FTS5.
+    """
+    if conn.dialect.name == "sqlite":
+        SqliteFtsBackend.build(conn)
+    elif conn.dialect.name == "postgresql":
+        PostgresFtsBackend.build(conn)
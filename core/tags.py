@@ -0,0 +1,98 @@
+# core/tags.py
+# Tag attachment and the per-tag post counters kept in tag_stats
+
+from sqlalchemy import func
+from core.extensions import db
+from core.utils_sql import insert_ignore
+from models import Tag, TagStats, post_tags
+
+
+def normalize_tags(names):
+    """Lower-case and de-duplicate tag names, keeping their first-seen order."""
+    return list(dict.fromkeys(name.lower() for name in names))
+
+
+def ensure_tag_stats(names):
+    """
+    Make sure every tag in `names` has a tag_stats row. Tags that predate the
+    counters are initialized from post_tags once; brand new tags start at 0.
+    Rows created meanwhile by a concurrent request are left alone.
+    """
+    if not names:
+        return
+    known = {n for (n,) in db.session.query(TagStats.tag_name).filter(TagStats.tag_name.in_(names))}
+    missing = [n for n in names if n not in known]
+    if not missing:
+        return
+    counts = dict(
+        db.session.query(post_tags.c.tag_name, func.count())
+        .filter(post_tags.c.tag_name.in_(missing))
+        .group_by(post_tags.c.tag_name)
+        .all()
+    )
+    insert_ignore(TagStats, [{"tag_name": n, "post_count": counts.get(n, 0)} for n in missing])
+
+
+def attach_tags(post, names):
+    """
+    Link `post` to the given tags, creating missing tags, and add one to each
+    tag's post_count in the same transaction. A fixed number of statements is
+    issued whatever the number of tags, and a tag created by a concurrent post
+    is simply reused instead of raising IntegrityError.
+
+    Returns:
+        list[str]: The normalized tag names attached.
+    """
+    names = normalize_tags(names)
+    if not names:
+        return names
+    existing = {n for (n,) in db.session.query(Tag.name).filter(Tag.name.in_(names))}
+    insert_ignore(Tag, [{"name": n} for n in names if n not in existing])
+    # counters are initialized before this post is linked, then bumped below
+    ensure_tag_stats(names)
+    db.session.flush()
+    db.session.execute(db.insert(post_tags), [{"post_id": post.id, "tag_name": n} for n in names])
+    db.session.query(TagStats).filter(TagStats.tag_name.in_(names)).update(
+        {TagStats.post_count: TagStats.post_count + 1}, synchronize_session=False
+    )
+    return names
+
+
+def tag_post_count(name):
+    """Number of posts using a tag, read from tag_stats (counted once if absent)."""
+    count = db.session.query(TagStats.post_count).filter_by(tag_name=name).scalar()
+    if count is None:
+        count = db.session.query(func.count()).select_from(post_tags).filter(post_tags.c.tag_name == name).scalar()
+    return count
+
+
+def popular_tags(limit):
+    """Top tags by post count, read from the tag_stats index."""
+    return (
+        db.session.query(TagStats.tag_name, TagStats.post_count)
+        .filter(TagStats.post_count > 0)
+        .order_by(TagStats.post_count.desc(), TagStats.tag_name)
+        .limit(limit)
+        .all()
+    )
+
+
+def rebuild_tag_stats():
+    """
+    Recompute tag_stats from scratch out of tags and post_tags.
+
+    Returns:
+        int: Number of tags written.
+    """
+    db.session.query(TagStats).delete(synchronize_session=False)
+    counts = (
+        db.select(Tag.name, func.count(post_tags.c.post_id))
+        .select_from(Tag)
+        .outerjoin(post_tags, post_tags.c.tag_name == Tag.name)
+        .group_by(Tag.name)
+    )
+    result = db.session.execute(
+        db.insert(TagStats).from_select(["tag_name", "post_count"], counts)
+    )
+    db.session.commit()
+    return result.rowcount
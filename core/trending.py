@@ -0,0 +1,167 @@
+# core/trending.py
+# Time-decayed tag popularity over sliding windows (1h / 24h / 7d).
+#
+# Each use of a tag adds 1 to its score, and scores decay as exp(-age / window).
+# Scores are kept in log space relative to a fixed epoch:
+#
+#     log_score = log(sum(exp(t_i / window)))    for every use at time t_i
+#     score(now) = exp(log_score - now / window)
+#
+# so the ranking never changes just because time passes. That makes a plain
+# min-heap usable to evict the weakest tag once a window holds more than
+# TRENDING_CAPACITY tags, and lets the DB order by log_score with an index.
+#
+# Every worker records into memory and, on each checkpoint, merges only what
+# it recorded since the previous checkpoint into tag_trends, then reloads the
+# merged top of each window. Concurrent checkpoints of the same tag from two
+# workers can lose one of the two deltas.
+
+import heapq
+import math
+import threading
+import time
+from core.extensions import db
+from models import TagTrend
+from config import TRENDING_CAPACITY
+
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+# rows whose score has decayed below this are dropped at checkpoint
+MIN_SCORE = 1e-3
+
+
+def _logaddexp(a, b):
+    if a is None:
+        return b
+    hi, lo = (a, b) if a >= b else (b, a)
+    return hi + math.log1p(math.exp(lo - hi))
+
+
+class _Window:
+    """Bounded set of tags for one window, evicting the lowest log_score."""
+
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.scores = {}    # tag -> log_score
+        self.pending = {}   # tag -> log_score recorded since last checkpoint
+        self._heap = []     # (log_score, tag), may hold stale entries
+
+    def add(self, tag, log_value):
+        self.scores[tag] = _logaddexp(self.scores.get(tag), log_value)
+        self.pending[tag] = _logaddexp(self.pending.get(tag), log_value)
+        heapq.heappush(self._heap, (self.scores[tag], tag))
+        self._evict()
+
+    def replace(self, scores):
+        self.scores = dict(scores)
+        self._heap = [(v, t) for t, v in self.scores.items()]
+        heapq.heapify(self._heap)
+        self._evict()
+
+    def _evict(self):
+        while len(self.scores) > self.capacity:
+            value, tag = heapq.heappop(self._heap)
+            if self.scores.get(tag) == value:
+                del self.scores[tag]
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(v, t) for t, v in self.scores.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k, now):
+        best = heapq.nlargest(k, self.scores.items(), key=lambda item: item[1])
+        return [(tag, math.exp(value - now / self.seconds)) for tag, value in best]
+
+
+class TrendingTags:
+    def __init__(self, capacity=TRENDING_CAPACITY):
+        self.capacity = capacity
+        self.app = None
+        self._lock = threading.Lock()
+        self._windows = {name: _Window(sec, capacity) for name, sec in WINDOWS.items()}
+
+    def init_app(self, app):
+        """Bind to an app and load the last checkpoint from tag_trends."""
+        self.app = app
+        with self._lock:
+            self._windows = {name: _Window(sec, self.capacity) for name, sec in WINDOWS.items()}
+        self.load()
+
+    def record(self, tag_names, now=None):
+        """Count one use of each tag at time `now` (defaults to the current time)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for window in self._windows.values():
+                for tag in tag_names:
+                    window.add(tag, now / window.seconds)
+
+    def top(self, window, k=20, now=None):
+        """[(tag, decayed score)] for the k hottest tags in `window`."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._windows[window].top(k, now)
+
+    def load(self):
+        """Replace the in-memory windows with the top of tag_trends."""
+        loaded = {}
+        for name in WINDOWS:
+            rows = (
+                db.session.query(TagTrend.tag_name, TagTrend.log_score)
+                .filter(TagTrend.period == name)
+                .order_by(TagTrend.log_score.desc())
+                .limit(self.capacity)
+                .all()
+            )
+            loaded[name] = rows
+        with self._lock:
+            for name, rows in loaded.items():
+                window = self._windows[name]
+                merged = dict(rows)
+                # keep what was recorded but not checkpointed yet
+                for tag, value in window.pending.items():
+                    merged[tag] = _logaddexp(merged.get(tag), value)
+                window.replace(merged)
+
+    def checkpoint(self, now=None):
+        """
+        Merge the scores recorded since the last checkpoint into tag_trends,
+        drop fully decayed rows, then reload the merged top of every window.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            pending = {name: w.pending for name, w in self._windows.items()}
+            for window in self._windows.values():
+                window.pending = {}
+        try:
+            for name, deltas in pending.items():
+                if deltas:
+                    stored = {
+                        row.tag_name: row
+                        for row in TagTrend.query.filter(TagTrend.period == name, TagTrend.tag_name.in_(deltas))
+                    }
+                    for tag, value in deltas.items():
+                        if tag in stored:
+                            stored[tag].log_score = _logaddexp(stored[tag].log_score, value)
+                        else:
+                            db.session.add(TagTrend(period=name, tag_name=tag, log_score=value))
+                floor = now / WINDOWS[name] + math.log(MIN_SCORE)
+                TagTrend.query.filter(TagTrend.period == name, TagTrend.log_score < floor).delete()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                for name, deltas in pending.items():
+                    window = self._windows[name]
+                    for tag, value in deltas.items():
+                        window.pending[tag] = _logaddexp(window.pending.get(tag), value)
+            raise
+        self.load()
+
+
+trending = TrendingTags()
+
+
+def checkpoint_trending():
+    """Scheduler entry point: checkpoint the process-wide TrendingTags."""
+    if trending.app is None:
+        return
+    trending.checkpoint()
@@ -0,0 +1,159 @@
+# core/user_stats.py
+# Per-user activity counters behind the badge thresholds, kept in user_stats
+#
+# The write paths (vote, unvote, duel start/switch, voting finalization) keep
+# the counters current with atomic UPDATEs, so badge checks only compare a
+# few integers. A user without a row yet gets one computed from the raw tables
+# the first time it is needed (ensure_user_stats), which must happen before
+# the write that changes those tables is flushed.
+#
+# max_votes_received_on_a_post is a high-water mark: a revoked vote does not
+# lower it, as badges are never revoked either.
+
+from sqlalchemy import func, select, union, case
+from core.extensions import db
+from core.utils_sql import insert_ignore
+from models import User, Post, Vote, UserStats
+
+STAT_COLUMNS = (
+    "votes_cast",
+    "distinct_posts_voted",
+    "max_votes_received_on_a_post",
+    "wins",
+    "duels_participated",
+    "total_votes_received",
+)
+
+
+def compute_user_stats(usernames):
+    """Compute the stats of `usernames` from votes and posts, one GROUP BY each."""
+    stats = {u: dict.fromkeys(STAT_COLUMNS, 0) for u in usernames}
+
+    rows = (
+        db.session.query(Vote.voter, func.count(Vote.id), func.count(func.distinct(Vote.post_id)))
+        .filter(Vote.voter.in_(usernames))
+        .group_by(Vote.voter)
+    )
+    for user, cast, distinct_posts in rows:
+        stats[user].update(votes_cast=cast, distinct_posts_voted=distinct_posts)
+
+    per_post = (
+        select(Vote.candidate, func.count(Vote.id).label("votes"))
+        .where(Vote.candidate.in_(usernames))
+        .group_by(Vote.candidate, Vote.post_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(per_post.c.candidate, func.sum(per_post.c.votes), func.max(per_post.c.votes))
+        .group_by(per_post.c.candidate)
+    )
+    for user, total, best in rows:
+        stats[user].update(total_votes_received=total, max_votes_received_on_a_post=best)
+
+    rows = db.session.query(Post.winner, func.count(Post.id)).filter(Post.winner.in_(usernames)).group_by(Post.winner)
+    for user, wins in rows:
+        stats[user]["wins"] = wins
+
+    roles = union(
+        select(Post.id, Post.winner.label("user")).where(Post.winner.in_(usernames)),
+        select(Post.id, Post.second.label("user")).where(Post.second.in_(usernames)),
+    ).subquery()
+    rows = db.session.execute(select(roles.c.user, func.count()).group_by(roles.c.user))
+    for user, duels in rows:
+        stats[user]["duels_participated"] = duels
+    return stats
+
+
+def ensure_user_stats(usernames):
+    """
+    Make sure every existing user in `usernames` has a user_stats row, computing
+    missing ones from the raw tables as they are in the database right now
+    (pending changes in the session are not flushed first).
+    """
+    usernames = [u for u in dict.fromkeys(usernames) if u]
+    if not usernames:
+        return
+    with db.session.no_autoflush:
+        known = {u for (u,) in db.session.query(UserStats.username).filter(UserStats.username.in_(usernames))}
+        missing = [u for u in usernames if u not in known]
+        if not missing:
+            return
+        missing = [u for (u,) in db.session.query(User.username).filter(User.username.in_(missing))]
+        stats = compute_user_stats(missing)
+    insert_ignore(UserStats, [{"username": u, **values} for u, values in stats.items()])
+
+
+def get_user_stats(username):
+    """The user's UserStats row, created from the raw tables if missing (None for unknown users)."""
+    ensure_user_stats([username])
+    return db.session.get(UserStats, username)
+
+
+def bump_user_stats(username, **deltas):
+    """
+    Atomically add deltas to a user's counters, e.g. bump_user_stats(u, wins=1).
+    The row must exist (see ensure_user_stats).
+    """
+    values = {}
+    for name, delta in deltas.items():
+        if name not in STAT_COLUMNS:
+            raise ValueError(f"Unknown stat '{name}'")
+        if delta:
+            values[getattr(UserStats, name)] = getattr(UserStats, name) + delta
+    if values and username:
+        db.session.query(UserStats).filter(UserStats.username == username).update(
+            values, synchronize_session=False
+        )
+
+
+def raise_max_votes_received(username, votes):
+    """Set max_votes_received_on_a_post to `votes` if that is higher."""
+    column = UserStats.max_votes_received_on_a_post
+    db.session.query(UserStats).filter(UserStats.username == username).update(
+        {column: case((column < votes, votes), else_=column)}, synchronize_session=False
+    )
+
+
+def record_vote(voter, post_id, candidate):
+    """
+    Count a new vote. Call ensure_user_stats([voter, candidate]) before the
+    vote is added; call this after it is flushed.
+    """
+    bump_user_stats(voter, votes_cast=1, distinct_posts_voted=1)
+    bump_user_stats(candidate, total_votes_received=1)
+    received = (
+        db.session.query(func.count(Vote.id))
+        .filter(Vote.post_id == post_id, Vote.candidate == candidate)
+        .scalar()
+    )
+    raise_max_votes_received(candidate, received)
+
+
+def record_unvote(voter, candidate):
+    """Count a revoked vote (same ordering rules as record_vote)."""
+    bump_user_stats(voter, votes_cast=-1, distinct_posts_voted=-1)
+    bump_user_stats(candidate, total_votes_received=-1)
+
+
+def apply_duel_roles(changes):
+    """
+    Update wins and duels_participated for posts whose winner/second change.
+    `changes` is an iterable of ((old_winner, old_second), (new_winner, new_second)).
+    Call it before the new roles are flushed.
+    """
+    deltas = {}
+    for (old_winner, old_second), (new_winner, new_second) in changes:
+        if old_winner != new_winner:
+            for user, step in ((old_winner, -1), (new_winner, 1)):
+                if user:
+                    deltas.setdefault(user, {"wins": 0, "duels_participated": 0})["wins"] += step
+        old_roles = {old_winner, old_second} - {None}
+        new_roles = {new_winner, new_second} - {None}
+        for user in old_roles ^ new_roles:
+            step = 1 if user in new_roles else -1
+            deltas.setdefault(user, {"wins": 0, "duels_participated": 0})["duels_participated"] += step
+    if not deltas:
+        return
+    ensure_user_stats(list(deltas))
+    for user, values in deltas.items():
+        bump_user_stats(user, **values)
@@ -0,0 +1,142 @@
+# core/username_index.py
+# In-process username index for autocomplete.
+#
+# Prefix lookups bisect a sorted array of (lower-cased name, name) keys:
+# O(log n + k). Usernames are case-sensitive, so "Alice" and "alice" are two
+# keys that sort next to each other. The optional trigram index maps every
+# 3-character slice of a lower-cased name to the keys containing it; a
+# substring query intersects the shortest posting list with a plain `in`
+# check, so it only touches names sharing a trigram.
+#
+# Cost, CPython 3.11, 1M random 6-14 character names (tracemalloc, including
+# the name strings themselves):
+#   sorted array, lower-case names      ~157 MB per million users
+#   sorted array, mixed-case names      ~215 MB per million users (lower-cased copies)
+#   trigram index (opt-in)              ~ +76 MB per million users
+#   prefix lookup ~20 us, substring lookup ~50 us (top 10)
+# Posting lists hold references to the key tuples, not copies.
+#
+# The index lives in one process. With several workers each keeps its own
+# copy, built from the users table at startup; sync_username_index() then runs
+# every USERNAME_INDEX_SYNC_SECONDS and adds the users registered since, on
+# any worker.
+
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, UTC
+from flask import current_app
+from core.extensions import db
+from models import User
+
+TRIGRAM = 3
+# users.created_at is set before the INSERT commits: look this far back so
+# that a registration still committing during the previous sync is not missed
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def _trigrams(key):
+    return {key[i:i + TRIGRAM] for i in range(len(key) - TRIGRAM + 1)}
+
+
+class UsernameIndex:
+    def __init__(self, substring=False):
+        self.substring_enabled = substring
+        self._keys = []         # sorted (lower-cased name, name)
+        self._known = set()     # the same keys, for add()
+        self._postings = {}     # trigram -> [keys]
+        self._lock = threading.Lock()
+        self.synced_at = None   # start of the last sync_username_index()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def _key(name):
+        lower = name.lower()
+        # an all-lower-case name is stored once, not next to a copy
+        return (name if lower == name else lower, name)
+
+    def build(self, usernames):
+        """Replace the index content with `usernames` (any iterable)."""
+        known = {self._key(name) for name in usernames}
+        postings = {}
+        if self.substring_enabled:
+            for key in known:
+                for tri in _trigrams(key[0]):
+                    postings.setdefault(tri, []).append(key)
+        with self._lock:
+            self._known = known
+            self._keys = sorted(known)
+            self._postings = postings
+
+    def add(self, username):
+        key = self._key(username)
+        with self._lock:
+            if key in self._known:
+                return
+            self._known.add(key)
+            insort(self._keys, key)
+            if self.substring_enabled:
+                for tri in _trigrams(key[0]):
+                    self._postings.setdefault(tri, []).append(key)
+
+    def prefix(self, q, k=10):
+        """Up to k usernames starting with q (case-insensitive), alphabetically."""
+        q = q.lower()
+        with self._lock:
+            start = bisect_left(self._keys, (q,))
+            out = []
+            for lower, name in self._keys[start:start + k]:
+                if not lower.startswith(q):
+                    break
+                out.append(name)
+            return out
+
+    def substring(self, q, k=10):
+        """
+        Up to k usernames containing q (case-insensitive), alphabetically.
+        Queries shorter than a trigram scan the key array.
+        """
+        if not self.substring_enabled:
+            raise RuntimeError("Substring search is not enabled for this index")
+        q = q.lower()
+        with self._lock:
+            if len(q) < TRIGRAM:
+                hits = []
+                for key in self._keys:
+                    if q in key[0]:
+                        hits.append(key)
+                        if len(hits) == k:
+                            break
+            else:
+                lists = [self._postings.get(tri, ()) for tri in _trigrams(q)]
+                shortest = min(lists, key=len)
+                hits = sorted(key for key in shortest if q in key[0])[:k]
+            return [name for _, name in hits]
+
+
+def sync_username_index(index):
+    """
+    Load every user into `index` on the first call, afterwards only the users
+    created since the previous call (minus SYNC_OVERLAP). Needs an app context.
+
+    Returns:
+        int: Usernames read from the database.
+    """
+    started = datetime.now(UTC).replace(tzinfo=None)
+    query = db.session.query(User.username)
+    if index.synced_at is None:
+        index.build(name for (name,) in query.yield_per(10000))
+        read = len(index)
+    else:
+        names = [name for (name,) in query.filter(User.created_at >= index.synced_at - SYNC_OVERLAP)]
+        for name in names:
+            index.add(name)
+        read = len(names)
+    index.synced_at = started
+    return read
+
+
+def sync_app_username_index():
+    """Scheduler entry point: sync the current app's username index."""
+    sync_username_index(current_app.extensions["username_index"])
@@ -1,48 +1,26 @@
 import re
 from datetime import datetime, timedelta
-from core.extensions import db, scheduler
-from models import Post, Badge, User, Vote, Comment
+from core.extensions import db
+from core.jobs import schedule_post_job
+from core.user_stats import apply_duel_roles
+from core.utils_sql import insert_ignore
+from models import Post, Badge, User
 from config import (
-    INSIGHTFUL_THRESHOLD,
-    SERIAL_VOTER_THRESHOLD,
-    CONSISTENT_DEBATER_THRESHOLD,
     DUEL_TIMEOUT_POSTPONE_HOURS,
     DUEL_TIMEOUT_RETRY_HOURS
 )
 
 def award_badge(username, badge_name):
+    # does not commit: the caller's transaction carries the badge
     user = db.session.get(User, username)
     if not user:
         return
     if Badge.query.filter_by(user=username, name=badge_name).first():
         return
-    db.session.add(Badge(user=username, name=badge_name))
-    db.session.commit()
-
-def award_marathoner(username):
-    wins = Post.query.filter_by(winner=username).count()
-    if wins >= 100:
-        award_badge(username, "The Great Debater")
-    db.session.commit()
-
-def evaluate_badges(username):
-    post_ids = db.session.query(Comment.post_id).filter_by(commenter=username).distinct()
-    for (post_id,) in post_ids:
-        votes = db.session.query(Vote).filter_by(post_id=post_id, candidate=username).count()
-        print(f"[DEBUG] username={username}, post_id={post_id}, votes={votes}")
-        if votes >= INSIGHTFUL_THRESHOLD:
-            award_badge(username, "Insightful")
-            break
-
-    distinct_votes = db.session.query(Vote.post_id).filter_by(voter=username).distinct().count()
-    if distinct_votes >= SERIAL_VOTER_THRESHOLD:
-        award_badge(username, "Serial Voter")
-
-    participated = Post.query.filter((Post.winner == username) | (Post.second == username)).count()
-    if participated >= CONSISTENT_DEBATER_THRESHOLD:
-        award_badge(username, "Consistent Debater")
+    insert_ignore(Badge, [{"user": username, "name": badge_name}])
 
 def handle_duel_timeout(post_id):
+    # a timer action: the sweep commits its work with the timer's deletion
     post = db.session.get(Post, post_id)
     if not post:
         return
@@ -50,24 +28,13 @@ def handle_duel_timeout(post_id):
     if not post.started:
         if not post.postponed:
             post.postponed = True
-            db.session.commit()
-            scheduler.add_job(
-                handle_duel_timeout,
-                'date',
-                run_date=datetime.now() + timedelta(hours=DUEL_TIMEOUT_POSTPONE_HOURS),
-                args=[post_id]
-            )
+            schedule_post_job(handle_duel_timeout, post_id, datetime.now() + timedelta(hours=DUEL_TIMEOUT_POSTPONE_HOURS))
         else:
+            apply_duel_roles([((post.winner, post.second), (post.second, post.second))])
             post.winner = post.second
             post.postponed = False
             post.started = False
-            db.session.commit()
-            scheduler.add_job(
-                handle_duel_timeout,
-                'date',
-                run_date=datetime.now() + timedelta(hours=DUEL_TIMEOUT_RETRY_HOURS),
-                args=[post_id]
-            )
+            schedule_post_job(handle_duel_timeout, post_id, datetime.now() + timedelta(hours=DUEL_TIMEOUT_RETRY_HOURS))
 
 URL_REGEX = re.compile(r'https?://[^\s]+')
 IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
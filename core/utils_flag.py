@@ -1,27 +1,43 @@
 # Utility module to evaluate flags on a duel post and switch winner if thresholds are met
 
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from core.extensions import db, scheduler
-from models import Like, Flag
+import numpy as np
+from sqlalchemy import select, update, tuple_
+from core.extensions import db
+from core.jobs import schedule_post_job
+from core.user_stats import apply_duel_roles, ensure_user_stats
+from models import Post, Reaction
 from core.utils import handle_duel_timeout
 from config import (
     MIN_FLAGS_RATIO,
     FLAG_RATIO_THRESHOLD,
     NET_SCORE_RATIO,
-    DUEL_TIMEOUT_INITIAL_HOURS
+    DUEL_TIMEOUT_INITIAL_HOURS,
+    AT_RISK_MARGIN
 )
 
 
+def should_switch(second, initial_votes, likes, flags):
+    """The switch rule on raw counts (also used on the write-behind buffer's counts)."""
+    min_flags = max(int(initial_votes * MIN_FLAGS_RATIO), 5)
+    total_interactions = initial_votes + likes + flags
+    flag_ratio = (flags / total_interactions) if total_interactions > 0 else 0
+    net_score = (initial_votes + likes) - flags
+    return bool(second) and flags >= min_flags and (
+        flag_ratio > FLAG_RATIO_THRESHOLD or
+        net_score <= initial_votes * NET_SCORE_RATIO
+    )
+
+
 def evaluate_flags_and_maybe_switch(post):
     """
     Check flags vs likes (with initial_votes offset) and decide whether to interrupt the duel.
     Returns (switched: bool, old_winner: str|None, new_winner: str|None).
     """
-    # 1) Base counts
+    # 1) Base counts (denormalized on the post, see core.counters)
     initial_votes = post.initial_votes or 0
-    actual_likes = db.session.query(func.count(Like.id)).filter_by(post_id=post.id).scalar() or 0
-    total_flags = db.session.query(func.count(Flag.id)).filter_by(post_id=post.id).scalar() or 0
+    actual_likes = post.like_count or 0
+    total_flags = post.flag_count or 0
 
     # 2) Minimum flags required
     min_flags = max(int(initial_votes * MIN_FLAGS_RATIO), 5)
@@ -36,26 +52,20 @@ def evaluate_flags_and_maybe_switch(post):
     print(f"[SWITCH?] current winner: {post.winner}, second: {post.second}")
 
     # 4) Decide switch
-    if post.second and total_flags >= min_flags and (
-        flag_ratio > FLAG_RATIO_THRESHOLD or
-        net_score <= threshold_score
-    ):
+    if should_switch(post.second, initial_votes, actual_likes, total_flags):
         old_winner = post.winner
         new_winner = post.second
 
+        apply_duel_roles([((old_winner, post.second), (new_winner, post.second))])
         post.started = False
         post.postponed = False
         post.winner = new_winner
+        post.like_count = 0
+        post.flag_count = 0
 
-        db.session.query(Flag).filter_by(post_id=post.id).delete()
-        db.session.query(Like).filter_by(post_id=post.id).delete()
+        db.session.query(Reaction).filter_by(post_id=post.id).delete()
 
-        scheduler.add_job(
-            handle_duel_timeout,
-            'date',
-            run_date=datetime.now() + timedelta(hours=DUEL_TIMEOUT_INITIAL_HOURS),
-            args=[post.id]
-        )
+        schedule_post_job(handle_duel_timeout, post.id, datetime.now() + timedelta(hours=DUEL_TIMEOUT_INITIAL_HOURS))
         db.session.commit()
 
         print(f"[SWITCH] WINNER CHANGED from {old_winner} to {new_winner}")
@@ -65,9 +75,12 @@ def evaluate_flags_and_maybe_switch(post):
 
 
 def compute_flag_status(post):
+    """
+    Return the flag analysis shown in the post status, read from the post's counters.
+    """
     initial_votes = post.initial_votes or 0
-    actual_likes = db.session.query(func.count(Like.id)).filter_by(post_id=post.id).scalar() or 0
-    total_flags = db.session.query(func.count(Flag.id)).filter_by(post_id=post.id).scalar() or 0
+    actual_likes = post.like_count or 0
+    total_flags = post.flag_count or 0
 
     min_flags = max(int(initial_votes * MIN_FLAGS_RATIO), 5)
     total_interactions = initial_votes + actual_likes + total_flags
@@ -84,3 +97,148 @@ def compute_flag_status(post):
         "net_score": net_score,
         "threshold_score": threshold_score
     }
+
+
+# ——————————————————————————————————————————————————
+# Batch evaluation over every active duel
+#
+# The same rules as above, applied with NumPy to the counters of all started,
+# non-completed duels at once. flag_sweep() runs on the shared scheduler (and
+# once at startup, so changed thresholds take effect right away).
+
+def load_active_duels(*where):
+    """
+    Counters of every started, non-completed duel (narrowed by `where`) as
+    parallel arrays.
+
+    Returns:
+        dict: ids, winner, second (object arrays) and initial_votes, likes,
+        flags (int64 arrays).
+    """
+    rows = db.session.execute(
+        select(Post.id, Post.winner, Post.second, Post.initial_votes, Post.like_count, Post.flag_count)
+        .where(Post.started == True, Post.completed.isnot(True), *where)
+        .order_by(Post.id)
+    ).all()
+    columns = list(zip(*rows)) or [()] * 6
+    return {
+        "ids": np.array(columns[0], dtype=object),
+        "winner": np.array(columns[1], dtype=object),
+        "second": np.array(columns[2], dtype=object),
+        "initial_votes": np.array([v or 0 for v in columns[3]], dtype=np.int64),
+        "likes": np.array([v or 0 for v in columns[4]], dtype=np.int64),
+        "flags": np.array([v or 0 for v in columns[5]], dtype=np.int64),
+    }
+
+
+def flag_status_arrays(duels):
+    """Vectorized compute_flag_status: min_flags, flag_ratio, net_score, threshold_score."""
+    initial_votes, likes, flags = duels["initial_votes"], duels["likes"], duels["flags"]
+    min_flags = np.maximum(np.floor(initial_votes * MIN_FLAGS_RATIO).astype(np.int64), 5)
+    total = initial_votes + likes + flags
+    flag_ratio = np.divide(flags, total, out=np.zeros(len(total)), where=total > 0)
+    net_score = initial_votes + likes - flags
+    threshold_score = initial_votes * NET_SCORE_RATIO
+    return min_flags, flag_ratio, net_score, threshold_score
+
+
+def switch_mask(duels, margin=0.0):
+    """
+    Boolean mask of the duels whose winner must be switched. With margin > 0
+    the thresholds are loosened by that fraction, which marks the duels close
+    to a switch.
+    """
+    min_flags, flag_ratio, net_score, threshold_score = flag_status_arrays(duels)
+    has_second = np.array([bool(s) for s in duels["second"]], dtype=bool)
+    return has_second & (duels["flags"] >= min_flags * (1 - margin)) & (
+        (flag_ratio > FLAG_RATIO_THRESHOLD * (1 - margin)) |
+        (net_score <= threshold_score * (1 + margin))
+    )
+
+
+def apply_switches(duels, mask):
+    """
+    Switch winner and second on every masked duel, in the current transaction
+    (like evaluate_flags_and_maybe_switch, but one statement per step).
+    Does not commit.
+
+    A duel is only switched if it is still started with the roles it was
+    loaded with: one switched meanwhile (e.g. by /flag) is left alone, and
+    the user stats, reactions and timers follow the rows actually updated.
+
+    Returns:
+        list[tuple]: (post_id, old_winner, new_winner) per switch.
+    """
+    switches = list(zip(duels["ids"][mask], duels["winner"][mask], duels["second"][mask]))
+    if not switches:
+        return []
+    # stats rows computed now, from the roles before the switch (apply_duel_roles
+    # would otherwise compute missing ones from the updated posts)
+    ensure_user_stats(sorted({user for _, old, new in switches for user in (old, new) if user}))
+    updated = set(db.session.execute(
+        update(Post)
+        .where(Post.started == True, tuple_(Post.id, Post.winner, Post.second).in_(switches))
+        .values(winner=Post.second, started=False, postponed=False, like_count=0, flag_count=0)
+        .returning(Post.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+    switches = [switch for switch in switches if switch[0] in updated]
+    if not switches:
+        return []
+    post_ids = [post_id for post_id, _, _ in switches]
+    apply_duel_roles(((old, new), (new, new)) for _, old, new in switches)
+    db.session.query(Reaction).filter(Reaction.post_id.in_(post_ids)).delete(synchronize_session=False)
+    deadline = datetime.now() + timedelta(hours=DUEL_TIMEOUT_INITIAL_HOURS)
+    for post_id in post_ids:
+        schedule_post_job(handle_duel_timeout, post_id, deadline)
+    return switches
+
+
+def flag_sweep():
+    """
+    Evaluate every active duel and apply all due switches in one transaction.
+
+    Returns:
+        int: Number of duels switched.
+    """
+    duels = load_active_duels()
+    switches = apply_switches(duels, switch_mask(duels))
+    db.session.commit()
+    for post_id, old, new in switches:
+        print(f"[SWITCH] {post_id}: WINNER CHANGED from {old} to {new}")
+    return len(switches)
+
+
+def at_risk_duels(margin=AT_RISK_MARGIN, limit=None):
+    """
+    Active duels within `margin` of a switch, most flagged first (at most
+    `limit`), each with its compute_flag_status fields and whether it would
+    switch right now.
+    """
+    # only duels that can pass the min-flags test are loaded: it needs
+    # flags >= max(floor(initial_votes * MIN_FLAGS_RATIO), 5) * (1 - margin)
+    duels = load_active_duels(
+        Post.second.isnot(None),
+        Post.flag_count >= 5 * (1 - margin),
+        Post.flag_count >= (Post.initial_votes * MIN_FLAGS_RATIO - 1) * (1 - margin),
+    )
+    min_flags, flag_ratio, net_score, threshold_score = flag_status_arrays(duels)
+    due = switch_mask(duels)
+    at_risk = np.flatnonzero(switch_mask(duels, margin))
+    at_risk = at_risk[np.argsort(-flag_ratio[at_risk], kind="stable")][:limit]
+    return [
+        {
+            "post_id": duels["ids"][i],
+            "winner": duels["winner"][i],
+            "second": duels["second"][i],
+            "would_switch": bool(due[i]),
+            "min_flags_required": int(min_flags[i]),
+            "actual_flags": int(duels["flags"][i]),
+            "actual_likes": int(duels["likes"][i]),
+            "initial_votes": int(duels["initial_votes"][i]),
+            "flag_ratio": round(float(flag_ratio[i]), 3),
+            "net_score": int(net_score[i]),
+            "threshold_score": float(threshold_score[i]),
+        }
+        for i in at_risk
+    ]
@@ -0,0 +1,102 @@
+# core/utils_sql.py
+# Dialect-aware SQL helpers shared by the write paths
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from core.extensions import db
+
+
+def insert_ignore(table, rows, returning=()):
+    """
+    Insert `rows` (list of dicts) into `table`, silently skipping any row that
+    would violate a unique or primary key constraint.
+
+    Uses ON CONFLICT DO NOTHING on Postgres and INSERT OR IGNORE (via the same
+    clause) on SQLite, so a row created concurrently by another transaction is
+    not an error; Postgres waits for that transaction and then skips the row.
+    Other dialects fall back to one savepoint per row.
+    `table` is a Table or a mapped class.
+
+    Returns:
+        list[tuple]: With `returning` (column names), those columns of the
+        rows actually inserted; otherwise an empty list.
+    """
+    if not rows:
+        return []
+    table = getattr(table, "__table__", table)
+    columns = [table.c[name] for name in returning]
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql if dialect == "postgresql" else sqlite).insert(table).on_conflict_do_nothing()
+        if not columns:
+            db.session.execute(stmt, rows)
+            return []
+        return [tuple(r) for r in db.session.execute(stmt.returning(*columns), rows)]
+    inserted = []
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table), [row])
+        except IntegrityError:
+            continue
+        if columns:
+            inserted.append(tuple(row[name] for name in returning))
+    return inserted
+
+
+def upsert(table, rows, columns):
+    """
+    Insert `rows` (list of dicts) into `table`; a row whose primary key
+    already exists instead overwrites `columns` of the existing row with its
+    own values. ON CONFLICT DO UPDATE on Postgres and SQLite, one savepoint
+    per row elsewhere.
+    """
+    if not rows:
+        return
+    table = getattr(table, "__table__", table)
+    keys = [c.name for c in table.primary_key.columns]
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={c: stmt.excluded[c] for c in columns})
+        db.session.execute(stmt, rows)
+        return
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table), [row])
+        except IntegrityError:
+            db.session.execute(
+                update(table)
+                .where(*(table.c[k] == row[k] for k in keys))
+                .values({c: row[c] for c in columns})
+            )
+
+
+def insert_or_conflict(table, row=None, columns=None, query=None):
+    """
+    Insert one row unless it violates a unique or primary key constraint, in
+    a single statement (INSERT ... ON CONFLICT DO NOTHING RETURNING on
+    Postgres and SQLite, a savepoint elsewhere). The row is either a dict, or
+    the result of `query` (a SELECT returning at most one row) for `columns`,
+    so that the statement can also validate it: no row selected, no insert.
+
+    Returns:
+        bool: True if the row was inserted, False on conflict or empty SELECT.
+    """
+    table = getattr(table, "__table__", table)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+    else:
+        stmt = insert(table)
+    stmt = stmt.values(row) if query is None else stmt.from_select(columns, query)
+    if dialect in ("postgresql", "sqlite"):
+        key = list(table.primary_key.columns)[0]
+        return db.session.execute(stmt.on_conflict_do_nothing().returning(key)).first() is not None
+    try:
+        with db.session.begin_nested():
+            return db.session.execute(stmt).rowcount > 0
+    except IntegrityError:
+        return False
@@ -0,0 +1,97 @@
+# core/voting.py
+# Set-based close of voting phases: winner, second and initial_votes for many
+# posts from one window-function query, written back with one bulk UPDATE
+
+from sqlalchemy import func, select, update
+from core.extensions import db
+from core.user_stats import apply_duel_roles
+from models import Post, Comment, Vote
+from config import MIN_INITIAL_VOTES, MAX_INITIAL_VOTES
+
+# keeps IN (...) lists and executemany batches a sane size
+CHUNK_SIZE = 500
+
+
+def duel_results(post_ids):
+    """
+    Rank the candidates of each post by votes received. Ties go to the
+    candidate whose first vote came earliest, then to the lower username.
+
+    Returns:
+        dict: {post_id: (winner, winner_votes, second or None)} for every post
+        that has at least one comment and one vote.
+    """
+    tally = (
+        select(
+            Vote.post_id,
+            Vote.candidate,
+            func.count().label("votes"),
+            func.min(Vote.id).label("first_vote"),
+        )
+        .where(
+            Vote.post_id.in_(post_ids),
+            Vote.post_id.in_(select(Comment.post_id).where(Comment.post_id.in_(post_ids))),
+        )
+        .group_by(Vote.post_id, Vote.candidate)
+        .subquery()
+    )
+    ranked = select(
+        tally.c.post_id,
+        tally.c.candidate,
+        tally.c.votes,
+        func.row_number().over(
+            partition_by=tally.c.post_id,
+            order_by=(tally.c.votes.desc(), tally.c.first_vote, tally.c.candidate),
+        ).label("place"),
+    ).subquery()
+    rows = db.session.execute(
+        select(ranked.c.post_id, ranked.c.candidate, ranked.c.votes, ranked.c.place)
+        .where(ranked.c.place <= 2)
+    )
+    results = {}
+    for post_id, candidate, votes, place in rows:
+        winner, winner_votes, second = results.get(post_id, (None, 0, None))
+        if place == 1:
+            results[post_id] = (candidate, votes, second)
+        else:
+            results[post_id] = (winner, winner_votes, candidate)
+    return results
+
+
+def initial_votes_for(winner_votes):
+    return max(min(winner_votes, MAX_INITIAL_VOTES), MIN_INITIAL_VOTES)
+
+
+def finalize_voting_phases(post_ids):
+    """
+    Close the voting phase of every post in `post_ids` that has comments and
+    votes: set winner, second, initial_votes and started, and move the users'
+    win/duel counters to match. Posts without either are left untouched.
+    Does not commit.
+
+    Returns:
+        int: Number of posts finalized.
+    """
+    post_ids = list(post_ids)
+    done = 0
+    for start in range(0, len(post_ids), CHUNK_SIZE):
+        results = duel_results(post_ids[start:start + CHUNK_SIZE])
+        if not results:
+            continue
+        old_roles = db.session.query(Post.id, Post.winner, Post.second).filter(Post.id.in_(results))
+        apply_duel_roles(
+            ((winner, second), (results[post_id][0], results[post_id][2]))
+            for post_id, winner, second in old_roles
+        )
+        db.session.execute(update(Post), [
+            {
+                "id": post_id,
+                "winner": winner,
+                "second": second,
+                "initial_votes": initial_votes_for(winner_votes),
+                "started": True,
+            }
+            for post_id, (winner, winner_votes, second) in results.items()
+        ])
+        done += len(results)
+    return done
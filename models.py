@@ -4,7 +4,8 @@ from datetime import datetime, UTC
 post_tags = db.Table(
     'post_tags',
     db.Column('post_id', db.String, db.ForeignKey('posts.id'), primary_key=True),
-    db.Column('tag_name', db.String, db.ForeignKey('tags.name'), primary_key=True)
+    db.Column('tag_name', db.String, db.ForeignKey('tags.name'), primary_key=True),
+    db.Index('ix_post_tags_tag_name_post_id', 'tag_name', 'post_id')
 )
 
 
@@ -16,6 +17,10 @@ follows = db.Table(
 
 class User(db.Model):
     __tablename__  = 'users'
+    __table_args__ = (
+        # the username index of every worker picks up new users by created_at
+        db.Index('ix_users_created_at', 'created_at'),
+    )
     username       = db.Column(db.String, primary_key=True)
     email          = db.Column(db.String, unique=True, nullable=False)
     password_hash  = db.Column(db.String, nullable=False)
@@ -24,6 +29,8 @@ class User(db.Model):
     bio            = db.Column(db.String, default='')
     email_verified = db.Column(db.Boolean, default=False)
     reset_token = db.Column(db.String, nullable=True)
+    # NULL for users registered before the column existed
+    created_at  = db.Column(db.DateTime, nullable=True, default=lambda: datetime.now(UTC))
 
     comments = db.relationship('Comment', backref='author', lazy=True)
     votes    = db.relationship('Vote',    backref='voter_user', lazy=True)
@@ -38,6 +45,14 @@ class User(db.Model):
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        # like every index on the big tables, built online by a migration
+        # (core.migrations) on an existing database
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_started_voting_deadline', 'started', 'voting_deadline'),
+        db.Index('ix_posts_winner', 'winner'),
+        db.Index('ix_posts_second', 'second'),
+    )
     id        = db.Column(db.String, primary_key=True)
     author    = db.Column(db.String, db.ForeignKey('users.username'), nullable=False)
     body      = db.Column(db.Text,   nullable=False)
@@ -52,16 +67,27 @@ class Post(db.Model):
     duel_completed_by_author = db.Column(db.Boolean, default=False)
     duel_completed_by_winner = db.Column(db.Boolean, default=False)
     completed = db.Column(db.Boolean, default=False)
+    # denormalized counters, maintained by core.counters
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    flag_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    vote_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     comments = db.relationship('Comment', backref='posts', lazy=True)
     votes    = db.relationship('Vote',    backref='posts', lazy=True)
-    flags    = db.relationship('Flag',    backref='posts', lazy=True)
-    likes    = db.relationship('Like',    backref='posts', lazy=True)
+    reactions = db.relationship('Reaction', backref='posts', lazy=True)
     media_urls = db.Column(db.JSON, default=list)
 
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # the vote check looks up (post_id, commenter) on every comment, duel ones
+        # included, which the partial index below cannot serve
+        db.Index('ix_comments_post_id_commenter', 'post_id', 'commenter'),
+        # one regular comment per user and post; duel comments are not limited
+        db.Index('uq_comments_post_commenter', 'post_id', 'commenter', unique=True,
+                 sqlite_where=db.text('is_duel = false'), postgresql_where=db.text('is_duel = false')),
+    )
     id        = db.Column(db.Integer, primary_key=True)
     post_id   = db.Column(db.String,  db.ForeignKey('posts.id'), nullable=False)
     commenter = db.Column(db.String,  db.ForeignKey('users.username'), nullable=False)
@@ -72,6 +98,15 @@ class Comment(db.Model):
 
 class Vote(db.Model):
     __tablename__ = 'votes'
+    __table_args__ = (
+        # serves per-post tallies (GROUP BY candidate) without touching the table
+        db.Index('ix_votes_post_id_candidate', 'post_id', 'candidate'),
+        # one vote per user and post
+        db.Index('uq_votes_post_voter', 'post_id', 'voter', unique=True),
+        # per-user stats (votes cast, votes received per post)
+        db.Index('ix_votes_voter', 'voter'),
+        db.Index('ix_votes_candidate_post_id', 'candidate', 'post_id'),
+    )
     id        = db.Column(db.Integer, primary_key=True)
     post_id   = db.Column(db.String,  db.ForeignKey('posts.id'), nullable=False)
     voter     = db.Column(db.String,  db.ForeignKey('users.username'), nullable=False)
@@ -79,24 +114,49 @@ class Vote(db.Model):
     comment_id = db.Column(db.Integer, db.ForeignKey("comments.id"))
 
 
-class Flag(db.Model):
-    __tablename__ = 'flags'
-    id        = db.Column(db.Integer, primary_key=True)
-    post_id   = db.Column(db.String,  db.ForeignKey('posts.id'), nullable=False)
-    flagger   = db.Column(db.String,  db.ForeignKey('users.username'), nullable=False)
-
-class Like(db.Model):
-    __tablename__ = 'likes'
+class Reaction(db.Model):
+    # a like or a flag on a duel; a user reacts to a post at most once, and
+    # only one way (the unique key is what enforces like-xor-flag)
+    __tablename__ = 'reactions'
+    __table_args__ = (
+        db.Index('uq_reactions_post_user', 'post_id', 'user', unique=True),
+    )
     id        = db.Column(db.Integer, primary_key=True)
     post_id   = db.Column(db.String,  db.ForeignKey('posts.id'), nullable=False)
-    liker     = db.Column(db.String,  db.ForeignKey('users.username'), nullable=False)
+    user      = db.Column(db.String,  db.ForeignKey('users.username'), nullable=False)
+    kind      = db.Column(db.String(8), nullable=False)   # 'like' | 'flag'
 
 class Badge(db.Model):
     __tablename__ = 'badges'
+    __table_args__ = (
+        # one badge of each kind per user; writers insert-or-ignore against it
+        db.Index('uq_badges_user_name', 'user', 'name', unique=True),
+    )
     id   = db.Column(db.Integer, primary_key=True)
     user = db.Column(db.String,  db.ForeignKey('users.username'), nullable=False)
     name = db.Column(db.String,  nullable=False)
 
+class BadgeOutbox(db.Model):
+    __tablename__ = 'badge_outbox'
+    username     = db.Column(db.String, db.ForeignKey('users.username'), primary_key=True)
+    requested_at = db.Column(db.DateTime, nullable=False)
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    version    = db.Column(db.Integer, primary_key=True)
+    name       = db.Column(db.String(80), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False)
+
+class UserStats(db.Model):
+    __tablename__ = 'user_stats'
+    username                     = db.Column(db.String, db.ForeignKey('users.username'), primary_key=True)
+    votes_cast                   = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    distinct_posts_voted         = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    max_votes_received_on_a_post = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    wins                         = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    duels_participated           = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    total_votes_received         = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
 class Tag(db.Model):
     __tablename__ = 'tags'
     name = db.Column(db.String(30), primary_key=True)
@@ -107,3 +167,53 @@ class Tag(db.Model):
         backref=db.backref('tags', lazy='dynamic'),
         lazy='dynamic'
     )
+
+
+class PostTimer(db.Model):
+    __tablename__ = 'post_timers'
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'action', name='uq_post_timers_post_action'),
+        db.Index('ix_post_timers_next_action_at', 'next_action_at'),
+    )
+    id             = db.Column(db.Integer, primary_key=True)
+    post_id        = db.Column(db.String, db.ForeignKey('posts.id'), nullable=False)
+    action         = db.Column(db.String(40), nullable=False)
+    next_action_at = db.Column(db.DateTime, nullable=False)
+    # lease held by the sweeper that claimed the timer
+    claimed_by     = db.Column(db.String(32), nullable=True)
+    claimed_until  = db.Column(db.DateTime, nullable=True)
+
+
+class SchedulerLease(db.Model):
+    __tablename__ = 'scheduler_leases'
+    name       = db.Column(db.String(40), primary_key=True)
+    holder     = db.Column(db.String(120), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class MaintenanceCheckpoint(db.Model):
+    __tablename__ = 'maintenance_checkpoints'
+    name        = db.Column(db.String(80), primary_key=True)
+    last_key    = db.Column(db.JSON, nullable=True)
+    rows_done   = db.Column(db.Integer, default=0, nullable=False)
+    started_at  = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class TagStats(db.Model):
+    __tablename__ = 'tag_stats'
+    __table_args__ = (
+        db.Index('ix_tag_stats_post_count', 'post_count', 'tag_name'),
+    )
+    tag_name   = db.Column(db.String(30), db.ForeignKey('tags.name'), primary_key=True)
+    post_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+
+class TagTrend(db.Model):
+    __tablename__ = 'tag_trends'
+    __table_args__ = (
+        db.Index('ix_tag_trends_period_score', 'period', 'log_score'),
+    )
+    period     = db.Column(db.String(8),  primary_key=True)
+    tag_name   = db.Column(db.String(30), db.ForeignKey('tags.name'), primary_key=True)
+    log_score  = db.Column(db.Float, nullable=False)
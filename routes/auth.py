@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, current_app
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from core.extensions import db
+from core.auth import token_cache
 from models import User
 import uuid
 
@@ -76,6 +77,7 @@ def register():
     )
     db.session.add(user)
     db.session.commit()
+    current_app.extensions["username_index"].add(u)
     return jsonify(status='user registered'), 201
 
 
@@ -121,7 +123,9 @@ def login():
         return jsonify(error='invalid credentials'), 401
     if ph.check_needs_rehash(user.password_hash):
         user.password_hash = ph.hash(p)
-    user.token = uuid.uuid4().hex
+    old_token, user.token = user.token, uuid.uuid4().hex
     db.session.commit()
+    # after the commit, once no request can find the old token in the users table
+    token_cache.invalidate(old_token)
     return jsonify(access_token=user.token), 200
 
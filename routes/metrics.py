@@ -0,0 +1,72 @@
+from flask import Blueprint, jsonify
+from core.leader import election
+from core.metrics import job_metrics
+from core.badges import badge_queue
+from core.engagement import engagement_buffer
+from core.auth import token_cache
+from core.extensions import db, scheduler
+from models import BadgeOutbox
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Background job metrics for this worker process
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: >
+          Per job (scheduler job id, or timer:<action> for post timers):
+          runs, failures, latency and lag (actual start minus scheduled time).
+          Badge evaluations are reported as the "badges" job, their lag being
+          the time since the latest request for it; "badges" also gives the
+          users waiting in this worker's queue and in badge_outbox.
+          engagement.pending counts the likes/flags buffered in this worker
+          and not yet flushed (write-behind mode, flushes reported as the
+          "engagement_flush" job). auth reports this worker's token cache.
+        examples:
+          application/json:
+            scheduler:
+              leader: true
+              pending_jobs: 2
+            badges:
+              queued: 3
+              outbox: 5
+            engagement:
+              pending: 0
+            auth:
+              size: 120
+              capacity: 10000
+              hits: 5230
+              misses: 140
+              evictions: 0
+              hit_ratio: 0.974
+            jobs:
+              timer:finalize_voting_phase:
+                runs: 12
+                failures: 0
+                latency_avg_ms: 8.4
+                latency_max_ms: 21.0
+                latency_last_ms: 6.2
+                lag_avg_ms: 2710.3
+                lag_max_ms: 4980.1
+                lag_last_ms: 1204.9
+                last_run_at: "2025-05-25T10:30:00"
+    """
+    return jsonify({
+        "scheduler": {
+            "leader": election.is_leader,
+            "pending_jobs": len(scheduler.get_jobs()) if scheduler.running else 0,
+        },
+        "badges": {
+            "queued": badge_queue.pending(),
+            "outbox": db.session.query(BadgeOutbox).count(),
+        },
+        "engagement": {"pending": engagement_buffer.pending()},
+        "auth": token_cache.stats(),
+        "jobs": job_metrics.snapshot(),
+    }), 200
@@ -0,0 +1,60 @@
+from flask import Blueprint, request
+from core.responses import error, success
+from core.utils_flag import at_risk_duels
+from core.pagination import parse_limit
+from config import AT_RISK_MARGIN
+
+moderation_bp = Blueprint("moderation", __name__)
+
+
+@moderation_bp.route("/moderation/at_risk", methods=["GET"])
+def get_at_risk_duels():
+    """
+    Active duels close to a flag-driven winner switch
+    ---
+    tags:
+      - Moderation
+    parameters:
+      - name: margin
+        in: query
+        type: number
+        required: false
+        description: Fraction by which the switch thresholds are loosened (default AT_RISK_MARGIN)
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        default: 20
+        description: Maximum number of duels (max 100)
+    responses:
+      200:
+        description: At-risk duels, most flagged first
+        examples:
+          application/json:
+            margin: 0.2
+            duels:
+              - post_id: "abc123"
+                winner: "alice"
+                second: "bob"
+                would_switch: false
+                min_flags_required: 5
+                actual_flags: 9
+                actual_likes: 3
+                initial_votes: 50
+                flag_ratio: 0.145
+                net_score: 44
+                threshold_score: 20.0
+      400:
+        description: Invalid margin or limit
+    """
+    try:
+        margin = float(request.args.get("margin", AT_RISK_MARGIN))
+    except ValueError:
+        return error("margin must be a number", 400)
+    if not 0 <= margin < 1:
+        return error("margin must be between 0 and 1", 400)
+    try:
+        limit = parse_limit(request.args.get("limit"))
+    except ValueError:
+        return error("Invalid 'limit'", 400)
+    return success({"margin": margin, "duels": at_risk_duels(margin, limit)}, 200)
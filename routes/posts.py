@@ -1,54 +1,31 @@
 from flask import Blueprint, request, g, jsonify
-from collections import Counter
 from core.responses import error, success
-from core.extensions import db, scheduler
-from core.utils import award_badge, award_marathoner, evaluate_badges, handle_duel_timeout, extract_media_urls
-from functools import wraps
+from core.extensions import db
+from core.auth import login_required
+from core.jobs import schedule_post_job
+from core.utils import award_badge, handle_duel_timeout, extract_media_urls
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from models import User, Post, Comment, Vote, Like, Flag, Badge, Tag
-from core.utils_flag import evaluate_flags_and_maybe_switch, compute_flag_status
+from sqlalchemy import func, tuple_, select, literal
+from models import Post, Comment, Vote, Reaction, Badge
+from core.utils_flag import evaluate_flags_and_maybe_switch
+from core.counters import bump_post_counters
+from core.utils_sql import insert_or_conflict
+from core.migrations import unique_keys_enforced
+from core.tags import attach_tags
+from core.trending import trending
+from core.pagination import encode_cursor, decode_time_cursor, parse_limit
+from core.read_models import load_post_status, load_post_comments
+from core.voting import finalize_voting_phases
+from core.user_stats import ensure_user_stats, record_vote, record_unvote, apply_duel_roles
+from core.badges import badge_queue, request_badge_evaluation
+from core.engagement import engagement_buffer
 from config import MIN_INITIAL_VOTES, MAX_INITIAL_VOTES
 
 posts_bp = Blueprint("posts", __name__)
 
-def login_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        parts = request.headers.get("Authorization", "").split()
-        if len(parts) != 2 or parts[0] != "Bearer":
-            return error("authorization required", 401)
-        token = parts[1]
-        user = User.query.filter_by(token=token).first()
-        if not user:
-            return error("invalid token", 401)
-        g.current_user = user
-        return f(*args, **kwargs)
-    return wrapper
-
 def finalize_voting_phase(post_id):
-    post = db.session.get(Post, post_id)
-    if not post:
-        return
-    commenters = Comment.query.filter_by(post_id=post_id).all()
-    if not commenters:
-        return
-    votes = Vote.query.filter_by(post_id=post_id).all()
-    if not votes:
-        return
-    tally = {}
-    for v in votes:
-        tally[v.candidate] = tally.get(v.candidate, 0) + 1
-    ranking = sorted(tally.items(), key=lambda x: x[1], reverse=True)
-    winner, winner_count = ranking[0]
-    second = ranking[1][0] if len(ranking) > 1 else None
-    iv = max(min(winner_count, MAX_INITIAL_VOTES), MIN_INITIAL_VOTES)
-
-    post.winner = winner
-    post.second = second
-    post.initial_votes = iv
-    post.started = True 
-    db.session.commit()
+    # timer actions do not commit: sweep_timers does, with the timer's deletion
+    finalize_voting_phases([post_id])
 
 @posts_bp.route("/create_post/<post_id>", methods=["POST"])
 @login_required
@@ -121,16 +98,11 @@ def create_post(post_id):
     db.session.add(post)
 
     tag_names = extract_tags(body)
-    for name in tag_names:
-        tag = db.session.get(Tag, name.lower())
-        if not tag:
-            tag = Tag(name=name.lower())
-            db.session.add(tag)
-        post.tags.append(tag)
+    normalized_tags = attach_tags(post, tag_names)
+    schedule_post_job(finalize_voting_phase, post_id, voting_deadline)
 
     db.session.commit()
-
-    scheduler.add_job(finalize_voting_phase, 'date', run_date=voting_deadline, args=[post_id])
+    trending.record(normalized_tags)
 
     return success({"status": "Post created.", "tags": tag_names, "media": media_urls, "voting_deadline": voting_deadline.isoformat()}, 200)
 
@@ -188,9 +160,9 @@ def schedule_duel(post_id):
 
     start_time = datetime.now() + timedelta(hours=start_in)
     post.duel_start_time = start_time
+    schedule_post_job(start_duel_officially, post_id, start_time)
     db.session.commit()
 
-    scheduler.add_job(start_duel_officially, 'date', run_date=start_time, args=[post_id])
     return success({"status": "Duel scheduled.", "duel_start_time": start_time.isoformat()}, 200)
 
 
@@ -200,7 +172,6 @@ def start_duel_officially(post_id):
         return
     post.started = True
     post.postponed = False
-    db.session.commit()
 
 
 @posts_bp.route("/comment/<post_id>", methods=["POST"])
@@ -259,12 +230,14 @@ def add_comment(post_id):
     if not text:
         return error("Field 'text' is required.", 400)
 
-    existing = Comment.query.filter_by(post_id=post_id, commenter=commenter, is_duel=False).first()
-    if existing:
+    # the partial unique index on (post_id, commenter) rejects a second comment;
+    # until its migration has run the comment is looked up first
+    if not unique_keys_enforced() and db.session.query(Comment.id).filter_by(
+        post_id=post_id, commenter=commenter, is_duel=False
+    ).first():
+        return error(f"User '{commenter}' has already commented.", 403)
+    if not insert_or_conflict(Comment, {"post_id": post_id, "commenter": commenter, "text": text, "is_duel": False}):
         return error(f"User '{commenter}' has already commented.", 403)
-
-    comment = Comment(post_id=post_id, commenter=commenter, text=text, is_duel=False)
-    db.session.add(comment)
     db.session.commit()
     return success({"status": "Comment added."}, 200)
 
@@ -307,25 +280,29 @@ def vote(post_id):
       404:
         description: Post not found
     """
-    post = db.session.get(Post, post_id)
-    if not post:
-        return error("Post not found.", 404)
     voter = g.current_user.username
     candidate = request.json.get("candidate")
-    comment = Comment.query.filter_by(post_id=post_id, commenter=candidate).first()
-    if not Comment.query.filter_by(post_id=post_id, commenter=candidate).first():
-        return error(f"Candidate '{candidate}' has not commented.", 400)
-    if Vote.query.filter_by(post_id=post_id, voter=voter).first():
+    if not unique_keys_enforced() and db.session.query(Vote.id).filter_by(post_id=post_id, voter=voter).first():
         return error(f"User '{voter}' has already voted.", 400)
-    db.session.add(Vote(post_id=post_id, voter=voter, candidate=candidate, comment_id=comment.id))
-    db.session.commit()
-    award_badge(voter, "First Responder")
-    total_votes = Vote.query.filter_by(candidate=candidate).count()
-    if total_votes >= 10:
-        award_badge(candidate, "Popular Debater")
-        db.session.commit()
-    evaluate_badges(voter)
+    ensure_user_stats([voter, candidate])
+    # one statement: inserts only if the candidate commented (which also proves
+    # the post exists) and the unique (post_id, voter) key lets it through
+    candidate_comment = (
+        select(literal(post_id), literal(voter), literal(candidate), func.min(Comment.id))
+        .where(Comment.post_id == post_id, Comment.commenter == candidate)
+        .having(func.count(Comment.id) > 0)
+    )
+    if not insert_or_conflict(Vote, columns=["post_id", "voter", "candidate", "comment_id"], query=candidate_comment):
+        if not db.session.get(Post, post_id):
+            return error("Post not found.", 404)
+        if not db.session.query(Comment.id).filter_by(post_id=post_id, commenter=candidate).first():
+            return error(f"Candidate '{candidate}' has not commented.", 400)
+        return error(f"User '{voter}' has already voted.", 400)
+    bump_post_counters(post_id, vote_count=1)
+    record_vote(voter, post_id, candidate)
+    request_badge_evaluation([voter, candidate])
     db.session.commit()
+    badge_queue.submit([voter, candidate])
     return success({"message": f"{voter} voted for {candidate}"}, 200)
 
 @posts_bp.route("/unvote/<post_id>", methods=["POST"])
@@ -352,7 +329,10 @@ def unvote(post_id):
     vote = Vote.query.filter_by(post_id=post_id, voter=g.current_user.username).first()
     if not vote:
         return error("No existing vote to revoke", 404)
+    ensure_user_stats([vote.voter, vote.candidate])
     db.session.delete(vote)
+    bump_post_counters(post_id, vote_count=-1)
+    record_unvote(vote.voter, vote.candidate)
     db.session.commit()
     return success({"status": "Vote revoked"}, 200)
 
@@ -399,26 +379,19 @@ def start_duel(post_id):
 
     iv = max(min(winner_count, MAX_INITIAL_VOTES), MIN_INITIAL_VOTES)
 
+    apply_duel_roles([((post.winner, post.second), (winner, second))])
     post.winner = winner
     post.second = second
     post.initial_votes = iv
     post.started = True
     post.postponed = False
     post.duel_start_time = datetime.now()
-    db.session.commit()
-
-    scheduler.add_job(
-        handle_duel_timeout,
-        'date',
-        run_date=datetime.now() + timedelta(hours=2),
-        args=[post_id]
-    )
-
+    schedule_post_job(handle_duel_timeout, post_id, datetime.now() + timedelta(hours=2))
+    request_badge_evaluation([winner, second])
     award_badge(winner, "Baptism of Fire")
-    award_marathoner(winner)
-    evaluate_badges(winner)
-
     db.session.commit()
+
+    badge_queue.submit([winner, second])
     return success({
         "status": "Duel started.",
         "winner": winner,
@@ -446,61 +419,10 @@ def get_status(post_id):
         description: Post not found
     """
 
-    post = db.session.get(Post, post_id)
-    if not post:
+    status = load_post_status(post_id)
+    if status is None:
         return error("Post not found.", 404)
-
-    flag_analysis = compute_flag_status(post)
-    now = datetime.now()
-    countdown = 0
-    if post.voting_deadline:
-        remaining = (post.voting_deadline - now).total_seconds()
-        countdown = max(int(remaining), 0)
-    like_users = [l.liker for l in Like.query.filter_by(post_id=post_id).all()]
-    flag_users = [f.flagger for f in Flag.query.filter_by(post_id=post_id).all()]
-    votes = Vote.query.filter_by(post_id=post_id).all()
-    ranking = Counter(v.candidate for v in votes)
-    comments = Comment.query.filter_by(post_id=post_id).all()
-    author_user = User.query.get(post.author)
-    author_avatar = author_user.avatar_url if author_user else ""
-    comment_list = []
-    for c in comments:
-        # prendi anche l’avatar per ciascun commento
-        commenter_user = User.query.get(c.commenter)
-        comment_list.append({
-            "commenter": c.commenter,
-            "commenter_avatar": commenter_user.avatar_url if commenter_user else "",
-            "text": c.text,
-            "votes": Vote.query.filter_by(post_id=post_id, candidate=c.commenter).count()
-        })
-    
-
-    return success({
-        "id": post.id,
-        "author": post.author,
-        "author_avatar": author_avatar,
-        "body": post.body,
-        "winner": post.winner,
-        "second": post.second,
-        "started": post.started,
-        "postponed": post.postponed,
-        "media": post.media_urls,
-        "voting_deadline": post.voting_deadline.isoformat() if post.voting_deadline else None,
-        "voting_ends_in": countdown,
-        "likes": len(like_users),
-        "flags": len(flag_users),
-        "like_users": like_users,
-        "flag_users": flag_users,
-        "ranking": dict(ranking),
-        "comments": comment_list,
-        "flag_analysis": flag_analysis,
-        "duel_completed_by_author": post.duel_completed_by_author,
-        "duel_completed_by_winner": post.duel_completed_by_winner,
-        "completed": post.completed,
-        "created_at":    post.created_at.isoformat()
-
-
-    }, 200)
+    return success(status, 200)
 
 
 
@@ -549,23 +471,73 @@ def get_comments(post_id):
         type: string
         required: true
         description: ID of the post
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum number of voters returned per comment (all when omitted)
+      - name: comment_id
+        in: query
+        type: integer
+        required: false
+        description: Return only this comment (to page through its voters)
+      - name: after
+        in: query
+        type: string
+        required: false
+        description: With comment_id, return only voters after this username (the comment's 'voters_next')
     responses:
       200:
         description: List of comments with votes
+      400:
+        description: Invalid 'limit' or 'comment_id', or 'after' without 'comment_id'
       404:
-        description: Post not found
+        description: Post or comment not found
     """
     if not db.session.get(Post, post_id):
         return error("Post not found.", 404)
-    comments = Comment.query.filter_by(post_id=post_id, is_duel=False).all()
-    data = [{
-        "commenter": c.commenter,
-        "text": c.text,
-        "votes": Vote.query.filter_by(post_id=post_id, candidate=c.commenter).count(),
-        "voters": [v.voter for v in c.votes_rel.all()]
-    } for c in comments]
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return error("Invalid 'limit'", 400)
+        if limit < 1:
+            return error("Invalid 'limit'", 400)
+    comment_id = request.args.get("comment_id")
+    if comment_id is not None:
+        try:
+            comment_id = int(comment_id)
+        except ValueError:
+            return error("Invalid 'comment_id'", 400)
+    after = request.args.get("after")
+    if after and comment_id is None:
+        return error("'after' needs a 'comment_id'", 400)
+    data = load_post_comments(post_id, voters_limit=limit, comment_id=comment_id, voters_after=after)
+    if comment_id is not None and not data:
+        return error("Comment not found.", 404)
     return success({"comments": data}, 200)
 
+def existing_reaction(post_id, user, kind):
+    """'duplicate' or 'opposite', for a `kind` reaction whose insert hit the unique key."""
+    existing = db.session.query(Reaction.kind).filter_by(post_id=post_id, user=user).scalar()
+    return "duplicate" if existing == kind else "opposite"
+
+def reaction_error(kind, outcome, user):
+    messages = {
+        "like": {
+            "duplicate": f"User '{user}' has already liked this post.",
+            "own": "Authors and winners cannot like.",
+            "opposite": "Non puoi mettere like dopo aver flaggato questo post.",
+        },
+        "flag": {
+            "duplicate": f"User '{user}' has already flagged this post.",
+            "own": "Authors and winners cannot flag.",
+            "opposite": "Non puoi mettere flag dopo aver messo like a questo post.",
+        },
+    }
+    return error(messages[kind][outcome], 403)
+
 @posts_bp.route("/like/<post_id>", methods=["POST"])
 @login_required
 def like(post_id):
@@ -590,25 +562,29 @@ def like(post_id):
       404:
         description: Post not found
     """
-   
+    liker = g.current_user.username
+    if engagement_buffer.enabled:
+        outcome = engagement_buffer.react("like", post_id, liker)
+        if outcome == "ok":
+            return success({"status": "Like registered"}, 200)
+        if outcome is not None:
+            return reaction_error("like", outcome, liker)
+
     post = db.session.get(Post, post_id)
-    if post.completed:
-      return error("Post is completed. No more voting allowed.", 403)
-   
     if not post:
         return error("Post not found.", 404)
-    liker = g.current_user.username
-    if Like.query.filter_by(post_id=post_id, liker=liker).first():
-        return error(f"User '{liker}' has already liked this post.", 403)
+    if post.completed:
+      return error("Post is completed. No more voting allowed.", 403)
     if not post.winner:
         return error("Post has no winner yet.", 400)
     if liker in (post.author, post.winner):
-        return error("Authors and winners cannot like.", 403)
-    if Flag.query.filter_by(post_id=post_id, flagger=liker).first():
-      return error(f"Non puoi mettere like dopo aver flaggato questo post.", 403)
-
-    new_like = Like(post_id=post_id, liker=liker)
-    db.session.add(new_like)
+        return reaction_error("like", "own", liker)
+    # the unique (post_id, user) key rejects a second like and a like after a flag
+    if not unique_keys_enforced() and db.session.query(Reaction.id).filter_by(post_id=post_id, user=liker).first():
+        return reaction_error("like", existing_reaction(post_id, liker, "like"), liker)
+    if not insert_or_conflict(Reaction, {"post_id": post_id, "user": liker, "kind": "like"}):
+        return reaction_error("like", existing_reaction(post_id, liker, "like"), liker)
+    bump_post_counters(post_id, like_count=1)
     db.session.commit()
     return success({"status": "Like registered"}, 200)
 
@@ -638,6 +614,28 @@ def flag(post_id):
       404:
         description: Post not found
     """
+    flagger = g.current_user.username
+    if engagement_buffer.enabled:
+        outcome = engagement_buffer.react("flag", post_id, flagger)
+        if outcome == "ok":
+            return success({"status": "Flag registered."}, 200)
+        if outcome == "switch":
+            # the buffered counts cross the thresholds: switch on the flushed rows
+            try:
+                engagement_buffer.flush()
+            except Exception as exc:
+                # the flag is in the journal; the next flush writes it and
+                # flag_sweep makes the switch
+                print(f"[ENGAGEMENT] flush before a switch failed: {exc}")
+                return success({"status": "Flag registered."}, 200)
+            switched, old, new = evaluate_flags_and_maybe_switch(db.session.get(Post, post_id))
+            engagement_buffer.forget(post_id)
+            if switched:
+                return success({"status": "Winner switched.", "old": old, "new": new}, 200)
+            return success({"status": "Flag registered."}, 200)
+        if outcome is not None:
+            return reaction_error("flag", outcome, flagger)
+
     post = db.session.get(Post, post_id)
     if not post:
       return error("Post not found.", 404)
@@ -649,22 +647,16 @@ def flag(post_id):
     if not post.started:
         return error("Duel has not started yet.", 400)
     
-    flagger = g.current_user.username
-
-    if Flag.query.filter_by(post_id=post_id, flagger=flagger).first():
-        return error(f"User '{flagger}' has already flagged this post.", 403)
-    
     if not post.winner:
         return error("Post has no winner yet.", 400)
     
     if flagger in (post.author, post.winner):
-        return error("Authors and winners cannot flag.", 403)
-    if Like.query.filter_by(post_id=post_id, liker=flagger).first():
-      return error(f"Non puoi mettere flag dopo aver messo like a questo post.", 403)
-
-    
-    new_flag = Flag(post_id=post_id, flagger=flagger)
-    db.session.add(new_flag)
+        return reaction_error("flag", "own", flagger)
+    if not unique_keys_enforced() and db.session.query(Reaction.id).filter_by(post_id=post_id, user=flagger).first():
+        return reaction_error("flag", existing_reaction(post_id, flagger, "flag"), flagger)
+    if not insert_or_conflict(Reaction, {"post_id": post_id, "user": flagger, "kind": "flag"}):
+        return reaction_error("flag", existing_reaction(post_id, flagger, "flag"), flagger)
+    bump_post_counters(post_id, flag_count=1)
     db.session.commit()
     
     switched, old, new = evaluate_flags_and_maybe_switch(post)
@@ -777,17 +769,75 @@ def complete_duel(post_id):
         "by_winner": post.duel_completed_by_winner
     }, 200)
 
+POST_STATES = {
+    "voting": (Post.started == False, Post.completed == False),
+    "duel": (Post.started == True, Post.completed == False),
+    "completed": (Post.completed == True,),
+}
+
 @posts_bp.route("/posts", methods=["GET"])
 def list_posts():
     """
-    List posts, optionally filtered by type (e.g. completed)
+    List posts, newest first, one page at a time
+    ---
+    tags:
+      - Posts
+    parameters:
+      - name: type
+        in: query
+        type: string
+        enum: [completed]
+        required: false
+        description: Legacy filter, same as state=completed
+      - name: state
+        in: query
+        type: string
+        enum: [voting, duel, completed]
+        required: false
+        description: Only return posts in this phase
+      - name: limit
+        in: query
+        type: integer
+        default: 20
+        description: Page size (max 100)
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: The 'next_cursor' returned by the previous page
+    responses:
+      200:
+        description: One page of posts; next_cursor is null on the last page
+      400:
+        description: Invalid state, limit or cursor
     """
-    post_type = request.args.get("type")
-
-    if post_type == "completed":
-        posts = Post.query.filter_by(completed=True).order_by(Post.created_at.desc()).all()
-    else:
-        posts = Post.query.order_by(Post.created_at.desc()).all()
+    state = request.args.get("state")
+    if request.args.get("type") == "completed":
+        state = "completed"
+    if state and state not in POST_STATES:
+        return error(f"Invalid 'state'. Use one of: {', '.join(POST_STATES)}", 400)
+    try:
+        limit = parse_limit(request.args.get("limit"))
+    except ValueError:
+        return error("Invalid 'limit'", 400)
+
+    query = Post.query
+    if state:
+        query = query.filter(*POST_STATES[state])
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            created_at, last_id = decode_time_cursor(cursor)
+        except ValueError:
+            return error("Invalid 'cursor'", 400)
+        query = query.filter(tuple_(Post.created_at, Post.id) < (created_at, last_id))
+
+    posts = query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id)
 
     data = [{
         "id": p.id,
@@ -798,4 +848,4 @@ def list_posts():
         "completed": p.completed
     } for p in posts]
 
-    return success({"posts": data}, 200)
+    return success({"posts": data, "next_cursor": next_cursor}, 200)
@@ -1,8 +1,8 @@
 import os
 from flask import Blueprint, jsonify, request, g
-from models import User
+from models import User, follows
 from core.extensions import db
-from functools import wraps
+from core.auth import login_required
 from werkzeug.utils import secure_filename
 
 UPLOAD_FOLDER = "static/avatars"
@@ -10,20 +10,6 @@ ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 
 profile_bp = Blueprint("profile", __name__)
 
-def login_required(fn):
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        parts = request.headers.get("Authorization", "").split()
-        if len(parts) != 2 or parts[0] != "Bearer":
-            return jsonify(error="authorization required"), 401
-        token = parts[1]
-        user = User.query.filter_by(token=token).first()
-        if not user:
-            return jsonify(error="invalid token"), 401
-        g.current_user = user
-        return fn(*args, **kwargs)
-    return wrapper
-
 @profile_bp.route("/profile", methods=["GET"])
 @login_required
 def get_profile():
@@ -38,7 +24,7 @@ def get_profile():
       200:
         description: Profile data
     """
-    user = g.current_user
+    user = db.session.get(User, g.current_user.username)
     return jsonify({
         "username": user.username,
         "avatar_url": user.avatar_url,
@@ -202,7 +188,7 @@ def follow_user(username):
       409:
         description: Already following
     """
-    me = g.current_user
+    me = db.session.get(User, g.current_user.username)
     target = db.session.get(User, username)
     if not target:
         return jsonify({"error": "User not found."}), 404
@@ -239,7 +225,7 @@ def unfollow_user(username):
       409:
         description: Not currently following
     """
-    me = g.current_user
+    me = db.session.get(User, g.current_user.username)
     target = db.session.get(User, username)
     if not target:
         return jsonify({"error": "User not found."}), 404
@@ -265,7 +251,8 @@ def get_followers():
       200:
         description: List of followers
     """
-    return jsonify({"followers": [u.username for u in g.current_user.followers]}), 200
+    rows = db.session.query(follows.c.follower).filter(follows.c.followed == g.current_user.username)
+    return jsonify({"followers": [u for (u,) in rows]}), 200
 
 @profile_bp.route("/following", methods=["GET"])
 @login_required
@@ -281,4 +268,5 @@ def get_following():
       200:
         description: List of followed users
     """
-    return jsonify({"following": [u.username for u in g.current_user.following]}), 200
+    rows = db.session.query(follows.c.followed).filter(follows.c.follower == g.current_user.username)
+    return jsonify({"following": [u for (u,) in rows]}), 200
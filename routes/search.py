@@ -1,9 +1,68 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from datetime import datetime
+from sqlalchemy import tuple_
+from core.pagination import encode_cursor, decode_cursor, parse_limit
+from core.search_index import LikeSearchBackend, search_terms
 from models import User, Post
 
 search_bp = Blueprint("search", __name__)
 
+
+def _search_posts(q, author, sort_order, limit, cursor):
+    """
+    Return (posts, snippets, next_cursor) for the post half of /search.
+    Relevance order goes through the full-text backend; asc/desc order by
+    creation time and only use the backend to filter.
+    """
+    backend = current_app.extensions.get("search_backend") or LikeSearchBackend()
+    terms = search_terms(q)
+    after = None
+    if cursor:
+        mode, first, last_id = decode_cursor(cursor, 3)
+        if mode != sort_order:
+            raise ValueError("Cursor does not match sort order")
+        if not isinstance(last_id, str):
+            raise ValueError("Invalid cursor")
+        try:
+            after = (float(first), last_id) if mode == "relevance" else (datetime.fromisoformat(first), last_id)
+        except (TypeError, ValueError) as exc:
+            raise ValueError("Invalid cursor") from exc
+
+    if sort_order == "relevance":
+        ranked = backend.search(terms, limit + 1, author=author, after=after)
+        by_id = {p.id: p for p in Post.query.filter(Post.id.in_([pid for pid, _ in ranked]))}
+        ranked = [(by_id[pid], score) for pid, score in ranked if pid in by_id]
+        next_cursor = None
+        if len(ranked) > limit:
+            ranked = ranked[:limit]
+            next_cursor = encode_cursor("relevance", ranked[-1][1], ranked[-1][0].id)
+        posts = [p for p, _ in ranked]
+    else:
+        query = Post.query
+        if terms:
+            query = query.filter(Post.id.in_(backend.matching(terms)))
+        elif q:
+            query = query.filter(Post.body.ilike(f"%{q}%"))
+        if author:
+            query = query.filter(Post.author == author)
+        key = tuple_(Post.created_at, Post.id)
+        if sort_order == "asc":
+            if after:
+                query = query.filter(key > after)
+            query = query.order_by(Post.created_at.asc(), Post.id.asc())
+        else:
+            if after:
+                query = query.filter(key < after)
+            query = query.order_by(Post.created_at.desc(), Post.id.desc())
+        posts = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            next_cursor = encode_cursor(sort_order, posts[-1].created_at, posts[-1].id)
+
+    snippets = backend.highlight(terms, posts) if terms else {}
+    return posts, snippets, next_cursor
+
 @search_bp.route("/search", methods=["GET"])
 def search():
     """
@@ -36,9 +95,14 @@ def search():
       - name: sort
         in: query
         type: string
-        enum: [asc, desc]
-        default: desc
-        description: Sort order for posts
+        enum: [relevance, asc, desc]
+        default: relevance
+        description: Post order; relevance needs a query and falls back to desc without one
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: The 'next_cursor' returned by the previous page of posts
     responses:
       200:
         description: Search results
@@ -49,48 +113,108 @@ def search():
               - id: "123"
                 author: "bob"
                 body: "example post"
+                snippet: "example <mark>post</mark>"
                 media: []
+            next_cursor: null
       400:
-        description: Missing query parameter
+        description: Missing query parameter, invalid limit or cursor
     """
     q = request.args.get("q", "").strip()
     search_type = request.args.get("type", "all")
     author_filter = request.args.get("author")
-    limit = min(int(request.args.get("limit", 10)), 100)
+    try:
+        limit = parse_limit(request.args.get("limit"), default=10)
+    except ValueError:
+        return jsonify({"error": "Invalid 'limit'"}), 400
 
     if not q and search_type == "user":
         return jsonify({"error": "Missing query parameter 'q' for user search"}), 400
 
-    results = {"users": [], "posts": []}
+    results = {"users": [], "posts": [], "next_cursor": None}
 
     if search_type in ("all", "user"):
         users = User.query.filter(User.username.ilike(f"%{q}%")).limit(limit).all()
         results["users"] = [u.username for u in users]
 
     if search_type in ("all", "post"):
-        query = Post.query.filter(Post.body.ilike(f"%{q}%"))
-        if author_filter:
-            query = query.filter(Post.author == author_filter)
-        sort_order = request.args.get("sort", "desc").lower()
-        if sort_order == "asc":
-            query = query.order_by(Post.created_at.asc())
-        else:
-            query = query.order_by(Post.created_at.desc())
+        default_sort = "relevance" if search_terms(q) else "desc"
+        sort_order = request.args.get("sort", default_sort).lower()
+        if sort_order == "relevance" and not search_terms(q):
+            sort_order = "desc"
+        elif sort_order not in ("relevance", "asc"):
+            sort_order = "desc"
+        try:
+            posts, snippets, results["next_cursor"] = _search_posts(
+                q, author_filter, sort_order, limit, request.args.get("cursor")
+            )
+        except ValueError:
+            return jsonify({"error": "Invalid 'cursor'"}), 400
 
-        posts = query.limit(limit).all()
-
-    results["posts"] = [
-        {
-            "id": p.id,
-            "author": p.author,
-            "body": p.body,
-            "media": p.media_urls,
-            "winner": p.winner,
-            "second": p.second,
-            "voting_ends_in": max(int((p.voting_deadline - datetime.now()).total_seconds()), 0) if p.voting_deadline else None,
-            "created_at":    p.created_at.isoformat()
-        }
+        results["posts"] = [
+            {
+                "id": p.id,
+                "author": p.author,
+                "body": p.body,
+                "snippet": snippets.get(p.id),
+                "media": p.media_urls,
+                "winner": p.winner,
+                "second": p.second,
+                "voting_ends_in": max(int((p.voting_deadline - datetime.now()).total_seconds()), 0) if p.voting_deadline else None,
+                "created_at":    p.created_at.isoformat()
+            }
             for p in posts
         ]
 
     return jsonify(results), 200
+
+
+@search_bp.route("/search/users", methods=["GET"])
+def autocomplete_users():
+    """
+    Username autocomplete served from the in-memory username index
+    ---
+    tags:
+      - Search
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Username prefix (or fragment in substring mode)
+      - name: mode
+        in: query
+        type: string
+        enum: [prefix, substring]
+        default: prefix
+        description: substring needs USERNAME_SUBSTRING_INDEX enabled
+      - name: limit
+        in: query
+        type: integer
+        default: 10
+        description: Maximum number of usernames (max 100)
+    responses:
+      200:
+        description: Matching usernames, alphabetically
+        examples:
+          application/json:
+            users: ["alice", "alicia"]
+      400:
+        description: Missing q, invalid limit or unsupported mode
+    """
+    q = request.args.get("q", "").strip()
+    mode = request.args.get("mode", "prefix")
+    if not q:
+        return jsonify({"error": "Missing query parameter 'q'"}), 400
+    try:
+        limit = parse_limit(request.args.get("limit"), default=10)
+    except ValueError:
+        return jsonify({"error": "Invalid 'limit'"}), 400
+
+    index = current_app.extensions["username_index"]
+    if mode == "prefix":
+        users = index.prefix(q, limit)
+    elif mode == "substring" and index.substring_enabled:
+        users = index.substring(q, limit)
+    else:
+        return jsonify({"error": f"Unsupported mode '{mode}'"}), 400
+    return jsonify({"users": users}), 200
@@ -1,7 +1,11 @@
 import re
 from flask import Blueprint, jsonify, request
+from sqlalchemy import tuple_
 from core.extensions import db
-from models import Post, Tag
+from core.pagination import encode_cursor, decode_time_cursor, parse_limit
+from core.tags import tag_post_count, popular_tags
+from core.trending import trending, WINDOWS
+from models import Post, Tag, post_tags
 
 tag_bp = Blueprint("tag", __name__)
 
@@ -11,10 +15,55 @@ def extract_tags(text):
     """Estrae tag validi da un testo."""
     return list(set(TAG_REGEX.findall(text)))
 
+@tag_bp.route("/tags/trending", methods=["GET"])
+def list_trending_tags():
+    """
+    List tags ranked by time-decayed usage
+    ---
+    tags:
+      - Tags
+    parameters:
+      - name: window
+        in: query
+        type: string
+        enum: ["1h", "24h", "7d"]
+        default: "24h"
+        description: Decay window; each use weighs exp(-age / window)
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        default: 20
+        description: Maximum number of tags to return (max 100)
+    responses:
+      200:
+        description: Tags sorted by decayed score
+        examples:
+          application/json:
+            - name: "python"
+              score: 3.72
+            - name: "flask"
+              score: 1.05
+      400:
+        description: Invalid window or limit
+    """
+    window = request.args.get("window", "24h")
+    if window not in WINDOWS:
+        return jsonify({"error": "Invalid 'window'"}), 400
+    try:
+        limit = parse_limit(request.args.get("limit"))
+    except ValueError:
+        return jsonify({"error": "Invalid 'limit'"}), 400
+    return jsonify([
+        {"name": name, "score": round(score, 4)}
+        for name, score in trending.top(window, limit)
+    ]), 200
+
+
 @tag_bp.route("/tags/<tag_name>", methods=["GET"])
 def get_posts_by_tag(tag_name):
     """
-    Retrieve posts associated with a specific tag
+    Retrieve posts associated with a specific tag, newest first
     ---
     tags:
       - Tags
@@ -24,9 +73,19 @@ def get_posts_by_tag(tag_name):
         type: string
         required: true
         description: Name of the tag to search for
+      - name: limit
+        in: query
+        type: integer
+        default: 20
+        description: Page size (max 100)
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: The 'next_cursor' returned by the previous page
     responses:
       200:
-        description: List of posts using the tag
+        description: One page of posts using the tag; count is the total for the tag
         examples:
           application/json:
             tag: "python"
@@ -37,16 +96,42 @@ def get_posts_by_tag(tag_name):
                 body: "Let's talk about #python"
                 media: []
                 created_at: "2025-05-25T10:30:00"
+            next_cursor: null
+      400:
+        description: Invalid limit or cursor
       404:
         description: Tag not found
     """
-    tag = Tag.query.filter_by(name=tag_name.lower()).first()
-    if not tag:
+    name = tag_name.lower()
+    if not db.session.get(Tag, name):
         return jsonify({"error": "Tag not found"}), 404
-    posts = tag.posts.order_by(Post.created_at.desc()).all()
+    try:
+        limit = parse_limit(request.args.get("limit"))
+    except ValueError:
+        return jsonify({"error": "Invalid 'limit'"}), 400
+
+    query = (
+        Post.query
+        .join(post_tags, post_tags.c.post_id == Post.id)
+        .filter(post_tags.c.tag_name == name)
+    )
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            created_at, last_id = decode_time_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid 'cursor'"}), 400
+        query = query.filter(tuple_(Post.created_at, Post.id) < (created_at, last_id))
+
+    posts = query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id)
+
     return jsonify({
         "tag": tag_name,
-        "count": len(posts),
+        "count": tag_post_count(name),
         "posts": [
             {
                 "id": p.id,
@@ -56,7 +141,8 @@ def get_posts_by_tag(tag_name):
                 "created_at": p.created_at.isoformat()
             }
             for p in posts
-        ]
+        ],
+        "next_cursor": next_cursor
     }), 200
 
 
@@ -83,15 +169,13 @@ def list_popular_tags():
               count: 12
             - name: "flask"
               count: 8
+      400:
+        description: Invalid limit
     """
-    limit = min(int(request.args.get("limit", 20)), 100)
-    tags = (
-        db.session.query(Tag.name, db.func.count().label("count"))
-        .join(Tag.posts)
-        .group_by(Tag.name)
-        .order_by(db.func.count().desc())
-        .limit(limit)
-        .all()
-    )
+    try:
+        limit = parse_limit(request.args.get("limit"))
+    except ValueError:
+        return jsonify({"error": "Invalid 'limit'"}), 400
+    tags = popular_tags(limit)
     return jsonify([{"name": name, "count": count} for name, count in tags]), 200
 
@@ -0,0 +1,169 @@
+# scripts/bench_indexes.py
+# Endpoint latency before and after the indexes of the index migrations (1-3).
+#
+#   python -m scripts.bench_indexes --posts 100000
+#
+# Seeds a throw-away SQLite file (or --database-url to point at Postgres) with
+# users, duels, comments and votes, reverts migrations 3, 2 and 1, times each
+# endpoint through the test client, applies them again and repeats. Without
+# the unique keys of migration 2 the write paths look for an existing row
+# first, as they did before them.
+# POST /vote is timed for users without a user_stats row, so each call also
+# computes the voter's and the candidate's stats from votes and posts.
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import create_app
+from core.extensions import db
+from core.migrations import MIGRATIONS, apply_migration, revert_migration
+from models import User, Post, Comment, Vote
+
+COMMENTS_PER_POST = 5
+VOTES_PER_POST = 10
+
+
+def seed(users, posts, batch=20000):
+    rng = random.Random(42)
+    names = [f"u{i}" for i in range(users)]
+    for start in range(0, users, batch):
+        db.session.execute(insert(User), [
+            {"username": n, "email": f"{n}@example.com", "password_hash": "x", "token": f"token-{n}"}
+            for n in names[start:start + batch]
+        ])
+    base = datetime(2024, 1, 1)
+    comment_id = 0
+    for start in range(0, posts, batch):
+        post_rows, comment_rows, vote_rows = [], [], []
+        for i in range(start, min(start + batch, posts)):
+            author, *commenters = rng.sample(names, COMMENTS_PER_POST + 1)
+            pid = f"p{i}"
+            post_rows.append({
+                "id": pid, "author": author, "body": f"debate number {i}", "started": True,
+                "winner": commenters[0], "second": commenters[1], "created_at": base + timedelta(seconds=i),
+                "media_urls": [],
+            })
+            ids = {}
+            for c in commenters:
+                comment_id += 1
+                ids[c] = comment_id
+                comment_rows.append({"id": comment_id, "post_id": pid, "commenter": c, "text": "x", "is_duel": False})
+            for voter in rng.sample(names, VOTES_PER_POST):
+                candidate = rng.choice(commenters)
+                vote_rows.append({"post_id": pid, "voter": voter, "candidate": candidate, "comment_id": ids[candidate]})
+        db.session.execute(insert(Post), post_rows)
+        db.session.execute(insert(Comment), comment_rows)
+        db.session.execute(insert(Vote), vote_rows)
+        db.session.commit()
+        print(f"  seeded {min(start + batch, posts):>9,} posts", end="\r")
+    print()
+    return names
+
+
+def auth(user):
+    return {"Authorization": f"Bearer token-{user}"}
+
+
+def requests_for(names, posts, repeat, rng):
+    """(label, list of per-call request kwargs); calls are not repeated on the same data."""
+    sample = [f"p{rng.randrange(posts)}" for _ in range(repeat)]
+    voting = []
+    for pid in sample:
+        post = db.session.get(Post, pid)
+        voted = {v.voter for v in post.votes}
+        candidate = post.comments[0].commenter
+        voter = next(n for n in rng.sample(names, 50) if n not in voted and n not in (post.author, candidate))
+        voting.append((pid, voter, candidate, next(iter(voted))))
+    return [
+        ("GET /posts", [dict(method="GET", path="/posts?limit=20") for _ in sample]),
+        ("GET /status/<id>", [dict(method="GET", path=f"/status/{pid}") for pid in sample]),
+        ("GET /comments/<id>", [dict(method="GET", path=f"/comments/{pid}") for pid in sample]),
+        ("GET /user/<name>", [
+            dict(method="GET", path=f"/user/{voter}", headers=auth(candidate)) for _, voter, candidate, _ in voting
+        ]),
+        ("POST /vote (new user)", [
+            dict(method="POST", path=f"/vote/{pid}", json={"candidate": candidate}, headers=auth(voter))
+            for pid, voter, candidate, _ in voting
+        ]),
+        ("POST /vote (rejected)", [
+            dict(method="POST", path=f"/vote/{pid}", json={"candidate": candidate}, headers=auth(old))
+            for pid, _, candidate, old in voting
+        ]),
+        ("POST /unvote", [
+            dict(method="POST", path=f"/unvote/{pid}", headers=auth(voter)) for pid, voter, _, _ in voting
+        ]),
+    ]
+
+
+def timed(client, calls):
+    """Median latency in ms of one request each."""
+    times = []
+    for call in calls:
+        t0 = time.perf_counter()
+        response = client.open(call.pop("path"), **call)
+        times.append(time.perf_counter() - t0)
+        assert response.status_code < 500, response.get_data(as_text=True)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def run(client, names, posts, repeat, seed_value):
+    rng = random.Random(seed_value)
+    client.get("/posts?limit=20")   # warm-up, not timed
+    return {label: timed(client, calls) for label, calls in requests_for(names, posts, repeat, rng)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark endpoints before and after the hot-path indexes")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20, help="requests per endpoint and phase")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    path = None
+    url = args.database_url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": url, "TESTING": True})
+    client = app.test_client()
+    # every migration that only builds or drops indexes (4 is the full-text index)
+    migrations = [m for m in MIGRATIONS if not m.steps]
+    quiet = lambda _: None
+    try:
+        with app.app_context():
+            print(f"Seeding {args.users:,} users, {args.posts:,} posts into {url}")
+            t0 = time.perf_counter()
+            names = seed(args.users, args.posts)
+            print(f"Seeded in {time.perf_counter() - t0:.1f}s")
+
+            for migration in reversed(migrations):
+                revert_migration(migration, report=quiet)
+            app.extensions.pop("unique_keys", None)
+            before = run(client, names, args.posts, args.repeat, 1)
+            for migration in migrations:
+                t0 = time.perf_counter()
+                apply_migration(migration)
+                print(f"Migration {migration.version} applied in {time.perf_counter() - t0:.1f}s")
+            # re-read at once instead of after UNIQUE_KEYS_RECHECK_SECONDS
+            app.extensions.pop("unique_keys", None)
+            after = run(client, names, args.posts, args.repeat, 2)
+
+            print(f"\n{'endpoint':<24}{'before ms':>11}{'after ms':>11}{'speedup':>10}")
+            for label in before:
+                print(f"{label:<24}{before[label]:>11.2f}{after[label]:>11.2f}{before[label] / after[label]:>9.1f}x")
+            print("\nMedian of one request each on distinct posts and users; the two phases use different samples.")
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
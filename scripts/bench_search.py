@@ -0,0 +1,117 @@
+# scripts/bench_search.py
+# Compare the full-text backend with the old ILIKE scan on a seeded database.
+#
+#   python -m scripts.bench_search --posts 1000000
+#
+# The database is a throw-away SQLite file (or --database-url to point at Postgres,
+# where the full-text index of migration 4 is built before seeding).
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import create_app
+from core.extensions import db
+from core.migrations import apply_migration, pending_migrations
+from core.search_index import get_search_backend, search_terms
+from models import User, Post
+
+WORDS = (
+    "debate argument logic evidence claim reason policy science history economy "
+    "climate energy health education freedom privacy security market vote justice "
+    "ethics culture language music football cinema travel food startup code python"
+).split()
+# Zipf-like vocabulary: the named words above are the most frequent, followed by a long tail
+VOCABULARY = WORDS + [f"w{n}" for n in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+RARE_WORD = "serendipity"   # planted in ~0.01% of posts
+QUERIES = ["debate", "climate policy", "priv", RARE_WORD, "nonexistentword"]
+
+
+def seed(count, batch=20000):
+    db.session.execute(insert(User), [{"username": "bench", "email": "bench@example.com", "password_hash": "x"}])
+    base = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    for start in range(0, count, batch):
+        rows = [
+            {
+                "id": f"bench_{i}",
+                "author": "bench",
+                "body": " ".join(rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(8, 40)))
+                        + (f" {RARE_WORD}" if i % 10000 == 0 else ""),
+                "created_at": base + timedelta(seconds=i),
+                "media_urls": [],
+            }
+            for i in range(start, min(start + batch, count))
+        ]
+        db.session.execute(insert(Post), rows)
+        db.session.commit()
+        print(f"  seeded {min(start + batch, count):>9,} posts", end="\r")
+    print()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def old_ilike_search(q, limit):
+    """The query GET /search ran before the full-text index."""
+    return Post.query.filter(Post.body.ilike(f"%{q}%")).order_by(Post.created_at.desc()).limit(limit).all()
+
+
+def fts_search(backend, q, limit):
+    terms = search_terms(q)
+    ids = [pid for pid, _ in backend.search(terms, limit)]
+    posts = Post.query.filter(Post.id.in_(ids)).all()
+    backend.highlight(terms, posts)
+    return posts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full-text search against ILIKE")
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    path = None
+    url = args.database_url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": url})
+    try:
+        with app.app_context():
+            for migration in pending_migrations():
+                apply_migration(migration, report=lambda _: None)
+            print(f"Seeding {args.posts:,} posts into {url}")
+            t0 = time.perf_counter()
+            seed(args.posts)
+            print(f"Seeded (index maintained on insert) in {time.perf_counter() - t0:.1f}s")
+
+            fts = get_search_backend()
+            print(f"\n{'query':<18}{'ilike ms':>10}{fts.name + ' ms':>18}{'speedup':>10}")
+            for q in QUERIES:
+                like_ms = timed(lambda: old_ilike_search(q, args.limit), args.repeat)
+                fts_ms = timed(lambda: fts_search(fts, q, args.limit), args.repeat)
+                print(f"{q:<18}{like_ms:>10.1f}{fts_ms:>18.1f}{like_ms / fts_ms:>9.1f}x")
+            print("\nilike stops at the first LIMIT matches in created_at order, so very common words are cheap"
+                  "\nfor it; rare and absent terms show the cost of its sequential scan.")
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# scripts/bench_timers.py
+# Compare one APScheduler job per post with the post_timers table + sweeper.
+#
+#   python -m scripts.bench_timers --timers 1000000
+#
+# Measures, for N pending timers: time to schedule them, memory held by the
+# process, and how long it takes to find and run the ones that fall due.
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import insert
+from app import create_app
+from core import jobs
+from core.extensions import db
+from models import PostTimer
+
+
+def noop(post_id):
+    pass
+
+
+def bench_apscheduler(count, store_url):
+    """One 'date' job per post, as create_post used to add."""
+    stores = {"default": SQLAlchemyJobStore(url=store_url)} if store_url else {}
+    sched = BackgroundScheduler(jobstores=stores)
+    sched.start(paused=True)
+    base = datetime.now() + timedelta(days=1)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for i in range(count):
+        sched.add_job(noop, "date", run_date=base + timedelta(seconds=i), args=[f"post_{i}"], id=f"noop:post_{i}")
+    elapsed = time.perf_counter() - t0
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    sched.shutdown(wait=False)
+    return elapsed, memory
+
+
+def bench_post_timers(count, due, batch=20000):
+    """Pending rows in post_timers; the sweeper only ever holds one batch."""
+    base = datetime.now() + timedelta(days=1)
+    t0 = time.perf_counter()
+    for start in range(0, count, batch):
+        db.session.execute(insert(PostTimer), [
+            {"post_id": f"post_{i}", "action": "noop", "next_action_at": base + timedelta(seconds=i)}
+            for i in range(start, min(start + batch, count))
+        ])
+        db.session.commit()
+    insert_time = time.perf_counter() - t0
+
+    jobs.timer_actions = lambda: {"noop": noop}
+    t0 = time.perf_counter()
+    jobs.sweep_timers(now=base - timedelta(seconds=1))   # nothing due: one indexed probe
+    idle_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    ran = jobs.sweep_timers(now=base + timedelta(seconds=due - 1))
+    sweep_time = time.perf_counter() - t0
+    # memory of one more sweep, traced separately so tracing does not skew the timings
+    tracemalloc.start()
+    jobs.sweep_timers(now=base + timedelta(seconds=due + 999))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return insert_time, idle_ms, ran, sweep_time, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark post timers against one APScheduler job per post")
+    parser.add_argument("--timers", type=int, default=1_000_000)
+    parser.add_argument("--due", type=int, default=10_000, help="timers falling due in the sweep")
+    parser.add_argument("--jobstore", choices=["memory", "sqlalchemy"], default="memory")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    url = f"sqlite:///{path}"
+    try:
+        store_url = url if args.jobstore == "sqlalchemy" else None
+        elapsed, memory = bench_apscheduler(args.timers, store_url)
+        print(f"APScheduler ({args.jobstore} store): {args.timers:,} jobs added in {elapsed:.1f}s, "
+              f"{memory / 2**20:.0f} MB held by the scheduler")
+
+        app = create_app({"SQLALCHEMY_DATABASE_URI": url, "TESTING": True})
+        with app.app_context():
+            insert_time, idle_ms, ran, sweep_time, peak = bench_post_timers(args.timers, args.due)
+        print(f"post_timers: {args.timers:,} rows written in {insert_time:.1f}s, "
+              f"idle sweep {idle_ms:.1f} ms, {ran:,} due timers run in {sweep_time:.2f}s "
+              f"({ran / sweep_time:,.0f}/s), sweeper peak {peak / 2**20:.1f} MB")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# scripts/migrate.py
+#
+#   python -m scripts.migrate [--list]
+#
+# Applica le migrazioni di core.migrations non ancora registrate in
+# schema_migrations: indici delle tabelle grandi (prima di un indice unico
+# elimina le righe duplicate) e indice full-text. Su Postgres gli indici sono
+# costruiti con CREATE INDEX CONCURRENTLY, quindi si lancia a servizio attivo;
+# se viene interrotto basta rilanciarlo. Con --list mostra solo lo stato.
+
+import argparse
+from core.migrations import MIGRATIONS, applied_versions, apply_migration
+from app import create_app
+
+
+def migra(solo_elenco=False):
+    applicate = applied_versions()
+    for migration in MIGRATIONS:
+        stato = "applicata" if migration.version in applicate else "da applicare"
+        print(f"{migration.version:>4}  {migration.name:<30} {stato}")
+    if solo_elenco:
+        return []
+    eseguite = []
+    for migration in MIGRATIONS:
+        if migration.version in applicate:
+            continue
+        print(f"Migrazione {migration.version} ({migration.name})...")
+        apply_migration(migration)
+        eseguite.append(migration.version)
+    print(f"Completato: {len(eseguite)} migrazioni applicate." if eseguite else "Schema già aggiornato.")
+    return eseguite
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Applica le migrazioni dello schema")
+    parser.add_argument("--list", action="store_true", help="mostra lo stato senza applicare nulla")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migra(args.list)
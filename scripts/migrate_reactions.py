@@ -0,0 +1,71 @@
+# scripts/migrate_reactions.py
+#
+#   python -m scripts.migrate_reactions [--batch-size 1000] [--drop-legacy]
+#
+# Copia le vecchie tabelle likes e flags nella tabella reactions, a blocchi di id
+# con INSERT ... SELECT ... ON CONFLICT DO NOTHING: si può rilanciare senza
+# duplicare nulla. Se un utente aveva sia like che flag sullo stesso post resta
+# il like. Alla fine ricalcola like_count/flag_count dei post.
+
+import argparse
+from sqlalchemy import MetaData, Table, inspect, func, select, literal, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from core.extensions import db
+from core.counters import reconcile_job
+from models import Reaction
+from app import create_app
+from config import MAINTENANCE_BATCH_SIZE
+
+LEGACY = (("likes", "liker", "like"), ("flags", "flagger", "flag"))
+
+
+def _insert_ignore_from_select(columns, query):
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(Reaction.__table__).from_select(columns, query).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(Reaction.__table__).from_select(columns, query).on_conflict_do_nothing()
+    else:
+        existing = select(Reaction.id).where(Reaction.post_id == query.selected_columns[0],
+                                             Reaction.user == query.selected_columns[1])
+        stmt = insert(Reaction.__table__).from_select(columns, query.where(~existing.exists()))
+    return db.session.execute(stmt).rowcount
+
+
+def migra_reazioni(batch_size=MAINTENANCE_BATCH_SIZE, drop_legacy=False):
+    tables = set(inspect(db.engine).get_table_names())
+    copiate = 0
+    for name, user_column, kind in LEGACY:
+        if name not in tables:
+            print(f"Tabella {name} assente, salto.")
+            continue
+        legacy = Table(name, MetaData(), autoload_with=db.engine)
+        last_id = db.session.execute(select(func.max(legacy.c.id))).scalar() or 0
+        for start in range(0, last_id, batch_size):
+            query = select(legacy.c.post_id, legacy.c[user_column], literal(kind)).where(
+                legacy.c.id > start, legacy.c.id <= start + batch_size
+            )
+            copiate += _insert_ignore_from_select(["post_id", "user", "kind"], query)
+            db.session.commit()
+        print(f"{name}: copiati gli id fino a {last_id} ({copiate} reazioni nuove finora).")
+
+    reconcile_job().run()
+
+    if drop_legacy:
+        for name, _, _ in LEGACY:
+            if name in tables:
+                Table(name, MetaData(), autoload_with=db.engine).drop(db.engine)
+                print(f"Tabella {name} eliminata.")
+    print(f"Migrazione completata: {copiate} reazioni copiate.")
+    return copiate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sposta likes e flags nella tabella reactions")
+    parser.add_argument("--batch-size", type=int, default=MAINTENANCE_BATCH_SIZE, help="id per blocco")
+    parser.add_argument("--drop-legacy", action="store_true", help="elimina likes e flags dopo la copia")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migra_reazioni(args.batch_size, args.drop_legacy)
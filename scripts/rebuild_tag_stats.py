@@ -0,0 +1,11 @@
+# scripts/rebuild_tag_stats.py
+
+from core.tags import rebuild_tag_stats
+from app import create_app
+
+if __name__ == "__main__":
+    # Ricostruisce da zero la tabella tag_stats (conteggio post per tag)
+    app = create_app()
+    with app.app_context():
+        written = rebuild_tag_stats()
+        print(f"Ricalcolati i contatori di {written} tag.")
@@ -0,0 +1,96 @@
+# scripts/recompute_badges.py
+#
+#   python -m scripts.recompute_badges [--workers 4] [--batch-size 1000]
+#
+# Ricalcola i badge a soglia (BADGE_RULES) di tutti gli utenti, da rilanciare
+# dopo aver cambiato le soglie in config.py. Gli utenti sono divisi in blocchi
+# distribuiti su un pool di processi; ogni blocco è una transazione con
+# aggregati set-based e un insert-or-ignore, quindi lo script è idempotente.
+# Su SQLite, dove le scritture sono comunque serializzate, il default è un
+# solo processo: più processi vanno più lenti e rischiano "database is locked".
+
+import argparse
+import os
+import time
+import multiprocessing
+from flask import Flask, current_app
+from core.extensions import db
+from core.badges import recompute_badges
+from models import User
+from app import create_app
+from config import MAINTENANCE_BATCH_SIZE
+
+_worker_app = None
+
+
+def _init_worker(db_uri):
+    # app minimale: niente scheduler né code di background nei processi del pool
+    global _worker_app
+    _worker_app = Flask(__name__)
+    _worker_app.config.update(SQLALCHEMY_DATABASE_URI=db_uri, SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(_worker_app)
+
+
+def _recompute_chunk(usernames):
+    with _worker_app.app_context():
+        awarded = recompute_badges(usernames)
+        db.session.commit()
+    return len(usernames), awarded
+
+
+def _chunks(app, batch_size):
+    # paginazione keyset sullo username; il pool consuma il generatore da un
+    # suo thread, quindi l'app_context va aperto qui
+    after = None
+    while True:
+        with app.app_context():
+            query = db.session.query(User.username).order_by(User.username)
+            if after is not None:
+                query = query.filter(User.username > after)
+            chunk = [u for (u,) in query.limit(batch_size)]
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+def ricalcola_badge(db_uri, workers=None, batch_size=MAINTENANCE_BATCH_SIZE):
+    if workers is None:
+        workers = (os.cpu_count() or 1) if db.engine.dialect.name == "postgresql" else 1
+    app = current_app._get_current_object()
+    utenti = badge = 0
+    started = time.perf_counter()
+
+    def report(users, awarded):
+        nonlocal utenti, badge
+        utenti += users
+        badge += awarded
+        elapsed = time.perf_counter() - started
+        print(f"{utenti} utenti, {badge} badge assegnati ({utenti / elapsed if elapsed else 0:,.0f} utenti/s)")
+
+    if workers == 1:
+        for chunk in _chunks(app, batch_size):
+            awarded = recompute_badges(chunk)
+            db.session.commit()
+            report(len(chunk), awarded)
+    else:
+        # spawn: i processi figli non ereditano i thread dello scheduler
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(db_uri,)) as pool:
+            for users, awarded in pool.imap_unordered(_recompute_chunk, _chunks(app, batch_size)):
+                report(users, awarded)
+
+    elapsed = time.perf_counter() - started
+    print(f"Completato: {utenti} utenti in {elapsed:.1f}s con {workers} processi, {badge} nuovi badge.")
+    return badge
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ricalcola i badge a soglia di tutti gli utenti")
+    parser.add_argument("--workers", type=int, default=None, help="processi del pool (default: numero di CPU su Postgres, 1 altrimenti)")
+    parser.add_argument("--batch-size", type=int, default=MAINTENANCE_BATCH_SIZE, help="utenti per blocco")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        ricalcola_badge(app.config["SQLALCHEMY_DATABASE_URI"], args.workers, args.batch_size)
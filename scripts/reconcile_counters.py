@@ -0,0 +1,25 @@
+# scripts/reconcile_counters.py
+#
+#   python -m scripts.reconcile_counters [--batch-size 1000] [--pause 0.1] [--dry-run] [--restart]
+
+import argparse
+from core.counters import reconcile_job
+from app import create_app
+from config import MAINTENANCE_BATCH_SIZE
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ricalcola like_count / flag_count / vote_count")
+    parser.add_argument("--batch-size", type=int, default=MAINTENANCE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.0, help="secondi di pausa tra un blocco e l'altro")
+    parser.add_argument("--dry-run", action="store_true", help="conta i post disallineati senza modificarli")
+    parser.add_argument("--restart", action="store_true", help="ignora il checkpoint e riparte da capo")
+    args = parser.parse_args()
+
+    # Ricalcola like_count / flag_count / vote_count dai dati grezzi, a blocchi
+    app = create_app()
+    with app.app_context():
+        fixed = reconcile_job(args.batch_size, args.pause).run(dry_run=args.dry_run, restart=args.restart)
+        if args.dry_run:
+            print(f"[dry-run] {fixed} post con contatori disallineati.")
+        else:
+            print(f"Riallineati i contatori di {fixed} post.")
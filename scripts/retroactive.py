@@ -1,28 +1,43 @@
 # scripts/retroactive.py
+#
+#   python -m scripts.retroactive [--batch-size 1000] [--pause 0.1] [--dry-run] [--restart]
+#
+# Lavora a blocchi con un checkpoint: se viene interrotto riparte dall'ultimo blocco salvato.
 
+import argparse
 from datetime import datetime
-from core.extensions import db
+from core.maintenance import ChunkedUpdate
 from models import Post
 from app import create_app
+from config import MAINTENANCE_BATCH_SIZE
 
-def retroattiva_imposta_started():
+def retroattiva_imposta_started(batch_size=MAINTENANCE_BATCH_SIZE, pause=0.0, dry_run=False, restart=False):
     now = datetime.utcnow()
-    # Trova tutti i post la cui voting_deadline è già scaduta e che hanno started=False
-    posts_da_aggiornare = (
-        db.session.query(Post)
-        .filter(Post.voting_deadline <= now)
-        .filter(Post.started == False)
-        .all()
+    # Tutti i post la cui voting_deadline è già scaduta e che hanno started=False
+    job = ChunkedUpdate(
+        "retroactive_started",
+        Post,
+        where=(Post.voting_deadline <= now) & (Post.started == False),
+        values={Post.started: True},
+        batch_size=batch_size,
+        pause=pause,
     )
-
-    for post in posts_da_aggiornare:
-        post.started = True
-
-    db.session.commit()
-    print(f"Aggiornati {len(posts_da_aggiornare)} post già scaduti.")
+    aggiornati = job.run(dry_run=dry_run, restart=restart)
+    if dry_run:
+        print(f"[dry-run] {aggiornati} post già scaduti da aggiornare.")
+    else:
+        print(f"Aggiornati {aggiornati} post già scaduti.")
+    return aggiornati
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imposta started=True sui post con votazione scaduta")
+    parser.add_argument("--batch-size", type=int, default=MAINTENANCE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.0, help="secondi di pausa tra un blocco e l'altro")
+    parser.add_argument("--dry-run", action="store_true", help="conta i post senza modificarli")
+    parser.add_argument("--restart", action="store_true", help="ignora il checkpoint e riparte da capo")
+    args = parser.parse_args()
+
     # Creo l'app e entro nell'app_context
     app = create_app()
     with app.app_context():
-        retroattiva_imposta_started()
+        retroattiva_imposta_started(args.batch_size, args.pause, args.dry_run, args.restart)
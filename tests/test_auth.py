@@ -69,3 +69,57 @@ def test_register_includes_email_flags(client, capsys):
     captured = capsys.readouterr()
     assert "/verify/" in captured.out
 
+
+
+def test_token_cache_serves_repeat_requests_and_drops_rotated_tokens(client):
+    from core.auth import token_cache
+
+    client.post("/register", json={"username": "carol", "password": "pwd", "email": "carol@example.com"})
+    old = client.post("/login", json={"username": "carol", "password": "pwd"}).get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {old}"}
+    before = token_cache.stats()
+    assert client.get("/profile", headers=headers).status_code == 200
+    assert client.get("/following", headers=headers).status_code == 200
+    after = token_cache.stats()
+    assert (after["misses"] - before["misses"], after["hits"] - before["hits"]) == (1, 1)
+
+    # /login rotates the token: the cached old one must stop working at once
+    new = client.post("/login", json={"username": "carol", "password": "pwd"}).get_json()["access_token"]
+    assert client.get("/profile", headers=headers).status_code == 401
+    assert client.get("/profile", headers={"Authorization": f"Bearer {new}"}).status_code == 200
+    assert client.get("/metrics").get_json()["auth"]["size"] == 1
+
+
+def test_token_cache_is_bounded_and_expires():
+    import time
+    from core.auth import TokenCache, Principal
+
+    cache = TokenCache(capacity=2, ttl=60)
+    for token in ("a", "b", "c"):
+        cache.put(token, Principal(token))
+    assert cache.get("a") is None and cache.get("c") == Principal("c")
+    assert cache.stats()["evictions"] == 1
+
+    cache.ttl = 0.01
+    cache.put("d", Principal("d"))
+    time.sleep(0.02)
+    assert cache.get("d") is None
+
+
+def test_token_cache_skips_tokens_invalidated_during_the_lookup():
+    from core.auth import TokenCache, Principal
+
+    cache = TokenCache(capacity=2, ttl=60)
+    generation = cache.generation()
+    cache.invalidate("old")   # /login rotated it while the users table was read
+    cache.put("old", Principal("u"), generation)
+    cache.put("other", Principal("v"), generation)
+    assert cache.get("old") is None and cache.get("other") == Principal("v")
+
+    # too many invalidations since to tell: nothing from that lookup is cached
+    for token in ("x", "y", "z"):
+        cache.invalidate(token)
+    cache.put("other2", Principal("w"), generation)
+    assert cache.get("other2") is None
+    cache.put("other2", Principal("w"), cache.generation())
+    assert cache.get("other2") == Principal("w")
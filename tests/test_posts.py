@@ -1,10 +1,11 @@
 # tests/test_posts.py
 import uuid
-from core.utils import evaluate_badges
+from core.badges import evaluate_user_badges
 from datetime import datetime, timedelta
 from models import User, Post, Comment, Vote, Badge
 
 def test_vote_assigns_insightful_badge(client):
+    from core.extensions import db
     client.post("/register", json={"username": "a", "password": "p", "email": "a@example.com"})
     token_author = client.post("/login", json={"username": "a", "password": "p"}).get_json()["access_token"]
 
@@ -22,7 +23,8 @@ def test_vote_assigns_insightful_badge(client):
         client.post(f"/vote/{pid}", headers={"Authorization": f"Bearer {t}"}, json={"candidate": "commenter"})
 
     with client.application.app_context():
-        evaluate_badges("commenter")
+        evaluate_user_badges("commenter")
+        db.session.commit()
 
     rv = client.get("/profile", headers={"Authorization": f"Bearer {token_commenter}"})
     assert "Insightful" in rv.get_json()["badges"]
@@ -53,7 +55,8 @@ def test_consistent_debater_badge(client):
             comments = Comment.query.filter_by(post_id=pid).all()
 
     with client.application.app_context():
-        evaluate_badges("alice")
+        evaluate_user_badges("alice")
+        db.session.commit()
 
     rv = client.get("/profile", headers={"Authorization": f"Bearer {token_alice}"})
     assert "Consistent Debater" in rv.get_json()["badges"]
@@ -244,3 +247,428 @@ def test_status_includes_media(client):
     data = rv.get_json()
     assert "media" in data
     assert "https://youtube.com/watch?v=abc" in data["media"]
+
+def test_status_query_count_does_not_grow_with_comments(client):
+    from sqlalchemy import event
+    from core.extensions import db
+
+    client.post("/register", json={"username": "nq", "password": "p", "email": "nq@example.com"})
+    token = client.post("/login", json={"username": "nq", "password": "p"}).get_json()["access_token"]
+    pid = uuid.uuid4().hex
+    client.post(f"/create_post/{pid}", headers={"Authorization": f"Bearer {token}"}, json={"body": "n+1"})
+
+    def add_commenters(start, stop):
+        with client.application.app_context():
+            for i in range(start, stop):
+                uname = f"nq_c{i}"
+                db.session.add(User(username=uname, email=f"{uname}@example.com", password_hash="x"))
+                db.session.add(Comment(post_id=pid, commenter=uname, text="t"))
+                db.session.add(Vote(post_id=pid, voter=f"nq_v{i}", candidate=uname))
+            db.session.commit()
+
+    def count_status_queries():
+        statements = []
+        with client.application.app_context():
+            engine = db.engine
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            rv = client.get(f"/status/{pid}")
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert rv.status_code == 200
+        return len(statements), rv.get_json()
+
+    add_commenters(0, 3)
+    few, data = count_status_queries()
+    assert len(data["comments"]) == 3
+    assert all(c["votes"] == 1 for c in data["comments"])
+
+    add_commenters(3, 40)
+    many, data = count_status_queries()
+    assert len(data["comments"]) == 40
+    assert data["ranking"]["nq_c39"] == 1
+    assert many == few
+
+def test_get_comments_voter_paging(client):
+    for uname in ["pg_a", "pg_c"] + [f"pg_v{i}" for i in range(5)] + [f"pg_w{i}" for i in range(4)]:
+        client.post("/register", json={"username": uname, "password": "p", "email": f"{uname}@example.com"})
+    tokens = {u: client.post("/login", json={"username": u, "password": "p"}).get_json()["access_token"]
+              for u in ["pg_a", "pg_c"] + [f"pg_v{i}" for i in range(5)] + [f"pg_w{i}" for i in range(4)]}
+
+    pid = uuid.uuid4().hex
+    client.post(f"/create_post/{pid}", headers={"Authorization": f"Bearer {tokens['pg_a']}"}, json={"body": "paging"})
+    client.post(f"/comment/{pid}", headers={"Authorization": f"Bearer {tokens['pg_c']}"}, json={"text": "vote me"})
+    client.post(f"/comment/{pid}", headers={"Authorization": f"Bearer {tokens['pg_w0']}"}, json={"text": "me too"})
+    for i in range(5):
+        client.post(f"/vote/{pid}", headers={"Authorization": f"Bearer {tokens[f'pg_v{i}']}"}, json={"candidate": "pg_c"})
+    for i in range(1, 4):
+        client.post(f"/vote/{pid}", headers={"Authorization": f"Bearer {tokens[f'pg_w{i}']}"}, json={"candidate": "pg_w0"})
+
+    full = client.get(f"/comments/{pid}").get_json()["comments"][0]
+    assert full["votes"] == 5
+    assert full["voters"] == [f"pg_v{i}" for i in range(5)]
+    assert full["voters_next"] is None
+
+    page, other = client.get(f"/comments/{pid}?limit=2").get_json()["comments"]
+    assert page["voters"] == ["pg_v0", "pg_v1"]
+    assert page["votes"] == 5
+    # each comment is paged on its own cursor
+    assert other["voters"] == ["pg_w1", "pg_w2"] and other["voters_next"] == "pg_w2"
+    url = f"/comments/{pid}?limit=2&comment_id={page['id']}"
+    pages = client.get(f"{url}&after={page['voters_next']}").get_json()["comments"]
+    assert [p["voters"] for p in pages] == [["pg_v2", "pg_v3"]]
+    page = client.get(f"{url}&after={pages[0]['voters_next']}").get_json()["comments"][0]
+    assert page["voters"] == ["pg_v4"]
+    assert page["voters_next"] is None
+    other = client.get(f"/comments/{pid}?limit=2&comment_id={other['id']}&after=pg_w2").get_json()["comments"][0]
+    assert other["voters"] == ["pg_w3"] and other["voters_next"] is None
+
+    assert client.get(f"/comments/{pid}?limit=abc").status_code == 400
+    assert client.get(f"/comments/{pid}?after=pg_v1").status_code == 400
+    assert client.get(f"/comments/{pid}?comment_id=abc").status_code == 400
+    assert client.get(f"/comments/{pid}?comment_id=999999").status_code == 404
+
+def test_engagement_counters_follow_writes(client):
+    for uname in ["ec_a", "ec_c", "ec_v", "ec_l"]:
+        client.post("/register", json={"username": uname, "password": "p", "email": f"{uname}@example.com"})
+    tok = {u: client.post("/login", json={"username": u, "password": "p"}).get_json()["access_token"]
+           for u in ["ec_a", "ec_c", "ec_v", "ec_l"]}
+
+    pid = uuid.uuid4().hex
+    client.post(f"/create_post/{pid}", headers={"Authorization": f"Bearer {tok['ec_a']}"}, json={"body": "counters"})
+    client.post(f"/comment/{pid}", headers={"Authorization": f"Bearer {tok['ec_c']}"}, json={"text": "c"})
+    client.post(f"/vote/{pid}", headers={"Authorization": f"Bearer {tok['ec_v']}"}, json={"candidate": "ec_c"})
+    client.post(f"/vote/{pid}", headers={"Authorization": f"Bearer {tok['ec_l']}"}, json={"candidate": "ec_c"})
+    client.post(f"/unvote/{pid}", headers={"Authorization": f"Bearer {tok['ec_l']}"})
+    client.post(f"/start_duel/{pid}", headers={"Authorization": f"Bearer {tok['ec_v']}"})
+    client.post(f"/like/{pid}", headers={"Authorization": f"Bearer {tok['ec_l']}"})
+    client.post(f"/flag/{pid}", headers={"Authorization": f"Bearer {tok['ec_v']}"})
+
+    with client.application.app_context():
+        from core.extensions import db
+        post = db.session.get(Post, pid)
+        assert (post.like_count, post.flag_count, post.vote_count) == (1, 1, 1)
+
+    status = client.get(f"/status/{pid}").get_json()
+    assert status["likes"] == 1
+    assert status["flags"] == 1
+    assert status["flag_analysis"]["actual_likes"] == 1
+
+def test_list_posts_cursor_pagination(client):
+    from core.extensions import db
+    client.post("/register", json={"username": "pager", "password": "p", "email": "pager@example.com"})
+    base = datetime(2025, 1, 1)
+    with client.application.app_context():
+        for i in range(7):
+            db.session.add(Post(id=f"page_{i}", author="pager", body=f"b{i}", created_at=base + timedelta(minutes=i),
+                                completed=(i % 2 == 0), started=(i % 2 == 0)))
+        # same timestamp as page_3: the id breaks the tie
+        db.session.add(Post(id="page_3b", author="pager", body="tie", created_at=base + timedelta(minutes=3)))
+        db.session.commit()
+
+    seen, cursor = [], None
+    while True:
+        url = "/posts?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(url).get_json()
+        seen.extend(p["id"] for p in data["posts"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["page_6", "page_5", "page_4", "page_3b", "page_3", "page_2", "page_1", "page_0"]
+
+    first = client.get("/posts?type=completed&limit=2").get_json()
+    assert [p["id"] for p in first["posts"]] == ["page_6", "page_4"]
+    second = client.get(f"/posts?type=completed&limit=2&cursor={first['next_cursor']}").get_json()
+    assert [p["id"] for p in second["posts"]] == ["page_2", "page_0"]
+    assert second["next_cursor"] is None
+
+    voting = client.get("/posts?state=voting").get_json()["posts"]
+    assert {p["id"] for p in voting} == {"page_1", "page_3", "page_3b", "page_5"}
+
+    assert client.get("/posts?state=bogus").status_code == 400
+    assert client.get("/posts?cursor=not-a-cursor").status_code == 400
+
+
+def test_user_stats_follow_votes_and_duels(client):
+    from core.user_stats import compute_user_stats, STAT_COLUMNS
+    from models import UserStats
+
+    names = ["us_author", "us_c1", "us_c2"] + [f"us_v{i}" for i in range(4)]
+    for name in names:
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    tokens = {n: client.post("/login", json={"username": n, "password": "p"}).get_json()["access_token"] for n in names}
+    auth = lambda n: {"Authorization": f"Bearer {tokens[n]}"}
+
+    for pid in ("us_p1", "us_p2"):
+        client.post(f"/create_post/{pid}", headers=auth("us_author"), json={"body": "stats"})
+        client.post(f"/comment/{pid}", headers=auth("us_c1"), json={"text": "one"})
+        client.post(f"/comment/{pid}", headers=auth("us_c2"), json={"text": "two"})
+    for i, candidate in enumerate(["us_c1", "us_c1", "us_c2", "us_c1"]):
+        client.post("/vote/us_p1", headers=auth(f"us_v{i}"), json={"candidate": candidate})
+    client.post("/vote/us_p2", headers=auth("us_v0"), json={"candidate": "us_c2"})
+    client.post("/unvote/us_p1", headers=auth("us_v3"))
+    client.post("/start_duel/us_p1", headers=auth("us_author"))
+
+    with client.application.app_context():
+        stored = {s.username: {c: getattr(s, c) for c in STAT_COLUMNS} for s in UserStats.query}
+        assert stored["us_c1"] == compute_user_stats(["us_c1"])["us_c1"] | {"max_votes_received_on_a_post": 3}
+        for name in ("us_c2", "us_v0", "us_v3"):
+            assert stored[name] == compute_user_stats([name])[name]
+        assert stored["us_c1"]["wins"] == 1 and stored["us_c2"]["duels_participated"] == 1
+        assert stored["us_v0"]["distinct_posts_voted"] == 2
+
+
+def test_vote_commits_once_and_queues_badges(client, monkeypatch):
+    from core.extensions import db
+    from models import BadgeOutbox
+
+    for name in ("bv_author", "bv_c", "bv_v"):
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    tokens = {n: client.post("/login", json={"username": n, "password": "p"}).get_json()["access_token"] for n in ("bv_author", "bv_c", "bv_v")}
+    client.post("/create_post/bv_p", headers={"Authorization": f"Bearer {tokens['bv_author']}"}, json={"body": "badges"})
+    client.post("/comment/bv_p", headers={"Authorization": f"Bearer {tokens['bv_c']}"}, json={"text": "pick me"})
+
+    commits = []
+    real_commit = db.session.commit
+    monkeypatch.setattr(db.session, "commit", lambda: (commits.append(1), real_commit())[1])
+    rv = client.post("/vote/bv_p", headers={"Authorization": f"Bearer {tokens['bv_v']}"}, json={"candidate": "bv_c"})
+    assert rv.status_code == 200
+    # the vote itself plus the badge evaluation, which runs inline under TESTING
+    assert len(commits) == 2
+
+    with client.application.app_context():
+        assert BadgeOutbox.query.count() == 0
+    rv = client.get("/profile", headers={"Authorization": f"Bearer {tokens['bv_v']}"})
+    assert "First Responder" in rv.get_json()["badges"]
+    metrics = client.get("/metrics").get_json()
+    assert metrics["badges"] == {"queued": 0, "outbox": 0}
+    assert metrics["jobs"]["badges"]["runs"] >= 1
+
+
+def test_write_behind_likes_and_flags(tmp_path):
+    import os
+    from app import create_app
+    from core.extensions import db
+    from core.engagement import engagement_buffer, replay_orphaned_journals
+    from models import Reaction
+
+    journal_dir = str(tmp_path / "journal")
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'wb.db'}",
+        "ENGAGEMENT_WRITE_BEHIND": True,
+        "ENGAGEMENT_FLUSH_MS": 3_600_000,   # flushed by hand below
+        "ENGAGEMENT_JOURNAL_DIR": journal_dir,
+    })
+    client = app.test_client()
+    names = ["wb_author", "wb_w", "wb_s"] + [f"wb_u{i}" for i in range(8)]
+    for name in names:
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    tokens = {n: client.post("/login", json={"username": n, "password": "p"}).get_json()["access_token"] for n in names}
+    react = lambda kind, n, pid="wb_p": client.post(f"/{kind}/{pid}", headers={"Authorization": f"Bearer {tokens[n]}"})
+    with app.app_context():
+        db.session.add(Post(id="wb_p", author="wb_author", body="b", started=True, winner="wb_w", second="wb_s", initial_votes=0))
+        db.session.commit()
+
+    assert react("like", "wb_u0").status_code == 200
+    assert react("like", "wb_u0").status_code == 403
+    assert react("flag", "wb_u0").status_code == 403
+    assert react("like", "wb_w").status_code == 403
+    assert react("flag", "wb_u1").status_code == 200
+    with app.app_context():
+        assert Reaction.query.count() == 0 and engagement_buffer.pending() == 2
+        assert engagement_buffer.flush() == 2
+        post = db.session.get(Post, "wb_p")
+        assert (post.like_count, post.flag_count) == (1, 1)
+    assert os.listdir(journal_dir) == [f"journal-{os.getpid()}.jsonl"]
+
+    # a crash before the flush: the journal is replayed at the next startup
+    react("like", "wb_u2")
+    engagement_buffer._journal.close()
+    engagement_buffer._pending = []
+    with app.app_context():
+        assert replay_orphaned_journals(journal_dir) == 1
+        assert Reaction.query.filter_by(user="wb_u2", kind="like").count() == 1
+        # replaying reactions that were already written adds nothing
+        with open(os.path.join(journal_dir, "journal-0.jsonl"), "w") as journal:
+            journal.write('{"kind": "like", "post_id": "wb_p", "user": "wb_u2"}\n{"kind": "flag", "pos')
+        assert replay_orphaned_journals(journal_dir) == 0
+        assert os.listdir(journal_dir) == []
+    engagement_buffer._open_journal()
+
+    # the switch is decided on the buffered counts (5 flags with initial_votes=0)
+    for i in range(3, 6):
+        assert react("flag", f"wb_u{i}").get_json() == {"status": "Flag registered."}
+    rv = react("flag", "wb_u6").get_json()
+    assert rv == {"status": "Winner switched.", "old": "wb_w", "new": "wb_s"}
+    with app.app_context():
+        post = db.session.get(Post, "wb_p")
+        assert (post.winner, post.started, post.flag_count) == ("wb_s", False, 0)
+        assert Reaction.query.count() == 0 and engagement_buffer.pending() == 0
+    # no longer a started duel: the regular path writes the like right away
+    assert react("like", "wb_u7").status_code == 200
+    with app.app_context():
+        assert Reaction.query.filter_by(user="wb_u7").count() == 1 and engagement_buffer.pending() == 0
+    app.config["ENGAGEMENT_WRITE_BEHIND"] = False
+    engagement_buffer.init_app(app)
+
+
+def test_write_behind_revalidates_cached_duels_and_survives_failed_flush(tmp_path, monkeypatch):
+    from sqlalchemy import update
+    from app import create_app
+    from core.extensions import db
+    from core.engagement import engagement_buffer
+    from models import Reaction
+
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'rv.db'}",
+        "ENGAGEMENT_WRITE_BEHIND": True,
+        "ENGAGEMENT_FLUSH_MS": 3_600_000,   # flushed by hand below
+        "ENGAGEMENT_JOURNAL_DIR": str(tmp_path / "journal"),
+    })
+    client = app.test_client()
+    names = ["rv_a", "rv_w", "rv_s"] + [f"rv_u{i}" for i in range(6)]
+    for name in names:
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    tokens = {n: client.post("/login", json={"username": n, "password": "p"}).get_json()["access_token"] for n in names}
+    react = lambda kind, n: client.post(f"/{kind}/rv_p", headers={"Authorization": f"Bearer {tokens[n]}"})
+    with app.app_context():
+        db.session.add(Post(id="rv_p", author="rv_a", body="b", started=True, winner="rv_w", second="rv_s", initial_votes=0))
+        db.session.commit()
+
+    assert react("like", "rv_u0").status_code == 200
+    with app.app_context():
+        engagement_buffer.flush()
+        # another process switches the duel: roles swapped, reactions cleared
+        db.session.execute(update(Post).where(Post.id == "rv_p").values(winner="rv_s", second="rv_w", like_count=0))
+        db.session.query(Reaction).delete()
+        db.session.commit()
+    assert react("like", "rv_u0").status_code == 403   # stale until revalidated
+    with app.app_context():
+        engagement_buffer.revalidate()
+    assert react("like", "rv_u0").status_code == 200
+    assert react("like", "rv_s").status_code == 403   # the new winner
+
+    def locked():
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(engagement_buffer, "flush", locked)
+    for i in range(1, 6):
+        rv = react("flag", f"rv_u{i}")
+        assert rv.status_code == 200 and rv.get_json() == {"status": "Flag registered."}
+    monkeypatch.undo()
+    with app.app_context():
+        assert engagement_buffer.flush() == 6
+        assert db.session.get(Post, "rv_p").flag_count == 5
+    app.config["ENGAGEMENT_WRITE_BEHIND"] = False
+    engagement_buffer.init_app(app)
+
+
+def test_duplicates_rejected_while_unique_keys_migration_is_pending(client):
+    from core.extensions import db
+    from core.migrations import MIGRATIONS, apply_migration, revert_migration, unique_keys_enforced
+    from models import Comment, Vote
+
+    names = ["uk_a", "uk_c", "uk_v"]
+    for name in names:
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    auth = {n: {"Authorization": "Bearer " + client.post("/login", json={"username": n, "password": "p"})
+                .get_json()["access_token"]} for n in names}
+    client.post("/create_post/uk_p", headers=auth["uk_a"], json={"body": "unique keys"})
+    with client.application.app_context():
+        revert_migration(MIGRATIONS[1], report=lambda _: None)
+        client.application.extensions.pop("unique_keys", None)
+        assert not unique_keys_enforced()
+
+    assert client.post("/comment/uk_p", headers=auth["uk_c"], json={"text": "one"}).status_code == 200
+    assert client.post("/comment/uk_p", headers=auth["uk_c"], json={"text": "two"}).status_code == 403
+    assert client.post("/vote/uk_p", headers=auth["uk_v"], json={"candidate": "uk_c"}).status_code == 200
+    assert client.post("/vote/uk_p", headers=auth["uk_v"], json={"candidate": "uk_c"}).status_code == 400
+    with client.application.app_context():
+        assert Comment.query.filter_by(post_id="uk_p").count() == 1
+        assert Vote.query.filter_by(post_id="uk_p").count() == 1
+        apply_migration(MIGRATIONS[1], report=lambda _: None)
+        client.application.extensions.pop("unique_keys", None)
+        assert unique_keys_enforced()
+
+
+def test_write_reactions_counts_only_rows_inserted(client, monkeypatch):
+    from core.extensions import db
+    import core.engagement as engagement
+    from models import Reaction
+
+    with client.application.app_context():
+        db.session.add(Post(id="wr_p", author="wr_a", body="b", started=True, winner="wr_w", second="wr_s"))
+        db.session.commit()
+        insert_ignore = engagement.insert_ignore
+
+        def racing_insert(table, rows, **kwargs):
+            # another process writes wr_u0's flag after the existing-rows check
+            db.session.add(Reaction(post_id="wr_p", user="wr_u0", kind="flag"))
+            db.session.flush()
+            return insert_ignore(table, rows, **kwargs)
+
+        monkeypatch.setattr(engagement, "insert_ignore", racing_insert)
+        written = engagement.write_reactions([("like", "wr_p", "wr_u0"), ("like", "wr_p", "wr_u1")])
+        db.session.commit()
+        post = db.session.get(Post, "wr_p")
+        assert written == 1 and (post.like_count, post.flag_count) == (1, 0)
+        assert Reaction.query.filter_by(post_id="wr_p", kind="like").count() == 1
+
+
+def test_reaction_conflicts_map_to_403(client):
+    from core.extensions import db
+    from models import Reaction
+
+    names = ["rx_a", "rx_w", "rx_u"]
+    for name in names:
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    tokens = {n: client.post("/login", json={"username": n, "password": "p"}).get_json()["access_token"] for n in names}
+    react = lambda kind, n: client.post(f"/{kind}/rx_p", headers={"Authorization": f"Bearer {tokens[n]}"})
+    with client.application.app_context():
+        db.session.add(Post(id="rx_p", author="rx_a", body="b", started=True, winner="rx_w", initial_votes=50))
+        db.session.commit()
+
+    assert react("like", "rx_u").status_code == 200
+    rv = react("like", "rx_u")
+    assert rv.status_code == 403 and "already liked" in rv.get_json()["error"]
+    rv = react("flag", "rx_u")
+    assert rv.status_code == 403 and "dopo aver messo like" in rv.get_json()["error"]
+    assert react("flag", "rx_w").status_code == 403
+    assert client.post("/like/rx_missing", headers={"Authorization": f"Bearer {tokens['rx_u']}"}).status_code == 404
+    with client.application.app_context():
+        assert [(r.user, r.kind) for r in Reaction.query] == [("rx_u", "like")]
+        assert (db.session.get(Post, "rx_p").like_count, db.session.get(Post, "rx_p").flag_count) == (1, 0)
+
+
+def test_vote_and_comment_are_single_validated_inserts(client):
+    from core.extensions import db
+
+    names = ["iv_a", "iv_c", "iv_v"]
+    for name in names:
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    tokens = {n: client.post("/login", json={"username": n, "password": "p"}).get_json()["access_token"] for n in names}
+    auth = lambda n: {"Authorization": f"Bearer {tokens[n]}"}
+    client.post("/create_post/iv_p", headers=auth("iv_a"), json={"body": "b"})
+
+    assert client.post("/comment/iv_p", headers=auth("iv_c"), json={"text": "one"}).status_code == 200
+    assert client.post("/comment/iv_p", headers=auth("iv_c"), json={"text": "two"}).status_code == 403
+    assert client.post("/comment/iv_missing", headers=auth("iv_c"), json={"text": "x"}).status_code == 404
+
+    assert client.post("/vote/iv_missing", headers=auth("iv_v"), json={"candidate": "iv_c"}).status_code == 404
+    rv = client.post("/vote/iv_p", headers=auth("iv_v"), json={"candidate": "iv_a"})
+    assert rv.status_code == 400 and "has not commented" in rv.get_json()["error"]
+    assert client.post("/vote/iv_p", headers=auth("iv_v"), json={"candidate": "iv_c"}).status_code == 200
+    rv = client.post("/vote/iv_p", headers=auth("iv_v"), json={"candidate": "iv_c"})
+    assert rv.status_code == 400 and "already voted" in rv.get_json()["error"]
+
+    with client.application.app_context():
+        vote = Vote.query.filter_by(post_id="iv_p").one()
+        comment = Comment.query.filter_by(post_id="iv_p").one()
+        assert (vote.voter, vote.candidate, vote.comment_id) == ("iv_v", "iv_c", comment.id)
+        assert db.session.get(Post, "iv_p").vote_count == 1
+        # duel comments are not limited by the unique index
+        db.session.add_all([Comment(post_id="iv_p", commenter="iv_c", text=t, is_duel=True) for t in ("d1", "d2")])
+        db.session.commit()
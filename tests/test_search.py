@@ -78,3 +78,84 @@ def test_search_returns_media_field(client):
     data = rv.get_json()
     assert "media" in data["posts"][0]
     assert "https://example.com/cat.jpg" in data["posts"][0]["media"]
+
+def test_search_ranks_by_relevance_with_snippets(client):
+    register_and_post(client, "ranker1", "A long post that mentions debate once among many other words here")
+    register_and_post(client, "ranker2", "debate debate debate")
+    rv = client.get("/search?q=debate&type=post")
+    data = rv.get_json()
+    assert [p["author"] for p in data["posts"]] == ["ranker2", "ranker1"]
+    assert "<mark>debate</mark>" in data["posts"][0]["snippet"]
+
+def test_search_snippet_escapes_the_body(client):
+    register_and_post(client, "xssuser", 'debate <img src=x onerror="alert(1)"> & more')
+    snippet = client.get("/search?q=debate&type=post").get_json()["posts"][0]["snippet"]
+    assert snippet == "<mark>debate</mark> &lt;img src=x onerror=&quot;alert(1)&quot;&gt; &amp; more"
+
+def test_search_cursor_paging(client):
+    client.post("/register", json={"username": "pagesearch", "password": "p", "email": "pagesearch@example.com"})
+    token = client.post("/login", json={"username": "pagesearch", "password": "p"}).get_json()["access_token"]
+    for i in range(5):
+        client.post(f"/create_post/fts_{i}", headers={"Authorization": f"Bearer {token}"}, json={"body": f"paging topic {i}"})
+    client.post("/create_post/fts_other", headers={"Authorization": f"Bearer {token}"}, json={"body": "unrelated"})
+
+    for sort in ("relevance", "asc", "desc"):
+        seen, cursor = [], None
+        while True:
+            url = f"/search?q=paging&type=post&limit=2&sort={sort}" + (f"&cursor={cursor}" if cursor else "")
+            data = client.get(url).get_json()
+            seen.extend(p["id"] for p in data["posts"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        assert sorted(seen) == [f"fts_{i}" for i in range(5)]
+
+    first = client.get("/search?q=paging&type=post&limit=2&sort=asc").get_json()
+    rv = client.get(f"/search?q=paging&type=post&limit=2&sort=desc&cursor={first['next_cursor']}")
+    assert rv.status_code == 400
+
+    # cursors with values of the wrong type are rejected, not a server error
+    from core.pagination import encode_cursor
+    for sort, key, last_id in (("desc", None, "fts_1"), ("relevance", [1], "fts_1"),
+                               ("asc", 5, "fts_1"), ("relevance", 1.0, None)):
+        rv = client.get(f"/search?q=paging&type=post&sort={sort}&cursor={encode_cursor(sort, key, last_id)}")
+        assert rv.status_code == 400
+
+def test_username_autocomplete_prefix(client):
+    for name in ["Marco", "marcella", "maria", "bob"]:
+        client.post("/register", json={"username": name, "password": "p", "email": f"{name}@example.com"})
+    rv = client.get("/search/users?q=mar")
+    assert rv.get_json()["users"] == ["marcella", "Marco", "maria"]
+    rv = client.get("/search/users?q=MARC&limit=1")
+    assert rv.get_json()["users"] == ["marcella"]
+    assert client.get("/search/users?q=").status_code == 400
+    assert client.get("/search/users?q=ar&mode=substring").status_code == 400
+
+def test_username_index_substring():
+    from core.username_index import UsernameIndex
+    index = UsernameIndex(substring=True)
+    index.build(["Marco", "marcella", "omar", "bob"])
+    index.add("Samara")
+    assert index.substring("mar") == ["marcella", "Marco", "omar", "Samara"]
+    assert index.substring("ar", k=2) == ["marcella", "Marco"]
+    assert index.prefix("sa") == ["Samara"]
+
+def test_username_index_keeps_names_differing_in_case_and_syncs_new_users(client):
+    from core.extensions import db
+    from core.username_index import UsernameIndex, sync_username_index
+    from models import User
+
+    index = UsernameIndex(substring=True)
+    index.build(["Alice", "alice", "bob"])
+    assert index.prefix("ali") == ["Alice", "alice"]
+    assert index.substring("lic") == ["Alice", "alice"]
+
+    # a user registered by another worker reaches this worker's index on the next sync
+    with client.application.app_context():
+        index = UsernameIndex()
+        sync_username_index(index)
+        db.session.add(User(username="Zed", email="zed@example.com", password_hash="x"))
+        db.session.commit()
+        assert index.prefix("ze") == []
+        assert sync_username_index(index) == 1
+        assert index.prefix("ze") == ["Zed"]
@@ -42,3 +42,138 @@ def test_search_returns_media_field(client):
     assert "media" in data["posts"][0]
     assert "https://example.com/cat.jpg" in data["posts"][0]["media"]
 
+
+
+def test_tag_pagination_and_counter(client):
+    client.post("/register", json={"username": "tagpager", "password": "p", "email": "tagpager@example.com"})
+    token = client.post("/login", json={"username": "tagpager", "password": "p"}).get_json()["access_token"]
+    pids = []
+    for i in range(5):
+        pid = f"tagpage_{i}"
+        body = f"Post {i} on #Paging" + (" and again #paging" if i == 0 else "")
+        rv = client.post(f"/create_post/{pid}", headers={"Authorization": f"Bearer {token}"}, json={"body": body})
+        assert rv.status_code == 200
+        pids.append(pid)
+
+    with client.application.app_context():
+        from core.extensions import db
+        from models import TagStats
+        assert db.session.get(TagStats, "paging").post_count == 5
+
+    seen, cursor = [], None
+    while True:
+        url = "/tags/paging?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(url).get_json()
+        assert data["count"] == 5
+        assert len(data["posts"]) <= 2
+        seen.extend(p["id"] for p in data["posts"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(pids)
+    assert len(seen) == 5
+
+    assert client.get("/tags/paging?cursor=garbage").status_code == 400
+    assert client.get("/tags/nonexistent").status_code == 404
+
+
+def test_popular_tags_from_stats_and_rebuild(client):
+    client.post("/register", json={"username": "poptag", "password": "p", "email": "poptag@example.com"})
+    token = client.post("/login", json={"username": "poptag", "password": "p"}).get_json()["access_token"]
+    bodies = ["#alpha #beta", "#alpha #gamma", "#alpha #beta", "#delta"]
+    for i, body in enumerate(bodies):
+        client.post(f"/create_post/pop_{i}", headers={"Authorization": f"Bearer {token}"}, json={"body": body})
+
+    tags = client.get("/tags?limit=3").get_json()
+    assert tags == [{"name": "alpha", "count": 3}, {"name": "beta", "count": 2}, {"name": "delta", "count": 1}]
+
+    with client.application.app_context():
+        from core.extensions import db
+        from core.tags import rebuild_tag_stats
+        from models import TagStats
+        db.session.query(TagStats).delete()
+        db.session.add(TagStats(tag_name="gamma", post_count=99))
+        db.session.commit()
+        assert rebuild_tag_stats() == 4
+
+    tags = client.get("/tags").get_json()
+    assert tags[0] == {"name": "alpha", "count": 3}
+    assert {"name": "gamma", "count": 1} in tags
+
+
+def test_trending_tags_endpoint_and_checkpoint(client):
+    client.post("/register", json={"username": "trendy", "password": "p", "email": "trendy@example.com"})
+    token = client.post("/login", json={"username": "trendy", "password": "p"}).get_json()["access_token"]
+    for i, body in enumerate(["#hot #cold", "#hot", "#hot #warm"]):
+        client.post(f"/create_post/trend_{i}", headers={"Authorization": f"Bearer {token}"}, json={"body": body})
+
+    tags = client.get("/tags/trending?window=1h").get_json()
+    assert [t["name"] for t in tags][0] == "hot"
+    assert abs(tags[0]["score"] - 3) < 0.01
+    assert client.get("/tags/trending?window=2y").status_code == 400
+
+    with client.application.app_context():
+        from core.trending import trending
+        from models import TagTrend
+        trending.checkpoint()
+        assert TagTrend.query.filter_by(period="24h").count() == 3
+        # a fresh worker picks the scores up from tag_trends
+        trending.init_app(client.application)
+
+    tags = client.get("/tags/trending?window=7d&limit=1").get_json()
+    assert len(tags) == 1 and tags[0]["name"] == "hot"
+
+
+def test_trending_decay_and_capacity():
+    from core.trending import TrendingTags
+    trends = TrendingTags(capacity=2)
+    trends.record(["old"], now=0)
+    trends.record(["old"], now=0)
+    trends.record(["new"], now=3 * 3600)
+    trends.record(["newer"], now=3 * 3600 + 1)
+
+    top = trends.top("1h", now=3 * 3600 + 1)
+    assert [name for name, _ in top] == ["newer", "new"]
+    # in the 7d window the two old uses still outweigh a recent one
+    assert trends.top("7d", k=1, now=3 * 3600 + 1)[0][0] == "old"
+
+
+def test_create_post_tag_statements_do_not_grow_with_tags(client):
+    from sqlalchemy import event
+    from core.extensions import db
+    client.post("/register", json={"username": "bulktag", "password": "p", "email": "bulktag@example.com"})
+    token = client.post("/login", json={"username": "bulktag", "password": "p"}).get_json()["access_token"]
+    with client.application.app_context():
+        engine = db.engine
+    # resolve the token once, so that both posts find it in the auth cache
+    client.get("/profile", headers={"Authorization": f"Bearer {token}"})
+
+    def count_create_statements(pid, body):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            rv = client.post(f"/create_post/{pid}", headers={"Authorization": f"Bearer {token}"}, json={"body": body})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert rv.status_code == 200
+        return len(statements)
+
+    few = count_create_statements("bulk_1", "#t0 #t1")
+    many = count_create_statements("bulk_2", " ".join(f"#t{i}" for i in range(25)))
+    assert many == few
+    assert client.get("/tags/t1").get_json()["count"] == 2
+    assert client.get("/tags/t24").get_json()["count"] == 1
+
+
+def test_insert_ignore_skips_existing_rows(client):
+    with client.application.app_context():
+        from core.extensions import db
+        from core.utils_sql import insert_ignore
+        from models import Tag
+        db.session.add(Tag(name="taken"))
+        db.session.commit()
+        # e.g. another request created "taken" after we looked it up
+        assert insert_ignore(Tag, [{"name": "taken"}, {"name": "fresh"}], returning=("name",)) == [("fresh",)]
+        db.session.commit()
+        assert {t.name for t in Tag.query.filter(Tag.name.in_(["taken", "fresh"]))} == {"taken", "fresh"}
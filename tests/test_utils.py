@@ -3,10 +3,11 @@ import uuid
 from datetime import datetime
 from app import create_app
 from core.extensions import db
-from core.utils import award_badge, award_marathoner, evaluate_badges, handle_duel_timeout
+from core.utils import award_badge, handle_duel_timeout
+from core.badges import evaluate_user_badges
 from core.utils_flag import evaluate_flags_and_maybe_switch
 from sqlalchemy import text
-from models import User, Post, Comment, Vote, Badge
+from models import User, Post, Comment, Vote, Badge, UserStats
 
 
 def test_award_badge_skips_for_invalid_user():
@@ -25,23 +26,20 @@ def test_award_badge_skips_if_already_awarded(client):
         award_badge("z", "Repeat Badge")
         assert Badge.query.filter_by(user="z", name="Repeat Badge").count() == 1
 
-def test_award_marathoner_only_top_level(client):
+def test_great_debater_needs_100_wins(client):
     client.post("/register", json={"username": "m", "password": "p", "email": "m@example.com"})
     with client.application.app_context():
-        for i in range(100):
+        for i in range(99):
             db.session.add(Post(id=f"marathon_{i}", author="m", body="b", winner="m"))
         db.session.commit()
+        assert "The Great Debater" not in evaluate_user_badges("m")
 
-        award_marathoner("m")
-
-        raw = db.session.execute(text("SELECT * FROM badges")).fetchall()
-        print("🎯 RAW BADGES:", raw)
-
-        badges = Badge.query.all()
-        names = [b.name for b in badges if b.user == "m"]
-        print("🧪 BADGE NAMES:", names)
-
-        assert names == ["The Great Debater"]
+        db.session.add(Post(id="marathon_99", author="m", body="b", winner="m"))
+        db.session.commit()
+        db.session.query(UserStats).filter_by(username="m").delete()   # recomputed from the posts
+        assert "The Great Debater" in evaluate_user_badges("m")
+        db.session.commit()
+        assert Badge.query.filter_by(user="m", name="The Great Debater").count() == 1
 
 def test_handle_duel_timeout_sets_postponed(client):
     client.post("/register", json={"username": "x1", "password": "p", "email": "x1@example.com"})
@@ -67,7 +65,7 @@ def test_handle_duel_timeout_switches_winner(client):
         assert p.winner == "alt"
         assert p.postponed is False
 
-def test_evaluate_badges_all_three(client):
+def test_evaluate_user_badges_all_three(client):
     # Insightful, Serial Voter, Consistent Debater
     client.post("/register", json={"username": "b1", "password": "p", "email": "b1@example.com"})
     t = client.post("/login", json={"username": "b1", "password": "p"}).get_json()["access_token"]
@@ -81,7 +79,7 @@ def test_evaluate_badges_all_three(client):
             for j in range(20):
                 db.session.add(Vote(post_id=pid, voter=f"voter{j}", candidate="b1"))
         db.session.commit()
-        evaluate_badges("b1")
+        evaluate_user_badges("b1")
         badges = [b.name for b in Badge.query.filter_by(user="b1")]
         assert "Insightful" in badges
         assert "Serial Voter" in badges
@@ -103,3 +101,482 @@ def test_extract_media_urls():
     assert "https://cdn.site.com/animazione.gif" in media
     assert "https://example.com" not in media
     assert len(media) == 3
+
+def test_reconcile_post_counters_fixes_drift(client):
+    from core.counters import reconcile_post_counters
+    from models import Reaction
+    client.post("/register", json={"username": "rc", "password": "p", "email": "rc@example.com"})
+    with client.application.app_context():
+        db.session.add(Post(id="rc_post", author="rc", body="b"))
+        db.session.add(Post(id="rc_clean", author="rc", body="b"))
+        db.session.add_all([Reaction(post_id="rc_post", user=f"l{i}", kind="like") for i in range(3)])
+        db.session.add(Reaction(post_id="rc_post", user="f0", kind="flag"))
+        db.session.add(Vote(post_id="rc_post", voter="v0", candidate="rc"))
+        db.session.commit()
+
+        assert reconcile_post_counters() == 1
+        db.session.expire_all()
+        post = db.session.get(Post, "rc_post")
+        assert (post.like_count, post.flag_count, post.vote_count) == (3, 1, 1)
+        assert reconcile_post_counters() == 0
+
+
+def test_post_timers_are_keyed_per_post_and_swept(client):
+    from datetime import timedelta
+    from core.jobs import schedule_post_job, sweep_timers
+    from models import PostTimer
+    pid = uuid.uuid4().hex
+    with client.application.app_context():
+        db.session.add(User(username="tm_a", email="tm_a@example.com", password_hash="x"))
+        db.session.add(Post(id=pid, author="tm_a", body="q", started=False, postponed=False, second="alt"))
+        first = datetime.now() + timedelta(hours=1)
+        schedule_post_job(handle_duel_timeout, pid, first)
+        schedule_post_job(handle_duel_timeout, pid, first + timedelta(hours=5))
+        db.session.commit()
+        timers = PostTimer.query.filter_by(post_id=pid).all()
+        assert len(timers) == 1
+        assert timers[0].next_action_at == first + timedelta(hours=5)
+
+        assert sweep_timers(now=first) == 0
+        assert sweep_timers(now=first + timedelta(hours=5)) == 1
+        assert db.session.get(Post, pid).postponed is True
+        # the timeout rescheduled itself by moving its own row
+        timer = PostTimer.query.filter_by(post_id=pid).one()
+        assert timer.next_action_at > datetime.now() and timer.claimed_by is None
+
+
+def test_failed_timer_is_retried_after_lease(client, monkeypatch):
+    from datetime import timedelta
+    from config import TIMER_LEASE_SECONDS
+    from core import jobs
+    from models import PostTimer
+    calls = []
+    def flaky(post_id):
+        calls.append(post_id)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+    monkeypatch.setattr(jobs, "timer_actions", lambda: {"flaky": flaky})
+    with client.application.app_context():
+        now = datetime.now()
+        db.session.add(PostTimer(post_id="p_flaky", action="flaky", next_action_at=now))
+        db.session.commit()
+        assert jobs.sweep_timers(now=now) == 0
+        assert jobs.sweep_timers(now=now + timedelta(seconds=1)) == 0
+        assert jobs.sweep_timers(now=now + timedelta(seconds=TIMER_LEASE_SECONDS + 1)) == 1
+        assert calls == ["p_flaky", "p_flaky"]
+        assert PostTimer.query.count() == 0
+
+
+def test_catch_up_finalizes_expired_posts_without_timer(client):
+    from datetime import timedelta
+    from core.jobs import catch_up_expired_posts, sweep_timers
+    pid = uuid.uuid4().hex
+    with client.application.app_context():
+        for name in ("cu_a", "cu_b", "cu_v"):
+            db.session.add(User(username=name, email=f"{name}@example.com", password_hash="x"))
+        db.session.add(Post(id=pid, author="cu_a", body="q", voting_deadline=datetime.now() - timedelta(hours=1)))
+        db.session.add(Comment(post_id=pid, commenter="cu_b", text="t"))
+        db.session.add(Vote(post_id=pid, voter="cu_v", candidate="cu_b"))
+        db.session.commit()
+
+    with client.application.app_context():
+        catch_up_expired_posts()
+        catch_up_expired_posts()
+        assert sweep_timers() == 1
+        post = db.session.get(Post, pid)
+        assert post.started is True
+        assert post.winner == "cu_b"
+
+
+def test_scheduler_lease_has_a_single_holder(client):
+    from datetime import timedelta
+    from core.leader import LeaderElection
+    first, second = LeaderElection(lease_seconds=30), LeaderElection(lease_seconds=30)
+    now = datetime.now()
+    with client.application.app_context():
+        assert first.try_acquire(now) is True
+        assert second.try_acquire(now + timedelta(seconds=5)) is False
+        assert first.try_acquire(now + timedelta(seconds=10)) is True   # renewal
+
+        # the leader went silent: its lease runs out and the other worker takes over
+        later = now + timedelta(seconds=41)
+        assert second.try_acquire(later) is True
+        assert first.try_acquire(later) is False
+
+        second.release()
+        assert first.try_acquire(later) is True
+
+
+def test_executor_runs_jobs_in_app_context_and_records_metrics(client):
+    import time
+    from core.extensions import scheduler
+    from core.metrics import job_metrics
+    from flask import has_app_context
+    seen = []
+
+    def probe():
+        seen.append((has_app_context(), db.session.execute(text("SELECT 1")).scalar()))
+
+    def broken():
+        raise RuntimeError("boom")
+
+    job_metrics.reset()
+    scheduler.add_job(probe, id="ctx_probe", next_run_time=datetime.now())
+    scheduler.add_job(broken, id="ctx_broken", next_run_time=datetime.now())
+    deadline = time.time() + 10
+    while time.time() < deadline and len(job_metrics.snapshot()) < 2:
+        time.sleep(0.05)
+
+    assert seen == [(True, 1)]
+    stats = client.get("/metrics").get_json()["jobs"]
+    assert stats["ctx_probe"]["runs"] == 1 and stats["ctx_probe"]["failures"] == 0
+    assert stats["ctx_broken"]["failures"] == 1
+    assert stats["ctx_probe"]["lag_last_ms"] >= 0
+
+
+def test_sweeper_records_timer_lag(client):
+    from datetime import timedelta
+    from core.jobs import schedule_post_job, sweep_timers
+    from core.metrics import job_metrics
+    pid = uuid.uuid4().hex
+    job_metrics.reset()
+    with client.application.app_context():
+        db.session.add(User(username="lag_a", email="lag_a@example.com", password_hash="x"))
+        db.session.add(Post(id=pid, author="lag_a", body="q", started=True))
+        schedule_post_job(handle_duel_timeout, pid, datetime.now() - timedelta(minutes=1))
+        db.session.commit()
+        assert sweep_timers() == 1
+    stats = job_metrics.snapshot()["timer:handle_duel_timeout"]
+    assert stats["runs"] == 1 and stats["lag_last_ms"] >= 60000
+
+
+def test_failed_timer_action_keeps_its_timer_and_writes_nothing(client, monkeypatch):
+    from datetime import timedelta
+    import core.jobs
+    from core.jobs import schedule_post_job, sweep_timers
+    from models import PostTimer
+    pid = uuid.uuid4().hex
+
+    def half_done(post_id):
+        db.session.get(Post, post_id).postponed = True
+        db.session.flush()
+        raise RuntimeError("boom")
+
+    with client.application.app_context():
+        db.session.add(User(username="ft_a", email="ft_a@example.com", password_hash="x"))
+        db.session.add(Post(id=pid, author="ft_a", body="q", started=False, postponed=False))
+        schedule_post_job(handle_duel_timeout, pid, datetime.now() - timedelta(minutes=1))
+        db.session.commit()
+        monkeypatch.setattr(core.jobs, "timer_actions", lambda: {"handle_duel_timeout": half_done})
+        assert sweep_timers() == 0
+        db.session.expire_all()
+        assert db.session.get(Post, pid).postponed is False
+        assert PostTimer.query.filter_by(post_id=pid).count() == 1
+
+        monkeypatch.undo()
+        assert sweep_timers(now=datetime.now() + timedelta(hours=1)) == 1
+        db.session.expire_all()
+        assert db.session.get(Post, pid).postponed is True
+        assert PostTimer.query.filter_by(post_id=pid).one().next_action_at > datetime.now()
+
+
+def test_finalize_voting_phases_in_batch(client):
+    from core.voting import finalize_voting_phases
+    from config import MIN_INITIAL_VOTES
+    with client.application.app_context():
+        for name in ("fb_a", "fb_b", "fb_c", "fb_d"):
+            db.session.add(User(username=name, email=f"{name}@example.com", password_hash="x"))
+        for pid in ("fb_tie", "fb_nocomments", "fb_single"):
+            db.session.add(Post(id=pid, author="fb_a", body="q"))
+        db.session.add_all([Comment(post_id="fb_tie", commenter="fb_b", text="t"),
+                            Comment(post_id="fb_tie", commenter="fb_c", text="t"),
+                            Comment(post_id="fb_single", commenter="fb_d", text="t")])
+        db.session.commit()
+        # fb_c and fb_b tie on 2 votes; fb_c got its first vote first
+        for voter, candidate in [("v1", "fb_c"), ("v2", "fb_b"), ("v3", "fb_b"), ("v4", "fb_c"), ("v5", "fb_d")]:
+            db.session.add(Vote(post_id="fb_tie", voter=voter, candidate=candidate))
+            db.session.commit()
+        db.session.add(Vote(post_id="fb_nocomments", voter="v1", candidate="fb_b"))
+        db.session.add(Vote(post_id="fb_single", voter="v1", candidate="fb_d"))
+        db.session.commit()
+
+        assert finalize_voting_phases(["fb_tie", "fb_nocomments", "fb_single", "missing"]) == 2
+        db.session.commit()
+
+        tie = db.session.get(Post, "fb_tie")
+        assert (tie.winner, tie.second, tie.started) == ("fb_c", "fb_b", True)
+        assert tie.initial_votes == MIN_INITIAL_VOTES
+        single = db.session.get(Post, "fb_single")
+        assert (single.winner, single.second) == ("fb_d", None)
+        assert db.session.get(Post, "fb_nocomments").started is False
+
+
+def test_chunked_update_resumes_after_interruption(client):
+    import pytest
+    from core.maintenance import ChunkedUpdate
+    from models import MaintenanceCheckpoint
+    with client.application.app_context():
+        db.session.add(User(username="mt_a", email="mt_a@example.com", password_hash="x"))
+        for i in range(25):
+            db.session.add(Post(id=f"mt_{i:02d}", author="mt_a", body="q", started=(i % 5 == 0)))
+        db.session.commit()
+
+        def job():
+            return ChunkedUpdate("test_started", Post, where=Post.started == False,
+                                 values={Post.started: True}, batch_size=4)
+
+        assert job().run(dry_run=True, report=lambda line: None) == 20
+        assert Post.query.filter_by(started=False).count() == 20
+
+        lines = []
+        def interrupt_after_two(line):
+            lines.append(line)
+            if len(lines) == 2:
+                raise KeyboardInterrupt
+        with pytest.raises(KeyboardInterrupt):
+            job().run(report=interrupt_after_two)
+        # batches are cut on the key: two batches covered mt_00..mt_07
+        assert Post.query.filter_by(started=False).count() == 14
+        assert db.session.get(MaintenanceCheckpoint, "test_started").last_key == "mt_07"
+
+        assert job().run(report=lambda line: None) == 14
+        checkpoint = db.session.get(MaintenanceCheckpoint, "test_started")
+        assert checkpoint.rows_done == 20 and checkpoint.finished_at is not None
+        assert Post.query.filter_by(started=False).count() == 0
+
+
+def test_badge_queue_coalesces_and_drains_outbox(client, monkeypatch):
+    import time
+    from core.badges import BadgeQueue, request_badge_evaluation
+    from core.metrics import job_metrics
+    from core.user_stats import ensure_user_stats, bump_user_stats
+    from models import BadgeOutbox
+
+    with client.application.app_context():
+        db.session.add_all([User(username=n, email=f"{n}@example.com", password_hash="x") for n in ("bq1", "bq2")])
+        db.session.commit()
+        ensure_user_stats(["bq1", "bq2"])
+        bump_user_stats("bq1", votes_cast=1, distinct_posts_voted=10)
+        request_badge_evaluation(["bq1", "bq2", "bq1"])
+        db.session.commit()
+        assert BadgeOutbox.query.count() == 2
+
+        job_metrics.reset()
+        queue = BadgeQueue(coalesce_seconds=0.05, poll_seconds=1)
+        queue.submit(["bq1", "bq2"])
+        queue.submit(["bq1"])
+        assert queue.pending() == 2
+        started = time.monotonic()
+        due = queue._take_due()
+        assert sorted(due) == ["bq1", "bq2"] and time.monotonic() - started >= 0.04
+        queue.process(due)
+
+        assert {b.name for b in Badge.query.filter_by(user="bq1")} == {"First Responder", "Serial Voter"}
+        assert Badge.query.filter_by(user="bq2").count() == 0
+        assert BadgeOutbox.query.count() == 0
+        assert job_metrics.snapshot()["badges"]["runs"] == 2
+
+        # re-evaluating does not award twice
+        queue.process(["bq1"])
+        assert Badge.query.filter_by(user="bq1").count() == 2
+
+        # a request arriving while bq2 is evaluated keeps its outbox row
+        import core.badges
+        evaluate = core.badges.evaluate_user_badges
+        def evaluate_then_vote(username):
+            time.sleep(0.001)
+            request_badge_evaluation([username])
+            return evaluate(username)
+        request_badge_evaluation(["bq2"])
+        db.session.commit()
+        monkeypatch.setattr(core.badges, "evaluate_user_badges", evaluate_then_vote)
+        queue.process(["bq2"])
+        assert [o.username for o in BadgeOutbox.query] == ["bq2"]
+
+
+def test_recompute_badges_is_idempotent_and_dedupes_legacy_rows(client):
+    from core.badges import recompute_badges
+    from core.migrations import MIGRATIONS, apply_migration, revert_migration
+
+    with client.application.app_context():
+        for name in ("rb_v", "rb_c", "rb_a"):
+            db.session.add(User(username=name, email=f"{name}@example.com", password_hash="x"))
+        db.session.add(Post(id="rb_p", author="rb_a", body="b", initial_votes=50))
+        db.session.add(Vote(post_id="rb_p", voter="rb_v", candidate="rb_c"))
+        db.session.commit()
+
+        assert recompute_badges(["rb_v", "rb_c", "rb_a"]) == 1
+        assert recompute_badges(["rb_v", "rb_c", "rb_a"]) == 0
+        db.session.commit()
+        assert [(b.user, b.name) for b in Badge.query] == [("rb_v", "First Responder")]
+
+        # a database from before the unique index may hold repeated badges
+        revert_migration(MIGRATIONS[1], report=lambda _: None)
+        db.session.execute(text("INSERT INTO badges (user, name) VALUES ('rb_v', 'First Responder'), ('rb_c', 'Insightful')"))
+        db.session.commit()
+        reports = []
+        apply_migration(MIGRATIONS[1], report=reports.append)
+        assert "  badges: 1 duplicate rows removed" in reports
+        assert Badge.query.count() == 2
+
+
+def test_flag_sweep_matches_per_post_rule_and_lists_at_risk(client):
+    import random
+    from core.utils_flag import load_active_duels, switch_mask, flag_sweep, at_risk_duels
+    from config import FLAG_RATIO_THRESHOLD, MIN_FLAGS_RATIO, NET_SCORE_RATIO
+    from models import Reaction, PostTimer
+
+    rnd = random.Random(7)
+    with client.application.app_context():
+        for name in ("fs_a", "fs_w", "fs_s"):
+            db.session.add(User(username=name, email=f"{name}@example.com", password_hash="x"))
+        expected = set()
+        for i in range(300):
+            post = Post(id=f"fs_{i:03}", author="fs_a", body="b", started=True, winner="fs_w",
+                        second="fs_s" if i % 10 else None, initial_votes=rnd.choice([0, 50, 120, 500]),
+                        like_count=rnd.randrange(40), flag_count=rnd.randrange(60))
+            db.session.add(post)
+            # the per-post rule of evaluate_flags_and_maybe_switch
+            iv, likes, flags = post.initial_votes, post.like_count, post.flag_count
+            total = iv + likes + flags
+            ratio = flags / total if total else 0
+            if post.second and flags >= max(int(iv * MIN_FLAGS_RATIO), 5) and (
+                ratio > FLAG_RATIO_THRESHOLD or iv + likes - flags <= iv * NET_SCORE_RATIO
+            ):
+                expected.add(post.id)
+        db.session.add(Post(id="fs_done", author="fs_a", body="b", started=True, completed=True,
+                            winner="fs_w", second="fs_s", initial_votes=0, flag_count=50))
+        db.session.add(Reaction(post_id=sorted(expected)[0], user="fs_a", kind="flag"))
+        db.session.commit()
+
+        duels = load_active_duels()
+        assert "fs_done" not in duels["ids"]
+        assert set(duels["ids"][switch_mask(duels)]) == expected
+
+        at_risk = at_risk_duels()
+        assert {d["post_id"] for d in at_risk if d["would_switch"]} == set(duels["ids"][switch_mask(duels)])
+        assert [d["flag_ratio"] for d in at_risk] == sorted((d["flag_ratio"] for d in at_risk), reverse=True)
+        for query, size in (("", 20), ("?limit=5", 5), ("?limit=1000", 100)):
+            listed = client.get(f"/moderation/at_risk{query}").get_json()["duels"]
+            assert listed == at_risk[:size]
+        for query in ("margin=2", "margin=abc", "margin=nan", "limit=abc"):
+            assert client.get(f"/moderation/at_risk?{query}").status_code == 400
+
+        switched = flag_sweep()
+        assert switched == int(switch_mask(duels).sum())
+        db.session.expire_all()
+        moved = Post.query.filter(Post.id.like("fs_%"), Post.winner == "fs_s").all()
+        assert len(moved) == switched and all(not p.started and p.flag_count == 0 for p in moved)
+        assert Reaction.query.count() == 0
+        assert PostTimer.query.filter(PostTimer.post_id.in_([p.id for p in moved])).count() == switched
+        assert not any(d["would_switch"] for d in at_risk_duels())
+        assert flag_sweep() == 0
+
+
+def test_flag_sweep_skips_duels_switched_since_it_loaded_them(client):
+    from core.utils_flag import load_active_duels, switch_mask, apply_switches
+
+    with client.application.app_context():
+        for name in ("fr_a", "fr_w", "fr_s"):
+            db.session.add(User(username=name, email=f"{name}@example.com", password_hash="x"))
+        for pid in ("fr_1", "fr_2"):
+            db.session.add(Post(id=pid, author="fr_a", body="b", started=True, winner="fr_w", second="fr_s",
+                                initial_votes=0, flag_count=10))
+        db.session.commit()
+        duels = load_active_duels(Post.id.like("fr_%"))
+        assert switch_mask(duels).all()
+
+        # /flag switches fr_1 between the sweep's load and its update
+        evaluate_flags_and_maybe_switch(db.session.get(Post, "fr_1"))
+        wins = db.session.get(UserStats, "fr_s").wins
+
+        switches = apply_switches(duels, switch_mask(duels))
+        db.session.commit()
+        assert [post_id for post_id, _, _ in switches] == ["fr_2"]
+        db.session.expire_all()
+        assert db.session.get(UserStats, "fr_s").wins == wins + 1
+        assert all(db.session.get(Post, pid).winner == "fr_s" for pid in ("fr_1", "fr_2"))
+
+
+def test_migrate_reactions_copies_legacy_tables_once(client):
+    from scripts.migrate_reactions import migra_reazioni
+    from models import Reaction
+
+    with client.application.app_context():
+        db.session.add(Post(id="mr_p", author="mr_a", body="b"))
+        db.session.execute(text("CREATE TABLE likes (id INTEGER PRIMARY KEY, post_id VARCHAR, liker VARCHAR)"))
+        db.session.execute(text("CREATE TABLE flags (id INTEGER PRIMARY KEY, post_id VARCHAR, flagger VARCHAR)"))
+        db.session.execute(text("INSERT INTO likes (post_id, liker) VALUES ('mr_p', 'l1'), ('mr_p', 'l2'), ('mr_p', 'both')"))
+        db.session.execute(text("INSERT INTO flags (post_id, flagger) VALUES ('mr_p', 'f1'), ('mr_p', 'both')"))
+        db.session.commit()
+
+        assert migra_reazioni(batch_size=2) == 4
+        assert migra_reazioni(batch_size=2, drop_legacy=True) == 0
+        assert sorted((r.user, r.kind) for r in Reaction.query) == [
+            ("both", "like"), ("f1", "flag"), ("l1", "like"), ("l2", "like")
+        ]
+        db.session.expire_all()
+        post = db.session.get(Post, "mr_p")
+        assert (post.like_count, post.flag_count) == (3, 1)
+        assert "likes" not in db.inspect(db.engine).get_table_names()
+
+
+def test_unique_keys_migration_removes_duplicates_first(client):
+    from sqlalchemy import inspect
+    from core.migrations import MIGRATIONS, apply_migration, revert_migration
+    from core.schema import remove_duplicates
+
+    with client.application.app_context():
+        revert_migration(MIGRATIONS[1], report=lambda _: None)
+        assert "uq_votes_post_voter" not in {i["name"] for i in inspect(db.engine).get_indexes("votes")}
+        db.session.add(Post(id="dd_p", author="dd_a", body="b"))
+        db.session.add_all([
+            Comment(id=1, post_id="dd_p", commenter="dd_c", text="first"),
+            Comment(id=2, post_id="dd_p", commenter="dd_c", text="again"),
+            Comment(id=3, post_id="dd_p", commenter="dd_c", text="duel", is_duel=True),
+            Comment(id=4, post_id="dd_p", commenter="dd_c", text="duel", is_duel=True),
+            Vote(post_id="dd_p", voter="dd_v", candidate="dd_c", comment_id=2),
+            Vote(post_id="dd_p", voter="dd_v", candidate="dd_c", comment_id=1),
+        ])
+        db.session.commit()
+
+        reports = []
+        apply_migration(MIGRATIONS[1], report=reports.append)
+        assert "  comments: 1 duplicate rows removed" in reports
+        assert "  votes: 1 duplicate rows removed, run python -m scripts.reconcile_counters" in reports
+        db.session.expire_all()
+        assert [c.id for c in Comment.query.order_by(Comment.id)] == [1, 3, 4]
+        assert [v.comment_id for v in Vote.query] == [1]
+        assert {"uq_comments_post_commenter"} <= {i["name"] for i in inspect(db.engine).get_indexes("comments")}
+        assert remove_duplicates(Vote, ("post_id", "voter"), "uq_votes_post_voter") == 0
+
+
+def test_hot_path_migration_is_recorded_and_rerunnable(client):
+    from sqlalchemy import inspect
+    from core.migrations import MIGRATIONS, pending_migrations, apply_migration, revert_migration, migration_indexes
+    from core.schema import create_missing_indexes
+
+    def indexes(table):
+        return {i["name"] for i in inspect(db.engine).get_indexes(table)}
+
+    quiet = lambda _: None
+    with client.application.app_context():
+        # a database made by create_all already has the indexes: recorded, not rebuilt
+        assert pending_migrations() == []
+
+        revert_migration(MIGRATIONS[0], report=quiet)
+        assert [m.version for m in pending_migrations()] == [1]
+        assert "ix_comments_post_id" in indexes("comments")
+        assert create_missing_indexes(skip=migration_indexes()) == []
+        assert "ix_votes_voter" not in indexes("votes")
+
+        apply_migration(MIGRATIONS[0], report=quiet)
+        apply_migration(MIGRATIONS[0], report=quiet)   # an interrupted run is simply repeated
+        assert pending_migrations() == []
+        assert {"ix_votes_voter", "ix_votes_candidate_post_id"} <= indexes("votes")
+        assert indexes("comments") == {"ix_comments_post_id_commenter", "uq_comments_post_commenter"}
+        assert {"ix_posts_winner", "ix_posts_second"} <= indexes("posts")
+
+        # the full-text index is built by its migration, not by the app factory
+        assert "posts_fts" in inspect(db.engine).get_table_names()
+        assert client.application.extensions["search_backend"].name == "sqlite_fts5"